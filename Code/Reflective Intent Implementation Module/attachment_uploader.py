@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+import aiofiles
+
+from file_upload_cache import FileUploadCache
+from session_context import SessionContext
+import tracing
+
+
+@dataclass
+class AttachmentUploadTiming:
+    path: str
+    bytes: int
+    start: float # epoch seconds
+    read_seconds: float # time spent reading the file from the disk
+    upload_seconds: float # time spent in the file upload cache (a lookup or a files.create call), including the client's retries
+
+
+async def upload_attachment(
+    path: str,
+    file_cache: FileUploadCache,
+) -> tuple[dict, AttachmentUploadTiming]:
+    """
+    Read a single file and upload it, returns its attachment entry for a thread message and its timing.
+    The failed uploads are retried by the OpenAI client (its max_retries, see openai_client.py), not here.
+    """
+    start = time.time()
+    start_time = time.perf_counter()
+    async with aiofiles.open(path, mode="rb") as file:
+        file_content = await file.read()
+    read_time = time.perf_counter()
+    file_name = os.path.basename(path) # get the file name from the path
+    file_id = await file_cache.upload(file_name, file_content)
+    timing = AttachmentUploadTiming(path=path, bytes=len(file_content), start=start, read_seconds=read_time - start_time,
+                                    upload_seconds=time.perf_counter() - read_time)
+    return {"file_id": file_id, "tools": [{"type": "file_search"}]}, timing
+
+
+async def upload_attachments(
+    paths: list[str],
+    file_cache: FileUploadCache,
+    max_parallel_uploads: int = 8,
+    session: SessionContext | None = None,
+    agent: str = "",
+) -> tuple[list[dict], list[AttachmentUploadTiming]]:
+    """
+    Read and upload all of the given files at the same time (at most max_parallel_uploads at once).
+    The attachments and timings are returned in the order of the given paths.
+    The timing of every file is also recorded as an "upload_file" tracing span of the given session and agent.
+    """
+    semaphore = asyncio.Semaphore(max_parallel_uploads)
+
+    async def upload_when_allowed(path: str) -> tuple[dict, AttachmentUploadTiming]:
+        async with semaphore:
+            return await upload_attachment(path, file_cache)
+
+    results = await asyncio.gather(*(upload_when_allowed(path) for path in paths))
+    attachments = [attachment for attachment, _ in results]
+    timings = [timing for _, timing in results]
+    for timing in timings:
+        logging.info("Uploaded %s (%d bytes): read %.3fs, upload %.3fs",
+                     timing.path, timing.bytes, timing.read_seconds, timing.upload_seconds)
+        tracing.record_span("upload_file", timing.start, timing.read_seconds + timing.upload_seconds, session, agent=agent,
+                            path=timing.path, bytes=timing.bytes, read_seconds=timing.read_seconds,
+                            upload_seconds=timing.upload_seconds)
+    return attachments, timings
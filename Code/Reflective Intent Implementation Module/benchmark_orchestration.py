@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from fake_assistants_server import FakeAssistantsServer, FakeLatencies, FakeScript
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def write_scenario_files(scenario: str, model: str, platform: str, diagram_type: str, run: int) -> None:
+    # the same input files phase4_run expects, relative to the working directory
+    os.makedirs(f"scenarios_initial_files/{scenario}", exist_ok=True)
+    with open(f"scenarios_initial_files/{scenario}/intent.txt", mode="w", encoding="utf8") as f:
+        f.write("Add a loopback interface with the address 1.1.1.1/32 to R1.")
+    with open(f"scenarios_initial_files/{scenario}/Total_Configs.txt", mode="w", encoding="utf8") as f:
+        f.write("hostname R1\ninterface GigabitEthernet0/0\n ip address 10.0.0.1 255.255.255.0\nend\n"
+                "hostname R2\ninterface GigabitEthernet0/0\n ip address 10.0.0.2 255.255.255.0\nend\n")
+    topology_dir = f"Vision_results/{model}/{platform}/{diagram_type}/{scenario}"
+    os.makedirs(topology_dir, exist_ok=True)
+    with open(f"{topology_dir}/Topology(Run{run}).json", mode="w", encoding="utf8") as f:
+        json.dump({"nodes": [{"label": "R1", "icon": "router"}, {"label": "R2", "icon": "router"}], "links": [["R1", "R2", "GigabitEthernet0/0", "GigabitEthernet0/0"]]}, f)
+
+
+async def run_benchmark(sessions: int, max_concurrent_sessions: int, script: FakeScript, stream_output: str, verifier_input_mode: str,
+                        llm_run_cache: bool, verifier_fanout: bool = False, race_candidates: int = 1, verifier_context_mode: str = "session",
+                        distributed_workers: int = 0, distributed_host_address: str = "localhost:50051") -> dict:
+    # imported here, after the working directory and the environment point to the fake server
+    import main
+    import tracing
+    from file_upload_cache import FileUploadCache
+    from llm_cache import LLMRunCache
+    from session_context import SessionContext
+    from session_executor import run_sessions
+    from stream_sinks import create_stream_sink
+
+    main.verifier_input_mode = verifier_input_mode
+    main.verifier_fanout = verifier_fanout
+    main.verifier_context_mode = verifier_context_mode
+    platform, diagram_type, run = "GNS3", "Normal", 1
+    scenarios = [f"Benchmark_Scenario_{index}" for index in range(sessions)]
+    for scenario in scenarios:
+        write_scenario_files(scenario, script.model, platform, diagram_type, run)
+    tracing.configure_tracing(f"Implementation_results/{script.model}/traces_run{run}.jsonl")
+    file_cache = FileUploadCache(main.client, cache_path="Implementation_results/openai_file_cache.json")
+    run_cache = LLMRunCache("Implementation_results/llm_run_cache") if llm_run_cache else None
+    # the streamed answers are not shown by default, printing them would dominate the measured time
+    stream_sink = create_stream_sink(stream_output)
+    session_times = []
+    losers_costs = [] # of the completed sessions, None when the cost of the losers of the race is unknown
+    errors = []
+    cluster = None
+    if distributed_workers > 0:
+        # the workers are processes of their own, in the same working directory and with the same environment (the fake server)
+        from distributed_runtime import LocalCluster
+        cluster = LocalCluster(distributed_host_address, distributed_workers, script.verifier_assistant_id, script.implementer_assistant_id)
+        await cluster.start()
+
+    async def run_cell(scenario: str) -> None:
+        session = SessionContext(scenario=scenario, platform=platform, diagram_type=diagram_type, model=script.model, run_number=run)
+        start_time = time.perf_counter()
+        try:
+            await main.phase4_run(scenario, platform, diagram_type, script.model, run, script.verifier_assistant_id,
+                                  script.implementer_assistant_id, session, file_cache, run_cache, stream_sink,
+                                  cluster.sessions if cluster is not None else None, candidates=race_candidates)
+        except Exception as e:
+            errors.append(str(e))
+            return
+        # the runtime only logs the exceptions of the handlers, so a session that crashed returns as well
+        final_results_dir = f"{session.scenario_dir_path()}/final_results"
+        if session.outcome is None:
+            errors.append(f"{session.session_key()} ended without an outcome, see phase4_log.log")
+        elif not os.path.isdir(final_results_dir) or not os.listdir(final_results_dir):
+            errors.append(f"{session.session_key()} ended ({session.outcome}) without any final results")
+        else:
+            session_times.append(time.perf_counter() - start_time)
+            losers_costs.append(session.losers_cost)
+
+    start_time = time.perf_counter()
+    await run_sessions(scenarios, run_cell, max_concurrent_sessions)
+    wall_time = time.perf_counter() - start_time
+    if cluster is not None:
+        await cluster.stop()
+    await file_cache.flush()
+    stream_sink.close()
+    tracing.get_tracer().close()
+    await main.client.close()
+    return {
+        "sessions": sessions,
+        "completed_sessions": len(session_times),
+        "errors": errors,
+        "wall_time": wall_time,
+        "mean_session_time": statistics.mean(session_times) if session_times else None,
+        "max_session_time": max(session_times) if session_times else None,
+        "losers_costs": losers_costs if race_candidates > 1 else None,
+        "file_cache": file_cache.stats.report(),
+        "run_cache": run_cache.stats.report() if run_cache is not None else None,
+        "trace_file": os.path.abspath(tracing.get_tracer().path),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=(
+        "Drive phase4_run end to end against the local fake Assistants API, without any network access. "
+        "With the default zero latencies the measured time is the overhead of the runtime, the agents and the file handling."))
+    parser.add_argument("--sessions", type=int, default=10, help="number of scenario sessions")
+    parser.add_argument("--concurrency", type=int, default=10, help="max_concurrent_sessions")
+    parser.add_argument("--request-latency", type=float, default=0.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.0)
+    parser.add_argument("--delta-latency", type=float, default=0.0)
+    parser.add_argument("--verifier-input-mode", choices=["full", "diff"], default="full")
+    parser.add_argument("--verifier-fanout", action="store_true", help="verify every group of updated files in a parallel verifier run")
+    parser.add_argument("--race-candidates", type=int, default=1, help="implementer candidates raced in every session, the first approved one wins")
+    parser.add_argument("--verifier-context", choices=["session", "fresh", "compact"], default="session", help="how the verifier's thread context is bounded")
+    parser.add_argument("--distributed-workers", type=int, default=0, help="run the sessions on this many local worker processes of the distributed runtime")
+    parser.add_argument("--distributed-host", default="localhost:50051", help="the address of the host of the local cluster")
+    parser.add_argument("--llm-run-cache", action="store_true", help="record the runs, and replay them when the benchmark is run again in the same --workdir")
+    parser.add_argument("--script", help="a JSON file with the FakeScript fields", default=None)
+    parser.add_argument("--workdir", help="where the inputs and results are written (a temporary directory by default)", default=None)
+    parser.add_argument("--stream-output", choices=["console", "file", "null"], default="null", help="where the streamed assistant answers go")
+    args = parser.parse_args()
+
+    script = FakeScript.from_json(args.script) if args.script else FakeScript()
+    latencies = FakeLatencies(request=args.request_latency, upload_per_mb=0.0, first_token=args.first_token_latency, delta=args.delta_latency)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="regenet_benchmark_")
+    os.makedirs(workdir, exist_ok=True)
+    sys.path.insert(0, MODULE_DIR)
+    os.chdir(workdir) # main.py logs to, and phase4_run reads and writes relative to, the working directory
+
+    with FakeAssistantsServer(script, latencies) as server:
+        os.environ["OPENAI_API_KEY"] = "fake-key"
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        result = asyncio.run(run_benchmark(args.sessions, args.concurrency, script, args.stream_output, args.verifier_input_mode, args.llm_run_cache,
+                                           args.verifier_fanout, args.race_candidates, args.verifier_context,
+                                           args.distributed_workers, args.distributed_host))
+        result["requests"] = dict(sorted(server.state.request_counts.items()))
+
+    print(f"Working directory: {workdir}")
+    print(f"Sessions: {result['completed_sessions']}/{result['sessions']} completed, concurrency {args.concurrency}")
+    print(f"Wall time: {result['wall_time']:.3f}s")
+    if result["mean_session_time"] is not None:
+        print(f"Session time: mean {result['mean_session_time']:.3f}s, max {result['max_session_time']:.3f}s")
+    if result["losers_costs"] is not None:
+        print(f"Losers cost: {result['losers_costs']}")
+    print(result["file_cache"])
+    if result["run_cache"] is not None:
+        print(result["run_cache"])
+    print("Requests:")
+    for name, count in result["requests"].items():
+        print(f"  {name}: {count}")
+    for error in result["errors"]:
+        print(f"Error: {error}")
+    print(f"Trace: {result['trace_file']} (summarize with trace_summary.py)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import hashlib
+
 from openai import OpenAI
 from openai.types.beta.assistant import Assistant
 
@@ -150,3 +152,8 @@ def implementation_assistant_creation(api_key: str, model: str) -> Assistant:
         ],
     )
     return oai_implementation_assistant
+
+
+def instructions_hash(instructions: str) -> str:
+    # identifies the instructions an assistant was created with (the instructions of the retrieved assistant), for the keys of the LLM run cache
+    return hashlib.sha256(instructions.encode("utf-8")).hexdigest()
@@ -0,0 +1,331 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+
+from autogen_core import MessageContext, RoutedAgent, TopicId, TypeSubscription, message_handler
+from autogen_ext.runtimes.grpc import GrpcWorkerAgentRuntime, GrpcWorkerAgentRuntimeHost
+from dotenv import load_dotenv
+
+from message_protocol import ImplementationTask, ImplementationResult, ImplementationReviewTask, ImplementationReviewResult, SessionError
+from session_checkpoint import encode_message, restore_session, session_from_dict, session_to_dict
+from session_context import SessionContext, sessions
+
+MODULE_PATH = os.path.abspath(__file__)
+SESSION_MESSAGE_TYPES = [ImplementationTask, ImplementationReviewTask, ImplementationReviewResult, ImplementationResult, SessionError]
+RESULTS_TOPIC_TYPE = "session_results" # only the driver subscribes to it, so the messages of the loop never leave their worker's pool
+COLLECTOR_AGENT_TYPE = "session_result_collector"
+JSON_DATA_CONTENT_TYPE = "application/json" # the content type of the JSON serializers of autogen_core
+
+
+class SessionMessageSerializer:
+    """
+    A JSON serializer of a message type of the loop, for the gRPC runtime. The messages carry only the key of their session,
+    this one sends the state of the session along, and restores it into the session of the receiving process (registering it
+    on the worker that receives the first message of the session).
+    """
+
+    def __init__(self, message_type: type) -> None:
+        self._message_type = message_type
+
+    @property
+    def data_content_type(self) -> str:
+        return JSON_DATA_CONTENT_TYPE
+
+    @property
+    def type_name(self) -> str:
+        return self._message_type.__name__
+
+    def serialize(self, message) -> bytes:
+        return json.dumps({"message": encode_message(message), "session": session_to_dict(sessions.get(message.session_key))}).encode("utf-8")
+
+    def deserialize(self, payload: bytes):
+        serialized = json.loads(payload.decode("utf-8"))
+        message = self._message_type(**serialized["message"]["fields"])
+        session = sessions.find(message.session_key)
+        if session is not None:
+            restore_session(session, serialized["session"])
+        else:
+            sessions.register(session_from_dict(serialized["session"]))
+        return message
+
+
+def session_message_serializers() -> list[SessionMessageSerializer]:
+    return [SessionMessageSerializer(message_type) for message_type in SESSION_MESSAGE_TYPES]
+
+
+def pool_topic_type(worker_index: int) -> str:
+    # the messages of the sessions of a worker, every worker hosts its own pool of implementer and verifier agents
+    return f"session_pool_{worker_index}"
+
+
+async def report_session_error(agent: RoutedAgent, message, error: Exception) -> None:
+    session_key = getattr(message, "session_key", None)
+    if session_key is not None:
+        logging.error("Session %s failed on its worker: %s", session_key, error)
+        await agent.publish_message(SessionError(error=str(error), session_key=session_key), topic_id=TopicId(RESULTS_TOPIC_TYPE, agent.id.key))
+
+
+def forget_ended_session(message, topic_id: TopicId) -> None:
+    # the result (or the error) of a session is the last message of the session on its worker
+    if topic_id.type == RESULTS_TOPIC_TYPE:
+        sessions.unregister(message.session_key)
+
+
+class SessionResultCollector(RoutedAgent):
+    """Receives the result (or the error) of every session on the driver, and completes the future the driver waits on."""
+
+    def __init__(self, pending_sessions: dict[str, asyncio.Future]) -> None:
+        super().__init__("Collects the results of the sessions of the distributed runtime")
+        self._pending_sessions = pending_sessions
+
+    @message_handler
+    async def handle_implementation_result(self, message: ImplementationResult, ctx: MessageContext) -> None:
+        future = self._pending_sessions.get(self.id.key)
+        if future is not None and not future.done():
+            future.set_result(message.session_key) # the serializer restored the final state into the session of the driver
+
+    @message_handler
+    async def handle_session_error(self, message: SessionError, ctx: MessageContext) -> None:
+        future = self._pending_sessions.get(self.id.key)
+        if future is not None and not future.done():
+            future.set_exception(Exception(message.error))
+
+
+class DistributedSessions:
+    """
+    The driver side of the distributed runtime: every session is published to the pool of one of the workers
+    (round robin), where an implementer and a verifier agent are created for it, keyed by the session.
+    run_session returns once the worker published the result of the session, with the final state restored into the given session
+    (which must be registered in the sessions registry while it runs).
+    """
+
+    def __init__(self, host_address: str, workers: int, session_timeout: float | None = None) -> None:
+        self._host_address = host_address
+        self._workers = workers
+        self._session_timeout = session_timeout
+        self._runtime: GrpcWorkerAgentRuntime | None = None
+        self._pending_sessions: dict[str, asyncio.Future] = {}
+        self._worker_indexes = itertools.cycle(range(workers))
+
+    async def start(self) -> None:
+        self._runtime = GrpcWorkerAgentRuntime(host_address=self._host_address)
+        await self._runtime.start()
+        await SessionResultCollector.register(self._runtime, COLLECTOR_AGENT_TYPE, lambda: SessionResultCollector(self._pending_sessions),
+                                              skip_class_subscriptions=True)
+        # registering an agent adds the dataclass serializers of the messages it handles, so the session serializers are added after it
+        self._runtime.add_message_serializer(session_message_serializers())
+        await self._runtime.add_subscription(TypeSubscription(topic_type=RESULTS_TOPIC_TYPE, agent_type=COLLECTOR_AGENT_TYPE))
+
+    async def run_session(self, session: SessionContext, first_message) -> None:
+        key = session.session_key()
+        future = asyncio.get_running_loop().create_future()
+        self._pending_sessions[key] = future
+        try:
+            await self._runtime.publish_message(first_message, topic_id=TopicId(pool_topic_type(next(self._worker_indexes)), key))
+            await asyncio.wait_for(future, timeout=self._session_timeout)
+        finally:
+            del self._pending_sessions[key]
+
+    async def stop(self) -> None:
+        if self._runtime is not None:
+            await self._runtime.stop()
+
+
+async def register_worker_agents(runtime: GrpcWorkerAgentRuntime, worker_index: int, verifier_assistant_id: str, implementation_assistant_id: str):
+    """Register the implementer and verifier agent types of a worker, with the configuration of main.py, and return the file cache of the agents."""
+    # main.py is imported here, so the worker uses the same client and settings as a run of main.py
+    import main
+    from create_assistants import instructions_hash
+    from event_handler import EventHandler
+    from file_upload_cache import FileUploadCache
+    from implementation_agent import ImplementationAgent
+    from llm_cache import LLMRunCache
+    from stream_sinks import create_stream_sink
+    from verifier_agent import VerifierAgent
+
+    oai_verifier_assistant, oai_implementation_assistant = await asyncio.gather(
+        main.client.beta.assistants.retrieve(verifier_assistant_id),
+        main.client.beta.assistants.retrieve(implementation_assistant_id),
+    )
+    file_cache = FileUploadCache(main.client, cache_path=main.file_cache_path)
+    run_cache = LLMRunCache(main.llm_run_cache_dir, main.llm_run_cache_max_bytes) if main.llm_run_cache_enabled else None
+    stream_sink = create_stream_sink(main.stream_output)
+    topic_type = pool_topic_type(worker_index)
+
+    class WorkerImplementationAgent(ImplementationAgent):
+        async def on_message_impl(self, message, ctx: MessageContext):
+            try:
+                return await super().on_message_impl(message, ctx)
+            except Exception as e:
+                await report_session_error(self, message, e)
+
+        async def publish_message(self, message, topic_id: TopicId, **kwargs) -> None:
+            await super().publish_message(message, topic_id, **kwargs)
+            forget_ended_session(message, topic_id)
+
+    class WorkerVerifierAgent(VerifierAgent):
+        async def on_message_impl(self, message, ctx: MessageContext):
+            try:
+                return await super().on_message_impl(message, ctx)
+            except Exception as e:
+                await report_session_error(self, message, e)
+
+        async def publish_message(self, message, topic_id: TopicId, **kwargs) -> None:
+            await super().publish_message(message, topic_id, **kwargs)
+            forget_ended_session(message, topic_id)
+
+    # the agents are created per session (the key of the topic), they take their threads from the session of the first message
+    # checkpoints are not taken on the workers, the gRPC runtime does not support saving the agents' state
+    implementation_agent_type = f"implementation_assistant_{worker_index}"
+    await WorkerImplementationAgent.register(
+        runtime,
+        implementation_agent_type,
+        lambda: WorkerImplementationAgent(
+            description="OpenAI Networking Intent Implementation Assistant Agent",
+            client=main.client,
+            assistant_id=oai_implementation_assistant.id,
+            thread_id=None,
+            assistant_event_handler_factory=lambda: EventHandler(stream_sink),
+            file_cache=file_cache,
+            max_parallel_uploads=main.max_parallel_uploads,
+            run_cache=run_cache,
+            instructions_hash=instructions_hash(oai_implementation_assistant.instructions or ""),
+            stream_sink=stream_sink,
+            budget=main.session_budget,
+            stop_on_convergence=main.stop_on_convergence,
+            topic_type=topic_type,
+            result_topic_type=RESULTS_TOPIC_TYPE,
+        ),
+        skip_class_subscriptions=True,
+    )
+    verifier_agent_type = f"verifier_assistant_{worker_index}"
+    await WorkerVerifierAgent.register(
+        runtime,
+        verifier_agent_type,
+        lambda: WorkerVerifierAgent(
+            description="OpenAI Networking Intent Implementation Verifier Assistant Agent",
+            client=main.client,
+            assistant_id=oai_verifier_assistant.id,
+            thread_id=None,
+            assistant_event_handler_factory=lambda: EventHandler(stream_sink),
+            file_cache=file_cache,
+            max_parallel_uploads=main.max_parallel_uploads,
+            pre_verification=main.pre_verification_enabled,
+            input_mode=main.verifier_input_mode,
+            fanout=main.verifier_fanout,
+            context_mode=main.verifier_context_mode,
+            compact_after=main.verifier_compact_after,
+            compact_summary_chars=main.verifier_compact_summary_chars,
+            run_cache=run_cache,
+            instructions_hash=instructions_hash(oai_verifier_assistant.instructions or ""),
+            topic_type=topic_type,
+        ),
+        skip_class_subscriptions=True,
+    )
+    await runtime.add_subscription(TypeSubscription(topic_type=topic_type, agent_type=implementation_agent_type))
+    await runtime.add_subscription(TypeSubscription(topic_type=topic_type, agent_type=verifier_agent_type))
+    return file_cache
+
+
+async def run_worker(host_address: str, worker_index: int, verifier_assistant_id: str, implementation_assistant_id: str, ready_file: str | None = None) -> None:
+    import main
+    import tracing
+    if main.tracing_enabled:
+        tracing.configure_tracing(f"Implementation_results/{main.model}/traces_run{main.run_number}_worker{worker_index}.jsonl")
+    runtime = GrpcWorkerAgentRuntime(host_address=host_address)
+    await runtime.start()
+    file_cache = await register_worker_agents(runtime, worker_index, verifier_assistant_id, implementation_assistant_id)
+    runtime.add_message_serializer(session_message_serializers()) # after the registration, which adds the dataclass serializers
+    if ready_file is not None:
+        open(ready_file, mode="w").close() # the agent types are registered, the driver may publish sessions to this worker
+    logging.warning("Worker %d is serving the sessions of %s", worker_index, pool_topic_type(worker_index))
+    await runtime.stop_when_signal()
+    await file_cache.flush()
+    tracing.get_tracer().close()
+
+
+class LocalCluster:
+    """A host and worker processes on this machine, for running the matrix on several cores (and for testing the distributed mode)."""
+
+    def __init__(self, host_address: str, workers: int, verifier_assistant_id: str, implementation_assistant_id: str,
+                 startup_timeout: float = 60, session_timeout: float | None = None) -> None:
+        self._host_address = host_address
+        self._workers = workers
+        self._verifier_assistant_id = verifier_assistant_id
+        self._implementation_assistant_id = implementation_assistant_id
+        self._startup_timeout = startup_timeout
+        self._host: GrpcWorkerAgentRuntimeHost | None = None
+        self._processes: list[subprocess.Popen] = []
+        self.sessions = DistributedSessions(host_address, workers, session_timeout)
+
+    async def start(self) -> None:
+        self._host = GrpcWorkerAgentRuntimeHost(address=self._host_address)
+        self._host.start()
+        ready_dir = tempfile.mkdtemp(prefix="regenet_workers_")
+        ready_files = [f"{ready_dir}/worker_{worker_index}" for worker_index in range(self._workers)]
+        for worker_index, ready_file in enumerate(ready_files):
+            self._processes.append(subprocess.Popen([
+                sys.executable, MODULE_PATH, "worker", "--host", self._host_address, "--index", str(worker_index),
+                "--verifier-assistant-id", self._verifier_assistant_id, "--implementation-assistant-id", self._implementation_assistant_id,
+                "--ready-file", ready_file,
+            ]))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._startup_timeout
+        while not all(os.path.isfile(ready_file) for ready_file in ready_files):
+            exited = [worker_index for worker_index, process in enumerate(self._processes) if process.poll() is not None]
+            if exited or loop.time() > deadline:
+                await self.stop()
+                raise RuntimeError(f"The workers did not start in {self._startup_timeout} seconds (exited workers: {exited})")
+            await asyncio.sleep(0.1)
+        await self.sessions.start()
+
+    async def stop(self) -> None:
+        await self.sessions.stop()
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            await asyncio.to_thread(process.wait)
+        self._processes = []
+        if self._host is not None:
+            await self._host.stop()
+            self._host = None
+
+
+async def run_host(host_address: str) -> None:
+    host = GrpcWorkerAgentRuntimeHost(address=host_address)
+    host.start()
+    logging.warning("Host is listening on %s", host_address)
+    await host.stop_when_signal()
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=(
+        "The distributed runtime of phase 4. Start a host, then the workers (on any machine that can reach the host, "
+        "from a directory with the same inputs), and run main.py with distributed_host_address and distributed_workers set."))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    host_parser = subparsers.add_parser("host")
+    host_parser.add_argument("--address", default="localhost:50051")
+    worker_parser = subparsers.add_parser("worker")
+    worker_parser.add_argument("--host", default="localhost:50051")
+    worker_parser.add_argument("--index", type=int, required=True, help="the workers are numbered from 0 to distributed_workers - 1")
+    worker_parser.add_argument("--verifier-assistant-id", default=os.getenv("VERIFIER_ASSISTANT_ID"))
+    worker_parser.add_argument("--implementation-assistant-id", default=os.getenv("IMPLEMENTATION_ASSISTANT_ID"))
+    worker_parser.add_argument("--ready-file", default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(MODULE_PATH))
+    if args.command == "host":
+        asyncio.run(run_host(args.address))
+    else:
+        asyncio.run(run_worker(args.host, args.index, args.verifier_assistant_id, args.implementation_assistant_id, args.ready_file))
+
+
+if __name__ == "__main__":
+    main()
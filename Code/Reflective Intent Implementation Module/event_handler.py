@@ -6,17 +6,43 @@ from typing_extensions import override
 import json
 import aiofiles
 import asyncio
-import global_variables
 import os
+import time
+from session_context import SessionContext
+from stream_sinks import StreamSink, ConsoleSink
 
 api_key = os.getenv("OPENAI_API_KEY")
 
 class EventHandler(AsyncAssistantEventHandler):
 
+    def __init__(self, stream_sink: StreamSink | None = None) -> None:
+        super().__init__()
+        self.first_token_time: float | None = None # epoch time of the first text delta, for tracing
+        self.events: list[dict] = [] # all of the events of the run, for the LLM run cache
+        self._stream_sink = stream_sink if stream_sink is not None else ConsoleSink()
+        self._session: SessionContext | None = None
+        self._agent = ""
+
+    def stream_to(self, session: SessionContext, agent: str) -> None:
+        # the session and agent the streamed text belongs to, set before the run is streamed
+        self._session = session
+        self._agent = agent
+
+    @override
+    async def on_event(self, event: AssistantStreamEvent) -> None:
+        self.events.append(event.to_dict(mode="json"))
 
     @override
     async def on_text_delta(self, delta: TextDelta, snapshot: Text) -> None:
-        print(delta.value, end="", flush=True)
+        if self.first_token_time is None:
+            self.first_token_time = time.time()
+        if self._session is not None and delta.value:
+            self._stream_sink.write(self._session, self._agent, delta.value)
+
+    @override
+    async def on_message_done(self, message: Message) -> None:
+        if self._session is not None:
+            self._stream_sink.end_message(self._session, self._agent)
 
     # override
     # async def on_event(self, event: AssistantStreamEvent) -> None:
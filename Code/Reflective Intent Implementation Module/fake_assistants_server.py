@@ -0,0 +1,478 @@
+import argparse
+import email.parser
+import email.policy
+import itertools
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+@dataclass
+class FakeLatencies:
+    # seconds, replayed by the server to imitate the real API
+    request: float = 0.05 # every non streaming request
+    upload_per_mb: float = 0.2 # added to a file upload per MB of content
+    first_token: float = 1.0 # from the run creation (or the tool outputs submission) to the first event of the answer
+    delta: float = 0.02 # between text deltas of a streamed message
+    delta_chars: int = 40 # characters of text in each delta
+
+
+def default_implementer_files() -> list[list[dict]]:
+    topology = {"file_name": "Updated_Topology.json", "content": json.dumps({"nodes": [{"label": "R1", "icon": "router"}, {"label": "R2", "icon": "router"}], "links": [["R1", "R2", "GigabitEthernet0/0", "GigabitEthernet0/0"]]})}
+    # the second run addresses the first review, so the session converges instead of being stopped for repeating its files
+    return [
+        [
+            {"file_name": "R1_config.txt", "content": "hostname R1\ninterface GigabitEthernet0/0\n ip address 10.0.0.1 255.255.255.0\nend\n"},
+            topology,
+        ],
+        [
+            {"file_name": "R1_config.txt", "content": "hostname R1\ninterface Loopback0\n ip address 1.1.1.1 255.255.255.255\ninterface GigabitEthernet0/0\n ip address 10.0.0.1 255.255.255.0\nend\n"},
+            {"file_name": "R2_config.txt", "content": "hostname R2\ninterface GigabitEthernet0/0\n ip address 10.0.0.2 255.255.255.0\nend\n"},
+            topology,
+        ],
+    ]
+
+
+def default_verifier_reviews() -> list[dict]:
+    return [
+        {"correctness": "partially correct", "identified_issues": "R2 is missing its configuration",
+         "recommendations": "add the configuration of R2", "verified_files": ["Updated_Topology.json"], "approval": False},
+        {"correctness": "correct", "identified_issues": "none", "recommendations": "none",
+         "verified_files": ["R1_config.txt", "R2_config.txt", "Updated_Topology.json"], "approval": True},
+    ]
+
+
+@dataclass
+class FakeScript:
+    """
+    The canned answers of the fake assistants.
+    The n-th implementer run of a thread calls create_file for every file in implementer_files[n] (the last entry is reused
+    for later runs), once a verifier review was approved the next implementer run answers with the final JSON instead.
+    The n-th verifier run of a thread answers with verifier_reviews[n] (the last review is reused for later runs).
+    """
+
+    implementer_assistant_id: str = "asst_fake_implementer"
+    verifier_assistant_id: str = "asst_fake_verifier"
+    model: str = "gpt-4.1-mini"
+    implementer_files: list[list[dict]] = field(default_factory=default_implementer_files)
+    implementer_text: str = "I have updated the configuration files according to the intent."
+    verifier_reviews: list[dict] = field(default_factory=default_verifier_reviews)
+
+    @staticmethod
+    def from_json(path: str) -> "FakeScript":
+        with open(path, mode="r", encoding="utf-8") as f:
+            return FakeScript(**json.load(f))
+
+
+_ids = itertools.count(1)
+
+
+def new_id(prefix: str) -> str:
+    return f"{prefix}_{next(_ids):08d}"
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeAssistantsState:
+    """The objects created through the fake API, shared by all of the request handler threads."""
+
+    def __init__(self, script: FakeScript, latencies: FakeLatencies) -> None:
+        self.script = script
+        self.latencies = latencies
+        self.lock = threading.Lock()
+        self.files: dict[str, dict] = {}
+        self.vector_stores: dict[str, dict] = {}
+        self.threads: dict[str, dict] = {}
+        self.messages: dict[str, list[dict]] = {} # thread id -> messages in ascending order
+        self.runs: dict[str, dict] = {} # run id -> run
+        self.pending_tool_calls: dict[str, list[str]] = {} # run id -> file names of the create_file calls
+        self.assistant_runs: dict[tuple[str, str], int] = {} # (thread id, assistant id) -> number of runs so far
+        self.request_counts: dict[str, int] = {}
+
+    def count_request(self, name: str) -> None:
+        with self.lock:
+            self.request_counts[name] = self.request_counts.get(name, 0) + 1
+
+
+class FakeAssistantsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like the real API
+    server: "FakeAssistantsHTTPServer"
+
+    def log_message(self, format, *args) -> None:
+        pass # the benchmark output should not be flooded with the access log
+
+    @property
+    def state(self) -> FakeAssistantsState:
+        return self.server.state
+
+    # -------------------------------request routing -------------------------------
+    def do_GET(self) -> None:
+        self._route("GET")
+
+    def do_POST(self) -> None:
+        self._route("POST")
+
+    def _route(self, method: str) -> None:
+        url = urlparse(self.path)
+        path = url.path.removeprefix("/v1").strip("/").split("/")
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        body = self._read_body()
+        routes = [
+            ("POST", ["files"], self._create_file),
+            ("GET", ["files", None], self._retrieve_file),
+            ("POST", ["vector_stores"], self._create_vector_store),
+            ("GET", ["assistants", None], self._retrieve_assistant),
+            ("POST", ["threads"], self._create_thread),
+            ("POST", ["threads", None, "messages"], self._create_message),
+            ("GET", ["threads", None, "messages"], self._list_messages),
+            ("POST", ["threads", None, "runs"], self._create_run),
+            ("GET", ["threads", None, "runs"], self._list_runs),
+            ("GET", ["threads", None, "runs", None], self._retrieve_run),
+            ("POST", ["threads", None, "runs", None, "submit_tool_outputs"], self._submit_tool_outputs),
+            ("POST", ["threads", None, "runs", None, "cancel"], self._cancel_run),
+        ]
+        for route_method, route_path, route_handler in routes:
+            if route_method == method and len(route_path) == len(path) and all(
+                    part is None or part == path_part for part, path_part in zip(route_path, path)):
+                self.state.count_request(f"{method} /{'/'.join(part or '{id}' for part in route_path)}")
+                ids = [path_part for part, path_part in zip(route_path, path) if part is None]
+                try:
+                    route_handler(*ids, query=query, body=body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass # the client closed the stream, i.e. the run of a cancelled session
+                return
+        self._send_error(404, f"Unknown route {method} {url.path}")
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _json_body(self, body: bytes) -> dict:
+        return json.loads(body) if body else {}
+
+    # -------------------------------responses -------------------------------
+    def _send_json(self, payload: dict, status: int = 200) -> None:
+        time.sleep(self.state.latencies.request)
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, error_message: str) -> None:
+        self._send_json({"error": {"message": error_message, "type": "invalid_request_error", "param": None, "code": None}}, status)
+
+    def _start_event_stream(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close") # the end of the stream is the end of the connection
+        self.end_headers()
+        self.close_connection = True
+
+    def _send_event(self, event: str, data: dict | str) -> None:
+        data = data if isinstance(data, str) else json.dumps(data)
+        self.wfile.write(f"event: {event}\ndata: {data}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    # -------------------------------files and vector stores -------------------------------
+    def _create_file(self, query: dict, body: bytes) -> None:
+        # the file is sent as multipart/form-data, only its name and size are kept
+        content_type = self.headers.get("Content-Type", "")
+        form = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + body)
+        file_name, file_bytes, purpose = "file", 0, "assistants"
+        for part in form.iter_parts():
+            if part.get_param("name", header="content-disposition") == "file":
+                file_name = part.get_filename() or file_name
+                file_bytes = len(part.get_payload(decode=True) or b"")
+            elif part.get_param("name", header="content-disposition") == "purpose":
+                purpose = part.get_content().strip()
+        time.sleep(self.state.latencies.upload_per_mb * file_bytes / 1000000)
+        file_object = {"id": new_id("file"), "object": "file", "bytes": file_bytes, "created_at": int(time.time()),
+                       "filename": file_name, "purpose": purpose, "status": "processed"}
+        with self.state.lock:
+            self.state.files[file_object["id"]] = file_object
+        self._send_json(file_object)
+
+    def _retrieve_file(self, file_id: str, query: dict, body: bytes) -> None:
+        if file_id not in self.state.files:
+            self._send_error(404, f"No such File object: {file_id}")
+            return
+        self._send_json(self.state.files[file_id])
+
+    def _create_vector_store(self, query: dict, body: bytes) -> None:
+        vector_store = {"id": new_id("vs"), "object": "vector_store", "created_at": int(time.time()), "name": None,
+                        "usage_bytes": 0, "status": "completed", "last_active_at": int(time.time()), "metadata": {},
+                        "file_counts": {"in_progress": 0, "completed": 0, "failed": 0, "cancelled": 0, "total": 0}}
+        with self.state.lock:
+            self.state.vector_stores[vector_store["id"]] = vector_store
+        self._send_json(vector_store)
+
+    # -------------------------------assistants, threads and messages -------------------------------
+    def _retrieve_assistant(self, assistant_id: str, query: dict, body: bytes) -> None:
+        self._send_json({"id": assistant_id, "object": "assistant", "created_at": int(time.time()), "name": assistant_id,
+                         "description": None, "model": self.state.script.model, "instructions": "", "tools": [],
+                         "metadata": {}, "tool_resources": {}, "temperature": 1.0, "top_p": 1.0, "response_format": "auto"})
+
+    def _create_thread(self, query: dict, body: bytes) -> None:
+        thread = {"id": new_id("thread"), "object": "thread", "created_at": int(time.time()), "metadata": {},
+                  "tool_resources": self._json_body(body).get("tool_resources")}
+        with self.state.lock:
+            self.state.threads[thread["id"]] = thread
+            self.state.messages[thread["id"]] = []
+        self._send_json(thread)
+
+    def _new_message(self, thread_id: str, role: str, text: str, run_id: str | None = None, assistant_id: str | None = None,
+                     attachments: list | None = None, metadata: dict | None = None) -> dict:
+        return {"id": new_id("msg"), "object": "thread.message", "created_at": int(time.time()), "thread_id": thread_id,
+                "role": role, "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+                "assistant_id": assistant_id, "run_id": run_id, "attachments": attachments or [], "metadata": metadata or {},
+                "status": "completed", "incomplete_details": None, "completed_at": int(time.time()), "incomplete_at": None}
+
+    def _create_message(self, thread_id: str, query: dict, body: bytes) -> None:
+        if thread_id not in self.state.threads:
+            self._send_error(404, f"No thread found with id '{thread_id}'.")
+            return
+        request = self._json_body(body)
+        content = request.get("content", "")
+        if isinstance(content, list): # content parts
+            content = "".join(part.get("text", "") for part in content)
+        message = self._new_message(thread_id, request.get("role", "user"), content,
+                                    attachments=request.get("attachments"), metadata=request.get("metadata"))
+        with self.state.lock:
+            self.state.messages[thread_id].append(message)
+        self._send_json(message)
+
+    def _list_messages(self, thread_id: str, query: dict, body: bytes) -> None:
+        if thread_id not in self.state.threads:
+            self._send_error(404, f"No thread found with id '{thread_id}'.")
+            return
+        with self.state.lock:
+            messages = list(self.state.messages[thread_id])
+        self._send_json(self._page(messages, query))
+
+    def _page(self, items: list[dict], query: dict) -> dict:
+        # cursor pagination of the list endpoints (order, limit, after and before)
+        if query.get("order", "desc") == "desc":
+            items = items[::-1]
+        ids = [item["id"] for item in items]
+        if "after" in query and query["after"] in ids:
+            items = items[ids.index(query["after"]) + 1:]
+        if "before" in query and query["before"] in ids:
+            items = items[:ids.index(query["before"])]
+        limit = int(query.get("limit", 20))
+        page = items[:limit]
+        return {"object": "list", "data": page, "first_id": page[0]["id"] if page else None,
+                "last_id": page[-1]["id"] if page else None, "has_more": len(items) > limit}
+
+    # -------------------------------runs -------------------------------
+    def _new_run(self, thread_id: str, assistant_id: str) -> dict:
+        return {"id": new_id("run"), "object": "thread.run", "created_at": int(time.time()), "thread_id": thread_id,
+                "assistant_id": assistant_id, "status": "queued", "required_action": None, "last_error": None,
+                "expires_at": None, "started_at": None, "cancelled_at": None, "failed_at": None, "completed_at": None,
+                "incomplete_details": None, "model": self.state.script.model, "instructions": "", "tools": [],
+                "metadata": {}, "usage": None, "temperature": 1.0, "top_p": 1.0, "max_prompt_tokens": None,
+                "max_completion_tokens": None, "truncation_strategy": {"type": "auto", "last_messages": None},
+                "response_format": "auto", "tool_choice": "auto", "parallel_tool_calls": True}
+
+    def _create_run(self, thread_id: str, query: dict, body: bytes) -> None:
+        if thread_id not in self.state.threads:
+            self._send_error(404, f"No thread found with id '{thread_id}'.")
+            return
+        request = self._json_body(body)
+        run = self._new_run(thread_id, request["assistant_id"])
+        with self.state.lock:
+            self.state.runs[run["id"]] = run
+            run_index = self.state.assistant_runs.get((thread_id, run["assistant_id"]), 0)
+            self.state.assistant_runs[(thread_id, run["assistant_id"])] = run_index + 1
+        if not request.get("stream"):
+            self._send_error(400, "The fake server only supports streamed runs.")
+            return
+        self._start_event_stream()
+        self._send_event("thread.run.created", run)
+        self._send_event("thread.run.queued", run)
+        run["status"] = "in_progress"
+        run["started_at"] = int(time.time())
+        self._send_event("thread.run.in_progress", run)
+        time.sleep(self.state.latencies.first_token)
+
+        script = self.state.script
+        if run["assistant_id"] == script.verifier_assistant_id:
+            review = script.verifier_reviews[min(run_index, len(script.verifier_reviews) - 1)]
+            self._stream_answer(run, json.dumps(review))
+        elif self._last_review_approved(thread_id):
+            self._stream_answer(run, json.dumps({"implementation_explanation": script.implementer_text,
+                                                 "updated_attachments": [file["file_name"] for file in script.implementer_files[-1]]}))
+        else:
+            files = script.implementer_files[min(run_index, len(script.implementer_files) - 1)]
+            if files:
+                self._stream_requires_action(run, files)
+            else:
+                self._stream_answer(run, script.implementer_text)
+
+    def _last_review_approved(self, thread_id: str) -> bool:
+        # the implementer receives the verifier's review as "key:value" lines in its last user message
+        with self.state.lock:
+            user_messages = [message for message in self.state.messages[thread_id] if message["role"] == "user"]
+        if not user_messages:
+            return False
+        last_text = user_messages[-1]["content"][0]["text"]["value"]
+        return last_text.startswith("Verifier response:") and "approval:True" in last_text
+
+    def _stream_requires_action(self, run: dict, files: list[dict]) -> None:
+        tool_calls = [{"id": new_id("call"), "type": "function",
+                       "function": {"name": "create_file", "arguments": json.dumps(file)}} for file in files]
+        with self.state.lock:
+            self.state.pending_tool_calls[run["id"]] = [tool_call["id"] for tool_call in tool_calls]
+        run["status"] = "requires_action"
+        run["required_action"] = {"type": "submit_tool_outputs", "submit_tool_outputs": {"tool_calls": tool_calls}}
+        self._send_event("thread.run.requires_action", run)
+        self._send_event("done", "[DONE]")
+
+    def _submit_tool_outputs(self, thread_id: str, run_id: str, query: dict, body: bytes) -> None:
+        run = self.state.runs.get(run_id)
+        if run is None or run["status"] != "requires_action":
+            self._send_error(400, f"Run {run_id} is not waiting for tool outputs.")
+            return
+        request = self._json_body(body)
+        submitted = sorted(tool_output["tool_call_id"] for tool_output in request.get("tool_outputs", []))
+        if submitted != sorted(self.state.pending_tool_calls.pop(run_id, [])):
+            self._send_error(400, "The tool outputs do not match the tool calls of the run.")
+            return
+        run["status"] = "queued"
+        run["required_action"] = None
+        self._start_event_stream()
+        self._send_event("thread.run.queued", run)
+        run["status"] = "in_progress"
+        self._send_event("thread.run.in_progress", run)
+        time.sleep(self.state.latencies.first_token)
+        self._stream_answer(run, self.state.script.implementer_text)
+
+    def _stream_answer(self, run: dict, text: str) -> None:
+        latencies = self.state.latencies
+        message = self._new_message(run["thread_id"], "assistant", text, run_id=run["id"], assistant_id=run["assistant_id"])
+        message["status"] = "in_progress"
+        message["completed_at"] = None
+        message["content"] = []
+        self._send_event("thread.message.created", message)
+        self._send_event("thread.message.in_progress", message)
+        for start in range(0, len(text), latencies.delta_chars):
+            if run["status"] == "cancelled": # cancelled while it was streaming
+                self._send_event("thread.run.cancelled", run)
+                self._send_event("done", "[DONE]")
+                return
+            self._send_event("thread.message.delta", {"id": message["id"], "object": "thread.message.delta", "delta": {
+                "content": [{"index": 0, "type": "text", "text": {"value": text[start:start + latencies.delta_chars], "annotations": []}}]}})
+            time.sleep(latencies.delta)
+        message["status"] = "completed"
+        message["completed_at"] = int(time.time())
+        message["content"] = [{"type": "text", "text": {"value": text, "annotations": []}}]
+        with self.state.lock:
+            self.state.messages[run["thread_id"]].append(message)
+            thread_text = "".join(thread_message["content"][0]["text"]["value"] for thread_message in self.state.messages[run["thread_id"]])
+        self._send_event("thread.message.completed", message)
+        prompt_tokens = estimate_tokens(thread_text)
+        completion_tokens = estimate_tokens(text)
+        run["status"] = "completed"
+        run["completed_at"] = int(time.time())
+        run["usage"] = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens, "prompt_token_details": {"cached_tokens": 0}}
+        self._send_event("thread.run.completed", run)
+        self._send_event("done", "[DONE]")
+
+    def _list_runs(self, thread_id: str, query: dict, body: bytes) -> None:
+        with self.state.lock:
+            runs = [run for run in self.state.runs.values() if run["thread_id"] == thread_id]
+        self._send_json(self._page(runs, query))
+
+    def _cancel_run(self, thread_id: str, run_id: str, query: dict, body: bytes) -> None:
+        run = self.state.runs.get(run_id)
+        if run is None or run["status"] not in ("queued", "in_progress", "requires_action"):
+            self._send_error(400, f"Run {run_id} can not be cancelled.")
+            return
+        run["status"] = "cancelled"
+        run["cancelled_at"] = int(time.time())
+        run["required_action"] = None
+        with self.state.lock:
+            self.state.pending_tool_calls.pop(run_id, None)
+        self._send_json(run)
+
+    def _retrieve_run(self, thread_id: str, run_id: str, query: dict, body: bytes) -> None:
+        if run_id not in self.state.runs:
+            self._send_error(404, f"No run found with id '{run_id}'.")
+            return
+        self._send_json(self.state.runs[run_id])
+
+
+class FakeAssistantsHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], state: FakeAssistantsState) -> None:
+        super().__init__(address, FakeAssistantsHandler)
+        self.state = state
+
+
+class FakeAssistantsServer:
+    """
+    A local stand-in for the parts of the OpenAI Assistants API that the agents use (files, vector stores, threads,
+    messages and streamed runs with create_file tool calls), answering with the canned FakeScript after the FakeLatencies.
+    Point a client at it with base_url=server.base_url, e.g. to measure the orchestration overhead without the network.
+    """
+
+    def __init__(self, script: FakeScript | None = None, latencies: FakeLatencies | None = None,
+                 host: str = "127.0.0.1", port: int = 0) -> None:
+        self.state = FakeAssistantsState(script or FakeScript(), latencies or FakeLatencies())
+        self._server = FakeAssistantsHTTPServer((host, port), self.state) # port 0 picks a free port
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeAssistantsServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeAssistantsServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI Assistants API for offline runs.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", help="a JSON file with the FakeScript fields", default=None)
+    parser.add_argument("--first-token", type=float, default=FakeLatencies.first_token)
+    parser.add_argument("--request", type=float, default=FakeLatencies.request)
+    args = parser.parse_args()
+
+    script = FakeScript.from_json(args.script) if args.script else FakeScript()
+    server = FakeAssistantsServer(script, FakeLatencies(request=args.request, first_token=args.first_token), port=args.port)
+    print(f"Serving the fake Assistants API on {server.base_url}")
+    print(f"Set OPENAI_BASE_URL={server.base_url}, VERIFIER_ASSISTANT_ID={script.verifier_assistant_id} "
+          f"and IMPLEMENTATION_ASSISTANT_ID={script.implementer_assistant_id}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+from openai import AsyncClient, NotFoundError
+
+try:
+    import fcntl # the lock of the cache file, the processes of the distributed runtime share it
+except ImportError: # Windows, a single process uses the cache file
+    fcntl = None
+
+
+@dataclass
+class FileUploadCacheStats:
+    hits: int = 0 # uploads that were answered from the cache
+    misses: int = 0 # uploads that were sent to OpenAI
+    validations: int = 0 # remote checks that the cached file still exists
+    bytes_uploaded: int = 0
+    bytes_saved: int = 0 # bytes that were not uploaded thanks to the cache
+    round_trips_saved: int = 0 # files.create calls that were not made thanks to the cache
+
+    def report(self):
+        return (f"File upload cache: {self.hits} hits, {self.misses} misses, {self.validations} validations, "
+                f"{self.bytes_saved} bytes and {self.round_trips_saved} round-trips saved, {self.bytes_uploaded} bytes uploaded")
+
+
+class FileUploadCache:
+    """
+    A persistent on-disk cache of the files uploaded to OpenAI, shared by the implementation and verifier agents.
+    Files are keyed by the hash of their content (and their name, since the assistants refer to files by name),
+    so uploading a file that was already uploaded costs a local lookup instead of a files.create call.
+    Entries older than ttl_seconds are dropped, the least recently used entries are evicted above max_entries,
+    and an entry is validated against the remote file if it was not validated in the last validation_interval seconds.
+    The changes are written to the disk once per run (flush), and flush_delay seconds after the first unsaved change,
+    so a crash loses at most flush_delay seconds of uploads. The file is merged with the entries of the other processes
+    and replaced under a file lock.
+    """
+
+    def __init__(
+        self,
+        client: AsyncClient,
+        cache_path: str = ".openai_file_cache.json",
+        ttl_seconds: float = 30 * 24 * 3600,
+        max_entries: int = 2000,
+        validation_interval: float = 3600,
+        flush_delay: float = 30,
+    ) -> None:
+        self._client = client
+        self._cache_path = cache_path
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self._validation_interval = validation_interval
+        self._flush_delay = flush_delay
+        self._entries: dict[str, dict] = self._load()
+        self._in_flight: dict[str, asyncio.Future] = {} # uploads of the same file that are currently running
+        self._lock = asyncio.Lock()
+        self._dirty = False # the entries changed since they were last written
+        self._pending_flush: asyncio.Task | None = None
+        self.stats = FileUploadCacheStats()
+
+    def _load(self) -> dict[str, dict]:
+        if not os.path.isfile(self._cache_path):
+            return {}
+        try:
+            with open(self._cache_path, mode="r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.decoder.JSONDecodeError, OSError) as e:
+            logging.warning("Ignoring unreadable file upload cache %s: %s", self._cache_path, e)
+            return {}
+
+    def _mark_dirty(self) -> None:
+        self._dirty = True
+        if self._pending_flush is None:
+            self._pending_flush = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        try:
+            await asyncio.sleep(self._flush_delay)
+            self._pending_flush = None
+            await self.flush()
+        except Exception as e: # the run goes on without the cache file, the final flush tries again
+            logging.warning("Could not write the file upload cache %s: %s", self._cache_path, e)
+
+    async def flush(self) -> None:
+        """Write the changed entries to the cache file, call it once the run is over."""
+        if self._pending_flush is not None:
+            self._pending_flush.cancel()
+        self._pending_flush = None
+        async with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            try:
+                await asyncio.to_thread(self._write, {key: dict(entry) for key, entry in self._entries.items()})
+            except Exception:
+                self._dirty = True
+                raise
+
+    def _write(self, entries: dict[str, dict]) -> None:
+        # runs in a worker thread: merges the entries with those other processes wrote since the cache was loaded, and replaces the file
+        directory = os.path.dirname(self._cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self._cache_path}.lock", mode="a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                for key, entry in self._load().items():
+                    if key not in entries or entry["last_used"] > entries[key]["last_used"]:
+                        entries[key] = entry
+                entries = self._evicted(entries)
+                tmp_path = f"{self._cache_path}.{os.getpid()}.tmp"
+                with open(tmp_path, mode="w", encoding="utf-8") as f:
+                    f.write(json.dumps(entries, indent=1))
+                os.replace(tmp_path, self._cache_path) # atomic, so a crash never leaves a half written cache
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def cache_key(file_name: str, file_content: bytes) -> str:
+        return f"{hashlib.sha256(file_content).hexdigest()}/{file_name}"
+
+    def reset_stats(self) -> None:
+        self.stats = FileUploadCacheStats()
+
+    async def upload(self, file_name: str, file_content: bytes) -> str:
+        """Return the id of an OpenAI file (purpose "assistants") with the given name and content, uploading it only if needed."""
+        key = self.cache_key(file_name, file_content)
+        if key in self._in_flight:
+            # concurrent sessions that upload the same file wait for a single upload, which is a hit only if it succeeds
+            file_id = await asyncio.shield(self._in_flight[key])
+            self.stats.hits += 1
+            self.stats.bytes_saved += len(file_content)
+            self.stats.round_trips_saved += 1
+            return file_id
+        self._in_flight[key] = asyncio.ensure_future(self._get_or_upload(key, file_name, file_content))
+        self._in_flight[key].add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(self._in_flight[key])
+
+    async def _get_or_upload(self, key: str, file_name: str, file_content: bytes) -> str:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and now - entry["created_at"] > self._ttl_seconds:
+            self._entries.pop(key, None)
+            entry = None
+        if entry is not None:
+            needs_validation = now - entry["validated_at"] > self._validation_interval
+            if not needs_validation or await self._validate(entry):
+                entry["last_used"] = now
+                self.stats.hits += 1
+                self.stats.bytes_saved += len(file_content)
+                if not needs_validation: # a validation is a (small) round-trip by itself
+                    self.stats.round_trips_saved += 1
+                self._mark_dirty()
+                return entry["file_id"]
+            self._entries.pop(key, None)
+
+        oai_file = await self._client.files.create(file=(file_name, file_content), purpose="assistants")
+        self.stats.misses += 1
+        self.stats.bytes_uploaded += len(file_content)
+        self._entries[key] = {"file_id": oai_file.id, "file_name": file_name, "bytes": len(file_content),
+                              "created_at": now, "validated_at": now, "last_used": now}
+        self._entries = self._evicted(self._entries)
+        self._mark_dirty()
+        return oai_file.id
+
+    async def _validate(self, entry: dict) -> bool:
+        # make sure the remote file was not deleted (or replaced) since it was cached
+        self.stats.validations += 1
+        try:
+            remote_file = await self._client.files.retrieve(entry["file_id"])
+        except NotFoundError:
+            logging.info("Cached file %s (%s) no longer exists, uploading it again", entry["file_id"], entry["file_name"])
+            return False
+        entry["validated_at"] = time.time()
+        return remote_file.bytes == entry["bytes"] and remote_file.filename == entry["file_name"]
+
+    def _evicted(self, entries: dict[str, dict]) -> dict[str, dict]:
+        if len(entries) <= self._max_entries:
+            return entries
+        by_last_use = sorted(entries, key=lambda k: entries[k]["last_used"])
+        for key in by_last_use[:len(entries) - self._max_entries]:
+            del entries[key]
+        return entries
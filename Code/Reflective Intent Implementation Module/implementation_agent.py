@@ -1,13 +1,14 @@
 import asyncio
+import logging
 import re
 import os
-import aiofiles
 import shutil
 import uuid
+import time
 
 import json
 
-from typing import  Callable, List, AsyncIterator
+from typing import  Any, Callable, List, AsyncIterator, Mapping
 from message_protocol import(
     ImplementationTask,
     ImplementationResult,
@@ -15,11 +16,21 @@ from message_protocol import(
     ImplementationReviewResult,
     Reset,
 )
+from session_context import SessionContext, sessions
+from file_upload_cache import FileUploadCache
+from attachment_uploader import upload_attachments
+from thread_message_cursor import ThreadMessageCursor, messages_after_last_user_message
+from llm_cache import LLMRunCache, RecordedRun, hash_files, replay_events, run_cache_key
+from transcript_journal import TranscriptJournal
+from stream_sinks import StreamSink, ConsoleSink
+from tool_executor import ToolContext, ToolExecutor, ToolRegistry, default_tool_registry
+from session_budget import SessionBudget, APPROVED, IDENTICAL_FILES, REPEATED_REVIEW, files_fingerprint, repeats_previous
+from session_checkpoint import SessionCheckpoints, encode_message, decode_message
+import tracing
 from openai import AsyncAssistantEventHandler, AsyncClient
 from typing import Dict, List
 from openai.types.beta import AssistantStreamEvent
 from autogen_core import  MessageContext, RoutedAgent, TopicId, default_subscription, message_handler
-from global_variables import GlobalVariables
 
 @default_subscription
 class ImplementationAgent(RoutedAgent):
@@ -31,8 +42,19 @@ class ImplementationAgent(RoutedAgent):
         description: str,
         client: AsyncClient,
         assistant_id: str,
-        thread_id: str,
+        thread_id: str | None, # None to use the implementation thread of the session of the first message (an agent per session)
         assistant_event_handler_factory: Callable[[], AsyncAssistantEventHandler], # simply overrides on text delta functionality to print the result to the screen.
+        file_cache: FileUploadCache, # uploads every file only once across iterations and sessions
+        max_parallel_uploads: int = 8, # number of attachments that are read and uploaded at the same time
+        run_cache: LLMRunCache | None = None, # replays recorded runs instead of running the assistant, None to always run it
+        instructions_hash: str = "", # the hash of the assistant's instructions, part of the run cache keys
+        checkpoints: SessionCheckpoints | None = None, # saves the state of the session after every step, None to not checkpoint
+        budget: SessionBudget | None = None, # the limits of every session, None for no limits
+        stop_on_convergence: bool = True, # stop a session when the reviews or the created files repeat those of the previous iteration
+        tool_registry: ToolRegistry | None = None, # the function tools of the assistant, create_file by default
+        stream_sink: StreamSink | None = None, # where the streamed answers go, the screen by default
+        topic_type: str = "default", # the topic type the agent publishes the messages of the loop to
+        result_topic_type: str | None = None, # the topic type of the session results, the same as topic_type by default
     ) -> None:
         super().__init__(description)
         self._client = client
@@ -40,14 +62,34 @@ class ImplementationAgent(RoutedAgent):
         self._thread_id = thread_id
         self._assistant_event_handler_factory = assistant_event_handler_factory # the name of event handler mentioned above in line 35
         self._session_memory: Dict[str, List[ImplementationTask | ImplementationReviewTask | ImplementationReviewResult]] = {}
+        self._file_cache = file_cache
+        self._max_parallel_uploads = max_parallel_uploads
+        self._message_cursor = ThreadMessageCursor(client, thread_id) if thread_id is not None else None # fetches only the new messages of the thread after each run
+        self._run_cache = run_cache
+        self._instructions_hash = instructions_hash
+        self._run_cache_key = "" # the key of the last run on the thread, the key of every run chains the key before it
+        self._journal: TranscriptJournal | None = None # the transcript of the session, created with its directory
+        self._checkpoints = checkpoints
+        self._budget = budget
+        self._stop_on_convergence = stop_on_convergence
+        self._stream_sink = stream_sink if stream_sink is not None else ConsoleSink()
+        self._tool_executor = ToolExecutor(tool_registry if tool_registry is not None else default_tool_registry())
+        self._topic_type = topic_type
+        self._result_topic_type = result_topic_type if result_topic_type is not None else topic_type
+
+    def _bind_thread(self, session: SessionContext) -> None:
+        if self._thread_id is None:
+            self._thread_id = session.implementation_thread_id
+            self._message_cursor = ThreadMessageCursor(self._client, self._thread_id)
 
 
     @message_handler
     async def handle_Implementation_task(self, message: ImplementationTask, ctx: MessageContext) -> None:
         """Handle a message with files in it. This method adds the message to the thread and publishes a response."""
         
-        global_var = GlobalVariables() # get the global variables instance
-        global_var.start_timer() # start the timer for the implementation process
+        session = sessions.get(message.session_key) # get the state of this implementation session
+        self._bind_thread(session)
+        session.start_timer() # start the timer for the implementation process
         # Store the messages in a temporary memory for this request only.
         session_id = str(uuid.uuid4())
         self._session_memory.setdefault(session_id, []).append(message)
@@ -55,59 +97,51 @@ class ImplementationAgent(RoutedAgent):
         
 
         # -----------------------------files handling -----------------------------
-        attachments_for_implementor= []
-        
-        global_var.clear_attachments_for_verifier() # make sure the variable is empty before we start a new run and adding files to it.
-        global_var.set_iteration(1)
-        output_dir_path = global_var.current_run_dir_path()
+        session.clear_attachments_for_verifier() # make sure the variable is empty before we start a new run and adding files to it.
+        session.set_iteration(1)
+        output_dir_path = session.current_run_dir_path()
         # make sure the directory for the implementation results exists + all itterations file directory
-        os.makedirs(f"{output_dir_path}/iteration_{global_var.get_iteration()}/assistant_files", exist_ok=True)
+        os.makedirs(f"{output_dir_path}/iteration_{session.get_iteration()}/assistant_files", exist_ok=True)
         os.makedirs(f"{output_dir_path}/All_assistant_files", exist_ok=True)
-        for attachment in message.attachments:
-            async with aiofiles.open(attachment, mode="rb") as file:
-                file_content = await ctx.cancellation_token.link_future(asyncio.ensure_future(file.read())) #wait for the file to be read fully
-            file_name = os.path.basename(attachment) # get the file name from the path
-            # Upload the file as oai file (OpenAI file).
-            oai_file = await ctx.cancellation_token.link_future(
-                asyncio.ensure_future(self._client.files.create(file=(file_name, file_content), purpose="assistants"))
+        self._journal = TranscriptJournal(f"{output_dir_path}/transcript.jsonl", restart=True)
+        # Read and upload all of the files at once as oai files (OpenAI files), unless the same file was already uploaded.
+        with tracing.span("upload_attachments", session, agent="implementer", files=len(message.attachments)):
+            attachments_for_implementor, upload_timings = await ctx.cancellation_token.link_future(
+                asyncio.ensure_future(upload_attachments(message.attachments, self._file_cache, self._max_parallel_uploads, session=session, agent="implementer"))
             )# OpenAI file with the purpose of "assistants" is used to upload files for the assistant to use.
-            attachments_for_implementor.append({"file_id": oai_file.id, "tools": [{"type": "file_search"}]})
-            # Save the message to the thread.
+        # Save the message to the thread.
         prompt = f"""{message.content}
         The given intent:
         '{message.intent}'
         """
-        await ctx.cancellation_token.link_future(
-            asyncio.ensure_future(
-                self._client.beta.threads.messages.create(
-                    thread_id=self._thread_id,
-                    content=prompt,
-                    role="user",
-                    attachments = attachments_for_implementor,
-                    metadata={"sender": message.source},
+        with tracing.span("messages_create", session, agent="implementer"):
+            await ctx.cancellation_token.link_future(
+                asyncio.ensure_future(
+                    self._client.beta.threads.messages.create(
+                        thread_id=self._thread_id,
+                        content=prompt,
+                        role="user",
+                        attachments = attachments_for_implementor,
+                        metadata={"sender": message.source},
+                    )
                 )
             )
-        )
 
         #-------------------------------------------------------------------------
         # Generate a response.
-        run_stream = await self._client.beta.threads.runs.create(
-            thread_id=self._thread_id,
-            assistant_id=self._assistant_id,
-            stream=True # other option is false for polling, but we want to stream the response into the screen
-        )
-        await self.handle_run_stream(self._thread_id, run_stream)
+        with tracing.span("run", session, agent="implementer") as run_span:
+            run_span["replayed"] = await ctx.cancellation_token.link_future(
+                asyncio.ensure_future(self.run_assistant(prompt, message.attachments, session))
+            )
         
-        # Get all of the assistant's last message.
-        messages = await ctx.cancellation_token.link_future(
-            asyncio.ensure_future(self._client.beta.threads.messages.list(self._thread_id, order="asc"))
-        ) # <----------------------NOTICE! this list of messages is in ascending order and not the default descending!!!
-
-        last_user_message_index = None
-        for index, assistant_message in enumerate(messages.data):
-            if assistant_message.role == "user":
-                last_user_message_index = index
-        all_last_assistants_messages = messages.data[last_user_message_index+1:]
+        # Get all of the assistant's last message (only the messages that were added since the last fetch are downloaded).
+        with tracing.span("messages_fetch", session, agent="implementer"):
+            new_messages = await ctx.cancellation_token.link_future(
+                asyncio.ensure_future(self._message_cursor.fetch_new())
+            ) # <----------------------NOTICE! this list of messages is in ascending order and not the default descending!!!
+        with tracing.span("transcript_write", session, agent="implementer"):
+            await self._journal.append_messages(new_messages, session.get_iteration())
+        all_last_assistants_messages = messages_after_last_user_message(new_messages)
 
         # get the assistant's output
         implementation_text = ""
@@ -115,11 +149,15 @@ class ImplementationAgent(RoutedAgent):
             implementation_text += assistant_message.content[0].text.value
             implementation_text +="\n"
 
+        session.files_fingerprints.append(files_fingerprint(session.get_attachments_for_verifier()))
         # call the verifier
-        implementation_review_task = ImplementationReviewTask(session_id=session_id, intent=message.intent, implementation=implementation_text, original_attachments=message.attachments, updated_attachments=global_var.get_attachments_for_verifier())
+        implementation_review_task = ImplementationReviewTask(session_id=session_id, intent=message.intent, implementation=implementation_text, original_attachments=message.attachments, updated_attachments=session.get_attachments_for_verifier(), session_key=session.session_key())
         self._session_memory.setdefault(session_id, []).append(implementation_review_task)
 
-        await self.publish_message(implementation_review_task, topic_id=TopicId("default", self.id.key))
+        if self._checkpoints is not None:
+            await self._checkpoints.save(self.runtime, "implementation", session, implementation_review_task)
+        # the token of the first message is passed on through the whole loop, cancelling it stops the session (see race_phase4_run in main.py)
+        await self.publish_message(implementation_review_task, topic_id=TopicId(self._topic_type, self.id.key), cancellation_token=ctx.cancellation_token)
 
 
     @message_handler
@@ -133,47 +171,63 @@ class ImplementationAgent(RoutedAgent):
         )
         assert verification_request is not None
         
-        global_var = GlobalVariables() # get the global variables instance
-        global_var.clear_attachments_for_verifier() #cleaning the variable files value
-        global_var.increment_iteration() # increment the iteration number for the next conversation iteration
-        output_dir_path = global_var.current_run_dir_path()
+        session = sessions.get(message.session_key) # get the state of this implementation session
+        self._bind_thread(session)
+        if not message.approved:
+            # a session that used up its budget or stopped making progress ends here instead of starting another iteration
+            outcome = self._budget.exceeded(session) if self._budget is not None else None
+            if outcome is None and self._stop_on_convergence and repeats_previous(session.review_fingerprints):
+                outcome = REPEATED_REVIEW
+            if outcome is not None:
+                await self.stop_session(session, outcome, message.review)
+                return
+        session.clear_attachments_for_verifier() #cleaning the variable files value
+        session.increment_iteration() # increment the iteration number for the next conversation iteration
+        output_dir_path = session.current_run_dir_path()
         # make sure the directory for the implementation results for this iteration exists
-        os.makedirs(f"{output_dir_path}/iteration_{global_var.get_iteration()}/assistant_files", exist_ok=True)
+        os.makedirs(f"{output_dir_path}/iteration_{session.get_iteration()}/assistant_files", exist_ok=True)
         
+        await self._journal.append_event("review", session.get_iteration() - 1, approved=message.approved)
         # call implementation assistant with the verification result:
-        await ctx.cancellation_token.link_future(
-            asyncio.ensure_future(
-                self._client.beta.threads.messages.create(
-                    thread_id=self._thread_id,
-                    content=f"Verifier response:\n{message.review}\n\n The given intent: \n{message.intent}",
-                    role="user",
-                    metadata={"sender": "Verifier Assistant"},
+        review_prompt = f"Verifier response:\n{message.review}\n\n The given intent: \n{message.intent}"
+        with tracing.span("messages_create", session, agent="implementer"):
+            await ctx.cancellation_token.link_future(
+                asyncio.ensure_future(
+                    self._client.beta.threads.messages.create(
+                        thread_id=self._thread_id,
+                        content=review_prompt,
+                        role="user",
+                        metadata={"sender": "Verifier Assistant"},
+                    )
                 )
             )
-        )
-        run_stream = await self._client.beta.threads.runs.create(
-            thread_id=self._thread_id,
-            assistant_id=self._assistant_id,
-            stream=True
-        )
-        await self.handle_run_stream(self._thread_id, run_stream)
+        with tracing.span("run", session, agent="implementer") as run_span:
+            run_span["replayed"] = await ctx.cancellation_token.link_future(
+                asyncio.ensure_future(self.run_assistant(review_prompt, [], session))
+            )
             
         # Get the last messages from the implementation assistant
-        messages = await ctx.cancellation_token.link_future(
-            asyncio.ensure_future(self._client.beta.threads.messages.list(self._thread_id, order="asc"))
-        )# <----------------------NOTICE! this list of messages is in ascending order and not the default descending!!!
+        with tracing.span("messages_fetch", session, agent="implementer"):
+            new_messages = await ctx.cancellation_token.link_future(
+                asyncio.ensure_future(self._message_cursor.fetch_new())
+            )# <----------------------NOTICE! this list of messages is in ascending order and not the default descending!!!
+        messages = self._message_cursor.messages # all of the thread messages so far
+        run_iteration = session.get_iteration() # the journal records of this run belong to this iteration
+        with tracing.span("transcript_write", session, agent="implementer"):
+            await self._journal.append_messages(new_messages, run_iteration)
         
         # Check if the implementation was approved by the verifier:
         if message.approved:
-            global_var.end_timer() # end the timer for the implementation process
+            session.end_timer() # end the timer for the implementation process
+            session.outcome = APPROVED
             os.makedirs(f"{output_dir_path}/final_results", exist_ok=True)
             # remove the iteration folder and its sub directory, since this the itteration before was the final iteration
-            if os.path.exists(f"{output_dir_path}/iteration_{global_var.get_iteration()}/assistant_files"):
-                os.rmdir(f"{output_dir_path}/iteration_{global_var.get_iteration()}/assistant_files")
-                os.rmdir(f"{output_dir_path}/iteration_{global_var.get_iteration()}")
-            global_var.set_iteration(global_var.get_iteration() - 1) # decrement the iteration number since we are done with this iteration
+            if os.path.exists(f"{output_dir_path}/iteration_{session.get_iteration()}/assistant_files"):
+                os.rmdir(f"{output_dir_path}/iteration_{session.get_iteration()}/assistant_files")
+                os.rmdir(f"{output_dir_path}/iteration_{session.get_iteration()}")
+            session.set_iteration(session.get_iteration() - 1) # decrement the iteration number since we are done with this iteration
             
-            last_message = messages.data[-1]
+            last_message = messages[-1]
             result = last_message.content[0].text.value
             try:
                 parsed_result = json.loads(result)
@@ -188,45 +242,45 @@ class ImplementationAgent(RoutedAgent):
                         content=parsed_result["implementation_explanation"],
                         attachments=parsed_result["updated_attachments"],
                         review=message.review,
+                        session_key=session.session_key(),
                     ),
-                    topic_id=TopicId("default", self.id.key),
+                    topic_id=TopicId(self._result_topic_type, self.id.key),
                 )
-                print("Implementation Result:")
-                print("-" * 80)
-                print(f"Attachments:\n {parsed_result['updated_attachments']}")
-                print("-" * 80)
-                print(f"Implementation Explenation:\n{parsed_result['implementation_explanation']}")
-                print("-" * 80)
-                print(f"Review:\n{message.review}")
-                print("-" * 80)
+                self._stream_sink.notice(session, "\n".join([
+                    "Implementation Result:",
+                    "-" * 80,
+                    f"Attachments:\n {parsed_result['updated_attachments']}",
+                    "-" * 80,
+                    f"Implementation Explenation:\n{parsed_result['implementation_explanation']}",
+                    "-" * 80,
+                    f"Review:\n{message.review}",
+                    "-" * 80,
+                ]))
                 
                 # copy the updated files to the final results folder
-                for attachment in parsed_result["updated_attachments"]:
-                    # src = f"scenarios_results/{global_variables.scenario}/assistant_files/{attachment}"
-                    src = f"{output_dir_path}/iteration_{global_var.get_iteration()}/assistant_files/{attachment}"
-                    # dst = f"scenarios_results/{global_variables.scenario}/final_results/{attachment}"
-                    dst = f"{output_dir_path}/final_results/{attachment}"
-                    shutil.copyfile(src, dst)
+                with tracing.span("file_copy", session, agent="implementer", files=len(parsed_result["updated_attachments"])):
+                    for attachment in parsed_result["updated_attachments"]:
+                        # src = f"scenarios_results/{global_variables.scenario}/assistant_files/{attachment}"
+                        src = f"{output_dir_path}/iteration_{session.get_iteration()}/assistant_files/{attachment}"
+                        # dst = f"scenarios_results/{global_variables.scenario}/final_results/{attachment}"
+                        dst = f"{output_dir_path}/final_results/{attachment}"
+                        shutil.copyfile(src, dst)
                     
-                async with aiofiles.open(f"{output_dir_path}/Full_Conversation.txt", mode="a", encoding="utf-8") as f:
-                    for conversation_message in messages.data[:-1]:
-                        await f.write(f"{conversation_message.role}:\n {conversation_message.content[0].text.value}\n")
-                        await f.write("-" * 80)
-                        await f.write("\n")
-                    await f.write(f"assistant:\n {parsed_result['implementation_explanation']}\n")
-                    await f.write(f"Updated files:\n {parsed_result['updated_attachments']}\n")
+                # Full_Conversation.txt is rendered from the journal on demand (python transcript_journal.py <session dir> --write)
+                with tracing.span("transcript_write", session, agent="implementer"):
+                    await self._journal.append_event("final_result", run_iteration,
+                                                     implementation_explanation=parsed_result["implementation_explanation"],
+                                                     updated_attachments=parsed_result["updated_attachments"])
                     
             except KeyError:
-                print(f"Couldn't find the keys in the JSON result, the resulted JSON is:\n{parsed_result}\n\n")
+                self._stream_sink.notice(session, f"Couldn't find the keys in the JSON result, the resulted JSON is:\n{parsed_result}\n\n")
+            if self._checkpoints is not None:
+                await self._checkpoints.save(self.runtime, "final_result", session, status="completed")
                 
             
             
         else:
-            last_user_message_index = None
-            for index, assistant_message in enumerate(messages.data):
-                if assistant_message.role == "user":
-                    last_user_message_index = index
-            all_last_assistants_messages = messages.data[last_user_message_index+1:]
+            all_last_assistants_messages = messages_after_last_user_message(new_messages)
 
 
             # get the assistant's output
@@ -234,64 +288,126 @@ class ImplementationAgent(RoutedAgent):
             for assistant_message in all_last_assistants_messages:
                 implementation_text += assistant_message.content[0].text.value
                 implementation_text +="\n"
-            
-            #create output file of this iteration
-            async with aiofiles.open(f"{output_dir_path}/iteration_{(global_var.get_iteration()-1)}/Full_Conversation.txt", mode="a", encoding="utf-8") as f:
-                    for conversation_message in messages.data[:-1]:
-                        await f.write(f"{conversation_message.role}:\n {conversation_message.content[0].text.value}\n")
-                        await f.write("-" * 80)
-                        await f.write("\n")
-                        
+
+            session.files_fingerprints.append(files_fingerprint(session.get_attachments_for_verifier()))
+            if self._stop_on_convergence and repeats_previous(session.files_fingerprints):
+                await self.stop_session(session, IDENTICAL_FILES, message.review) # the verifier would only repeat its review
+                return
+
             # call the verifier
             # verification_request.original_attachments include the original files from the user
             # attachments_for_verifier include the updated files for verification
-            implementation_review_task = ImplementationReviewTask(session_id=message.session_id, intent= message.intent, implementation=implementation_text, original_attachments=verification_request.original_attachments, updated_attachments=global_var.get_attachments_for_verifier())
+            implementation_review_task = ImplementationReviewTask(session_id=message.session_id, intent= message.intent, implementation=implementation_text, original_attachments=verification_request.original_attachments, updated_attachments=session.get_attachments_for_verifier(), session_key=session.session_key())
             self._session_memory.setdefault(message.session_id, []).append(implementation_review_task)
 
-            await self.publish_message(implementation_review_task, topic_id=TopicId("default", self.id.key))
+            if self._checkpoints is not None:
+                await self._checkpoints.save(self.runtime, "implementation", session, implementation_review_task)
+            await self.publish_message(implementation_review_task, topic_id=TopicId(self._topic_type, self.id.key), cancellation_token=ctx.cancellation_token)
 
 
+    async def stop_session(self, session: SessionContext, outcome: str, review: str) -> None:
+        """End the session without an approved implementation, the outcome is recorded with the results of the session."""
+        session.end_timer()
+        session.outcome = outcome
+        logging.warning("Stopping %s after iteration %d: %s", session.session_key(), session.get_iteration(), outcome)
+        self._stream_sink.notice(session, f"Session stopped after iteration {session.get_iteration()}: {outcome}")
+        await self._journal.append_event("stopped", session.get_iteration(), outcome=outcome)
+        if self._checkpoints is not None:
+            await self._checkpoints.save(self.runtime, "stopped", session, status="completed")
+        # the result of a stopped session has no files, its outcome is in the session
+        await self.publish_message(ImplementationResult(content=f"The session was stopped: {outcome}", attachments=[], review=review, session_key=session.session_key()),
+                                   topic_id=TopicId(self._result_topic_type, self.id.key))
 
 
-#-------------------------------------- Instead of EventHandler class: --------------------------------------
-    async def handle_run_stream(self, thread_id: str, run_stream: AsyncIterator[AssistantStreamEvent]):
-        global_var = GlobalVariables() # get the global variables instance
-        output_dir_path = global_var.current_run_dir_path()
-        async for event in run_stream:
-            ev = event.event  # e.g. 'thread.run.requires_action' or 'thread.message.completed'
-            data = event.data
-            if ev == "thread.run.requires_action":
-                # here you'd call your function/tool, then submit the outputs...
-                tool_outputs = []
-                
-                for tool in data.required_action.submit_tool_outputs.tool_calls:
-                    if tool.function.name == "create_file":
-                        args = json.loads(tool.function.arguments)
+    async def save_state(self) -> Mapping[str, Any]:
+        # the state a resumed session needs to continue on the same thread (see session_checkpoint.py)
+        return {
+            "session_memory": {session_id: [encode_message(m) for m in messages] for session_id, messages in self._session_memory.items()},
+            "last_message_id": self._message_cursor.last_message_id,
+            "run_cache_key": self._run_cache_key,
+            "journal_path": self._journal.path if self._journal is not None else None,
+        }
+
+    async def load_state(self, state: Mapping[str, Any]) -> None:
+        self._session_memory = {session_id: [decode_message(m) for m in messages] for session_id, messages in state["session_memory"].items()}
+        self._message_cursor.resume_after(state["last_message_id"])
+        self._run_cache_key = state["run_cache_key"]
+        if state["journal_path"] is not None:
+            self._journal = TranscriptJournal(state["journal_path"]) # continues the journal of the interrupted session
 
-                        new_file_path = f"{output_dir_path}/iteration_{global_var.get_iteration()}/assistant_files/{args['file_name']}"
-                        async with aiofiles.open(new_file_path, mode="w", encoding="utf-8") as f:
-                            await f.write(args['content'])
-                        # Make a copy of the new file in the all iterations directory
-                        all_files_dir_file_path = f"{output_dir_path}/All_assistant_files/{args['file_name']}"
-                        shutil.copyfile(new_file_path, all_files_dir_file_path)
-                        global_var.add_attachment_for_verifier(new_file_path)
-                        tool_outputs.append({"tool_call_id": tool.id, "output": args['file_name']})
-                
-                # send the tool output back into the run and continue streaming
-                next_stream = await self._client.beta.threads.runs.submit_tool_outputs(
-                    thread_id=thread_id,
-                    run_id=data.id,
-                    tool_outputs= tool_outputs,
-                    stream = True,
-                )
-                # recurse into the new stream
-                await self.handle_run_stream(thread_id, next_stream)
-            elif ev =="thread.message.delta":
-                for content_delta in event.data.delta.content or []:
-                    if content_delta.type == "text" and content_delta.text and content_delta.text.value:
-                        print(content_delta.text.value, end="", flush=True)
-            elif ev == "thread.run.completed":
-                # Handle the completion of the run
-                return
 
 
+
+    async def run_assistant(self, prompt: str, attachments: list[str], session: SessionContext) -> bool:
+        """
+        Run the assistant on the thread after the prompt message was added to it.
+        With a run cache, a run that was recorded for the same conversation is replayed instead (its files are created
+        and its answer is added to the thread), returns whether the run was replayed.
+        """
+        recorded_events = None
+        if self._run_cache is not None:
+            self._run_cache_key = run_cache_key(self._run_cache_key, "implementer", self._instructions_hash, session.model, prompt, hash_files(attachments))
+            recorded_run = await self._run_cache.get(self._run_cache_key)
+            if recorded_run is not None:
+                await self.handle_run_stream(self._thread_id, replay_events(recorded_run), session, replay=True)
+                # the answer is added to the thread, so the conversation is the same as after a live run
+                for assistant_message in recorded_run.assistant_messages():
+                    await self._client.beta.threads.messages.create(thread_id=self._thread_id, content=assistant_message,
+                                                                    role="assistant", metadata={"sender": "LLM run cache"})
+                return True
+            recorded_events = []
+        run_start_time = time.time()
+        run_stream = await self._client.beta.threads.runs.create(
+            thread_id=self._thread_id,
+            assistant_id=self._assistant_id,
+            stream=True # other option is false for polling, but we want to stream the response into the screen
+        )
+        await self.handle_run_stream(self._thread_id, run_stream, session, run_start_time, recorded_events)
+        if recorded_events and recorded_events[-1]["event"] == "thread.run.completed": # only completed runs are recorded
+            await self._run_cache.put(RecordedRun(key=self._run_cache_key, agent="implementer", events=recorded_events))
+        return False
+
+
+#-------------------------------------- Instead of EventHandler class: --------------------------------------
+    async def handle_run_stream(self, thread_id: str, run_stream: AsyncIterator[AssistantStreamEvent], session: SessionContext, run_start_time: float | None = None,
+                                recorded_events: list[dict] | None = None, replay: bool = False):
+        # run_start_time is the time the run was requested, used to measure the time to the first token of the run
+        # the events are appended to recorded_events (if given) for the run cache, a replayed stream is a recorded run
+        # the streams of a run are handled one after the other: the run stream, then the stream of every submit_tool_outputs
+        tool_context = ToolContext(session=session, agent="implementer")
+        while run_stream is not None:
+            next_stream = None
+            async for event in run_stream:
+                ev = event.event  # e.g. 'thread.run.requires_action' or 'thread.message.completed'
+                data = event.data
+                if recorded_events is not None:
+                    recorded_events.append(event.to_dict(mode="json"))
+                if run_start_time is not None and ev in ("thread.message.delta", "thread.run.requires_action"):
+                    tracing.record_span("time_to_first_token", run_start_time, time.time() - run_start_time, session, agent="implementer")
+                    run_start_time = None
+                if ev == "thread.run.requires_action":
+                    # all of the tool calls of the batch run at the same time, then their outputs are sent back into the run
+                    tool_calls = data.required_action.submit_tool_outputs.tool_calls
+                    with tracing.span("tool_calls", session, agent="implementer", calls=len(tool_calls)):
+                        tool_outputs = await self._tool_executor.execute(tool_calls, tool_context)
+                        # a replayed stream already holds the recorded events that followed the tool outputs
+                        if not replay:
+                            with tracing.span("submit_tool_outputs", session, agent="implementer"):
+                                next_stream = await self._client.beta.threads.runs.submit_tool_outputs(
+                                    thread_id=thread_id,
+                                    run_id=data.id,
+                                    tool_outputs= tool_outputs,
+                                    stream = True,
+                                )
+                elif ev =="thread.message.delta":
+                    for content_delta in event.data.delta.content or []:
+                        if content_delta.type == "text" and content_delta.text and content_delta.text.value:
+                            self._stream_sink.write(session, "implementer", content_delta.text.value)
+                elif ev == "thread.message.completed":
+                    self._stream_sink.end_message(session, "implementer")
+                elif ev == "thread.run.completed":
+                    # Handle the completion of the run, the completed run holds the token usage of the whole run
+                    if not replay: # a replayed run used no tokens
+                        session.usage.record_run("implementer", session.get_iteration(), data)
+                    return
+            run_stream = next_stream # the stream that continues the run after the tool outputs, None once the run ended
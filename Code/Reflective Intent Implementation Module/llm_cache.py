@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import typing
+import uuid
+from dataclasses import dataclass, field, asdict
+from typing import AsyncIterator
+
+import aiofiles
+from openai.types.beta import AssistantStreamEvent
+from pydantic import ValidationError
+
+# the model class of every assistant stream event by its "event" name, AssistantStreamEvent is an annotated union of them
+STREAM_EVENT_TYPES = {typing.get_args(event_type.model_fields["event"].annotation)[0]: event_type
+                      for event_type in typing.get_args(typing.get_args(AssistantStreamEvent)[0])}
+
+
+@dataclass
+class LLMRunCacheStats:
+    hits: int = 0
+    misses: int = 0
+    recorded: int = 0
+    evicted: int = 0
+
+    def report(self) -> str:
+        return f"LLM run cache: {self.hits} replayed runs, {self.misses} live runs, {self.recorded} recorded, {self.evicted} evicted"
+
+
+@dataclass
+class RecordedRun:
+    key: str
+    agent: str # "implementer" or "verifier"
+    events: list[dict] = field(default_factory=list) # the stream events of the run, including its requires_action events
+
+    def assistant_messages(self) -> list[str]:
+        """The texts of the messages the assistant added to the thread during the run, in order."""
+        return [event["data"]["content"][0]["text"]["value"] for event in self.events
+                if event["event"] == "thread.message.completed" and event["data"].get("content")]
+
+
+def hash_files(paths: list[str]) -> list[str]:
+    hashes = []
+    for path in paths:
+        with open(path, mode="rb") as f:
+            hashes.append(hashlib.sha256(f.read()).hexdigest())
+    return hashes
+
+
+def run_cache_key(previous_key: str, agent: str, instructions_hash: str, model: str, prompt: str, attachment_hashes: list[str]) -> str:
+    """
+    The key of a run, it chains the key of the previous run of the same thread, so a run is replayed only if the whole
+    conversation of its thread up to it (the prompts and the attached files) is the same as when it was recorded.
+    """
+    key_material = json.dumps([previous_key, agent, instructions_hash, model, prompt, attachment_hashes])
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+
+def parse_event(event: dict) -> AssistantStreamEvent:
+    return STREAM_EVENT_TYPES[event["event"]].model_validate(event)
+
+
+async def replay_events(recorded_run: RecordedRun) -> AsyncIterator[AssistantStreamEvent]:
+    for event in recorded_run.events:
+        yield parse_event(event)
+
+
+class LLMRunCache:
+    """
+    An opt-in record and replay store of assistant runs, one JSON file per run under cache_dir.
+    Once the files in the directory exceed max_bytes the least recently used runs are removed.
+    A replayed run costs no tokens and returns at once, which makes reruns of unchanged scenarios fast and deterministic.
+    """
+
+    def __init__(self, cache_dir: str = "Implementation_results/llm_run_cache", max_bytes: int = 500 * 1024 * 1024) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats = LLMRunCacheStats()
+        self._lock = asyncio.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return f"{self.cache_dir}/{key}.json"
+
+    async def get(self, key: str) -> RecordedRun | None:
+        path = self._path(key)
+        if not os.path.isfile(path):
+            self.stats.misses += 1
+            return None
+        try:
+            async with aiofiles.open(path, mode="r", encoding="utf-8") as f:
+                recorded_run = RecordedRun(**json.loads(await f.read()))
+            for event in recorded_run.events:
+                parse_event(event) # a run recorded with another version of the SDK may not parse, it is run again
+        except (OSError, json.decoder.JSONDecodeError, TypeError, KeyError, ValidationError) as e:
+            logging.warning("Could not read the recorded run %s, running it again: %s", path, e)
+            self.stats.misses += 1
+            return None
+        try:
+            os.utime(path) # the modification time orders the eviction
+        except OSError:
+            pass
+        self.stats.hits += 1
+        return recorded_run
+
+    async def put(self, recorded_run: RecordedRun) -> None:
+        path = self._path(recorded_run.key)
+        # sessions with the same conversation may record the same run at the same time, each writes its own temporary file
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            async with aiofiles.open(temp_path, mode="w", encoding="utf-8") as f:
+                await f.write(json.dumps(asdict(recorded_run)))
+            os.replace(temp_path, path) # atomic, so a half written run is never replayed
+        except OSError as e:
+            logging.warning("Could not record the run %s: %s", path, e) # the session itself is not affected
+            return
+        self.stats.recorded += 1
+        async with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".json"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError: # replaced by another session in the meantime
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            self.stats.evicted += 1
@@ -1,21 +1,40 @@
 
-from openai import OpenAI, AsyncClient
+from openai.types.beta import Assistant, Thread
 import asyncio
 import logging
-from autogen_core import DefaultTopicId, SingleThreadedAgentRuntime, AgentId
+import sys
+import httpx
+from autogen_core import CancellationToken, DefaultTopicId, SingleThreadedAgentRuntime, AgentId
 from implementation_agent import ImplementationAgent
 from verifier_agent import VerifierAgent
 from event_handler import EventHandler
-import pandas as pd
 #from function_event_handler import FunctionEventHandler
 from message_protocol import ImplementationTask
-from create_assistants import verifier_assistant_creation, implementation_assistant_creation
+from create_assistants import verifier_assistant_creation, implementation_assistant_creation, instructions_hash
 import os
-from global_variables import GlobalVariables
+import itertools
+import shutil
+from session_context import SessionContext, sessions
+from session_executor import run_sessions, run_pipeline
+from file_upload_cache import FileUploadCache
+from openai_client import create_async_client
+from llm_cache import LLMRunCache
+from results_store import ResultsStore, PHASE4_COLUMNS
+from session_budget import SessionBudget, APPROVED, CANCELLED
+from stream_sinks import StreamSink, create_stream_sink
+from session_checkpoint import SessionCheckpoints, restore_session, decode_message, session_to_dict
+import tracing
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv, set_key, find_dotenv
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Topology Understanding Module"))
+import topology_understanding
+from image_cache import ImageCache
+from provider_dispatcher import ProviderDispatcher
+if TYPE_CHECKING:
+    from distributed_runtime import DistributedSessions # imported when distributed_workers > 0, it needs autogen-ext[grpc]
 
 api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
+client = create_async_client(api_key) # a single pooled client for all of the sessions and agents
 
 # -------------------------------logging --------------------------------
 logging.basicConfig(
@@ -29,27 +48,57 @@ logging.getLogger("autogen_core").setLevel(logging.WARN)
 
 # in case you have modified the assistants instructions, set this to True:
 assistant_instructions_modified = False
-global_var = GlobalVariables()
 #@TODO: change before running experiment
 #run variable
-run_number = global_var.get_run_number() # 1
+run_number = 1 # to be modified on demand, every session of the run carries it in its SessionContext
 model = "gpt-4.1-mini" #modify as needed
-global_var.set_model(model)
 platforms = ["GNS3"]#,"Paper_Sketches","PowerPoint"]
 diagram_types = ["Normal"]#,"Messy_Layout", "No_Labels_On_Edges"]
 scenarios =  ["IP_Traffic_Export"]#["Adding_Communication_Servers", "Adding_DMZ", "Adding_DRA", "Adding_Local_PCs", "Internet_Connectivity", "Role_Based_CLI_Access", "Time_Based_Access_List", "Transparent_IOS_Firewall", "Basic_Zone_Based_Firewall", "IP_Traffic_Export"]
+max_concurrent_sessions = 10 # number of scenario sessions (phase4_run) that run at the same time
+file_cache_path = "Implementation_results/openai_file_cache.json" # maps uploaded files content to their OpenAI file ids across runs
+max_parallel_uploads = 8 # number of attachments each agent reads and uploads at the same time
+verifier_fanout = False # verify every updated file (the topology files together) in a parallel verifier run, and merge the reviews
+verifier_context_mode = "session" # "session" keeps one verifier thread per session, "fresh" starts a new thread every iteration, "compact" after verifier_compact_after iterations (see verifier_context.py)
+verifier_compact_after = 3
+verifier_compact_summary_chars = 2000 # the summary of the earlier reviews in the "compact" mode is cut to about this size
+verifier_input_mode = "full" # "full" re-attaches every file each iteration, "diff" sends the diffs of the updated files in the verifier prompt and attaches only the updated files
+llm_run_cache_enabled = False # replay recorded assistant runs of unchanged conversations instead of running them again (for reruns while tuning the code)
+llm_run_cache_dir = "Implementation_results/llm_run_cache"
+llm_run_cache_max_bytes = 500 * 1024 * 1024
+session_checkpoints_enabled = True # save the state of every session after each step, and resume interrupted sessions from their last step
+session_budget = SessionBudget(max_iterations=10, max_tokens=None, max_seconds=None) # limits of every session, None for no limit
+race_candidates = {} # scenario -> K, run K implementer sessions of the scenario at once and keep the first approved one (i.e. {"Adding_DRA": 3, "Basic_Zone_Based_Firewall": 3})
+stop_on_convergence = True # stop a session when the verifier repeats its review or the implementer repeats its files
+pre_verification_enabled = True # reject implementations with obvious structural errors locally, without a verifier run
+resume_completed_cells = True # skip the cells that already succeeded in an earlier (interrupted) run with the same run number
+max_cell_attempts = 3 # failed cells are run again, up to this number of attempts in total
+cell_retry_delay = 60 # seconds to wait before running the failed cells again (i.e. after a rate limit storm), doubled on every round
+stream_output = "console" # where the streamed answers go: "console" (rate limited), "file" (assistant_stream.txt of every session) or "null" for batch runs
+distributed_workers = 0 # 0 runs the sessions in this process, N > 0 runs them on N worker processes of the distributed runtime (see distributed_runtime.py)
+distributed_host_address = "localhost:50051"
+distributed_start_local_cluster = True # start the host and the workers on this machine, False to connect to a host whose workers were started separately
+topology_pipeline_enabled = False # understand the topology of every cell's diagram in this run, each session starts as soon as its topology JSON is ready
+vision_model = "gpt-4.1-mini" # the vision model of the topology understanding (a key of topology_understanding.MODELS)
+vision_open_router = True # prompt the vision model through OpenRouter (OPEN_ROUTER_API_KEY), False for OpenAI directly
+vision_temperature = 1.0
+vision_images_dir = "Topology_images" # {platform}/{diagram_type}/{scenario}/{scenario}_{platform}_{diagram_type}.jpg
+vision_workers = 8 # number of diagrams that are understood at the same time (the requests to every provider are bounded by provider_dispatcher.PROVIDER_LIMITS)
+vision_image_cache_dir = "Vision_results/image_cache" # the diagrams preprocessed for every vision model (see image_cache.py), None sends the original diagrams
+pipeline_queue_size = 4 # number of understood topologies that may wait for an implementation session
+tracing_enabled = True # write timing spans of every session to Implementation_results/{model}/traces_run{run_number}.jsonl (summarize with trace_summary.py)
 
 
 async def main_run():
 
     # on assistant instruction modification:
     load_dotenv()
-    model = global_var.get_model()
     if assistant_instructions_modified:
+        # the assistants creation uses the synchronous client, so it runs in a worker thread to keep the event loop free
         # oai_verifier_assistant = verifier_assistant_creation(api_key)
-        oai_verifier_assistant = verifier_assistant_creation(api_key, model)
+        oai_verifier_assistant = await asyncio.to_thread(verifier_assistant_creation, api_key, model)
         # oai_implementation_assistant = implementation_assistant_creation(api_key)
-        oai_implementation_assistant = implementation_assistant_creation(api_key,model)
+        oai_implementation_assistant = await asyncio.to_thread(implementation_assistant_creation, api_key, model)
         env_path = find_dotenv(".env_public")
         set_key(env_path, "VERIFIER_ASSISTANT_ID", oai_verifier_assistant.id)
         set_key(env_path, "IMPLEMENTATION_ASSISTANT_ID", oai_implementation_assistant.id)
@@ -65,79 +114,210 @@ async def main_run():
     output_folder = f"Implementation_results/{model}"
 
     # ---- Time evaluation file creation and reading----
-    run_number = global_var.get_run_number()
     implementation_time_calc_file_address = f"Implementation_results/{model}/Implementation_time_run{run_number}.csv"
-    if os.path.isfile(implementation_time_calc_file_address):
-        phase4_df = pd.read_csv(implementation_time_calc_file_address)
-    else:
-        phase4_df = pd.DataFrame(
-            columns=["Scenario", "Platform", "Diagram_Type", "Run", "Model", "Time", "Cost",
-                    "Reasoning_Text", "Prompt_tokens", "Completion_tokens", "Error_message"])
+    results_db_address = f"Implementation_results/{model}/results.sqlite"
     os.makedirs(output_folder, exist_ok=True)
+    new_store = not os.path.isfile(results_db_address)
+    results_store = ResultsStore(results_db_address, PHASE4_COLUMNS)
+    if new_store and os.path.isfile(implementation_time_calc_file_address):
+        results_store.import_csv(implementation_time_calc_file_address) # results of runs from before the store existed
+    file_cache = FileUploadCache(client, cache_path=file_cache_path)
+    run_cache = LLMRunCache(llm_run_cache_dir, llm_run_cache_max_bytes) if llm_run_cache_enabled else None
+    stream_sink = create_stream_sink(stream_output)
+    if tracing_enabled:
+        tracing.configure_tracing(f"Implementation_results/{model}/traces_run{run_number}.jsonl")
 
 
-    #running on platforms, diagram types and scenarios
-    for platform in platforms:
-        global_var.set_platform(platform)
-
-        for diagram_type in diagram_types:
-            global_var.set_diagram_type(diagram_type)
-
-            for scenario in scenarios:
-
-                global_var.set_scenario(scenario)
-                global_var.set_run_number(run_number)
-                # @TODO: make sure all dirs that implementer and verifier write to are updated
-                # os.makedirs(f"scenarios_results/{scenario_name}/assistant_files", exist_ok=True)
-                # os.makedirs(f"scenarios_results/{scenario_name}/final_results", exist_ok=True)
-                # os.makedirs(f"scenarios_results/{scenario_name}/assistant_files", exist_ok=True)
-                # os.makedirs(f"scenarios_results/{scenario_name}/final_results", exist_ok=True)
-                try:
-                    result = await phase4_run(scenario, platform, diagram_type, model, run_number, verifier_assistant_id, implementation_assistant_id)
-                    logging.info("Completed run for scenario: %s, platform: %s, diagram type: %s, model: %s", scenario, platform, diagram_type, model)
-                    verifier_thread_id = global_var.get_verifier_thread_id()
-                    implementation_thread_id = global_var.get_implementation_thread_id()
-                    verifier_runs = client.beta.threads.runs.list(verifier_thread_id)
-                    implementor_runs = client.beta.threads.runs.list(implementation_thread_id)
-                    
-                    full_usage = {"prompt_tokens": 0, "completion_tokens": 0}
-                    for run in verifier_runs.data + implementor_runs.data:
-                        full_usage["prompt_tokens"] += run.usage.prompt_tokens
-                        full_usage["completion_tokens"] += run.usage.completion_tokens
-                    cost = (full_usage["prompt_tokens"]/ 1000000)*0.4 + (full_usage["completion_tokens"]/ 1000000)*1.6 # cost for gpt-4.1-mini 
-                        
-                    new_row = {"Scenario":scenario, "Platform":platform, "Diagram_Type":diagram_type, "Run": run_number, "Model":model, "Time":global_var.get_elapsed_time(), "Cost":cost,
-                        "Reasoning_Text": None,"Prompt_tokens":full_usage["prompt_tokens"], "Completion_tokens":full_usage["completion_tokens"] , "Error_message":None}
-                    phase4_df.loc[len(phase4_df)] = new_row
-                    phase4_df.to_csv(implementation_time_calc_file_address, index=False)
-                except Exception as e:
-                    logging.error(e)
-                    new_row ={"Scenario":scenario, "Platform":platform, "Diagram_Type":diagram_type, "Run": run_number, "Model":model, "Time":None, "Cost":None,
-                        "Reasoning_Text": None,"Prompt_tokens":None, "Completion_tokens":None, "Error_message":str(e)}
-                    phase4_df.loc[len(phase4_df)] = new_row
-                    phase4_df.to_csv(implementation_time_calc_file_address, index=False)
-                    
-
-
-
-async def phase4_run(scenario_name: str, platform:str, diagram_type:str, model:str,run:int, verifier_assistant_id: str, implementation_assistant_id: str):
-    # -------------------------------Verifier assistant-------------------------------
-    oai_verifier_assistant = client.beta.assistants.retrieve(verifier_assistant_id)
-    # Create a vector store to be used for file search.
-    verifier_assistant_vector_store = client.vector_stores.create()
-    # Create a thread which is used as the memory for the assistant.
-    verifier_thread = client.beta.threads.create(
-        tool_resources={"file_search": {"vector_store_ids": [verifier_assistant_vector_store.id]}},)
-    global_var.set_verifier_thread_id(verifier_thread.id)
-    # -------------------------------Implementation assistant-------------------------------
-    oai_implementation_assistant = client.beta.assistants.retrieve(implementation_assistant_id)
-    #oai_implementation_assistant = implementation_assistant_creation(api_key)
+    cluster = None
+    distributed_sessions = None
+    if distributed_workers > 0:
+        from distributed_runtime import DistributedSessions, LocalCluster
+        if distributed_start_local_cluster:
+            cluster = LocalCluster(distributed_host_address, distributed_workers, verifier_assistant_id, implementation_assistant_id)
+            await cluster.start()
+            distributed_sessions = cluster.sessions
+        else:
+            distributed_sessions = DistributedSessions(distributed_host_address, distributed_workers)
+            await distributed_sessions.start()
+
+    #running on platforms, diagram types and scenarios - every cell is a separate session, several sessions run at once
+    async def run_cell(cell, topology_file: str | None = None):
+        platform, diagram_type, scenario = cell
+        session = SessionContext(scenario=scenario, platform=platform, diagram_type=diagram_type, model=model, run_number=run_number)
+        try:
+            if topology_pipeline_enabled and topology_file is None:
+                raise Exception(f"The topology understanding of scenario {scenario} on platform {platform} with diagram type {diagram_type} failed")
+            result = await phase4_run(scenario, platform, diagram_type, model, run_number, verifier_assistant_id, implementation_assistant_id, session, file_cache, run_cache, stream_sink,
+                                      distributed_sessions, candidates=race_candidates.get(scenario, 1), topology_file=topology_file)
+            logging.info("Completed run for scenario: %s, platform: %s, diagram type: %s, model: %s", scenario, platform, diagram_type, model)
+            # the usage of every run was collected by the agents from their run streams, priced by MODEL_PRICES
+            full_usage = session.usage.totals()
+            session.usage.write_report(f"{session.current_run_dir_path()}/usage.json") # per agent and per iteration breakdown
+                
+            new_row = {"Scenario":scenario, "Platform":platform, "Diagram_Type":diagram_type, "Run": run_number, "Model":model, "Time":session.get_elapsed_time(), "Cost":full_usage["cost"],
+                "Reasoning_Text": None,"Prompt_tokens":full_usage["prompt_tokens"], "Completion_tokens":full_usage["completion_tokens"], "Cached_prompt_tokens":full_usage["cached_prompt_tokens"], "Error_message":None, "Outcome":session.outcome,
+                "Candidates":session.candidates, "Winning_candidate":session.candidate, "Losers_cost":session.losers_cost, "Losers_tokens":session.losers_tokens}
+        except Exception as e:
+            logging.error(e)
+            new_row ={"Scenario":scenario, "Platform":platform, "Diagram_Type":diagram_type, "Run": run_number, "Model":model, "Time":None, "Cost":None,
+                "Reasoning_Text": None,"Prompt_tokens":None, "Completion_tokens":None, "Cached_prompt_tokens":None, "Error_message":str(e), "Outcome":"error",
+                "Candidates":None, "Winning_candidate":None, "Losers_cost":None, "Losers_tokens":None}
+        results_store.record(new_row) # a single committed row, the CSV is exported once all of the cells are done
+        tracing.get_tracer().flush() # keep the trace file up to date with the finished sessions
+
+    vision_store = None
+    if topology_pipeline_enabled:
+        vision_output_dir = f"Vision_results/{vision_model}"
+        vision_store = ResultsStore(f"{vision_output_dir}/results.sqlite", topology_understanding.PHASE1_COLUMNS)
+        vision_clients = {"openai_client": client} if not vision_open_router else \
+            {"dispatcher": ProviderDispatcher(httpx.AsyncClient(timeout=httpx.Timeout(300, connect=30)), os.getenv("OPEN_ROUTER_API_KEY"))}
+        vision_clients["image_cache"] = ImageCache(vision_image_cache_dir) if vision_image_cache_dir is not None else None
+
+        async def understand_cell(cell) -> str | None:
+            # the first stage of the pipeline: the path of the cell's topology JSON, None if the topology could not be understood
+            # (nothing is written then, the session of the cell fails and the topology is understood again when the cell is retried)
+            platform, diagram_type, scenario = cell
+            try:
+                topology_file, row = await topology_understanding.understand_topology(
+                    platform, diagram_type, scenario, run_number, vision_model, vision_images_dir, vision_output_dir,
+                    vision_temperature, vision_open_router, **vision_clients)
+            except Exception as e:
+                logging.error(e)
+                vision_store.record({"Scenario": scenario, "Platform": platform, "Diagram_Type": diagram_type, "Phase1_Temp": vision_temperature, "Run": run_number,
+                                     "Model": vision_model, "Time": None, "Cost": None, "Reasoning_Text": None, "Prompt_tokens": None, "Completion_tokens": None,
+                                     "Error_message": str(e)})
+                return None
+            if row is not None: # None if the topology was understood in an earlier run
+                vision_store.record(row)
+            return topology_file
+
+    cells = list(itertools.product(platforms, diagram_types, scenarios))
+    if resume_completed_cells:
+        completed_cells = results_store.completed_cells(model, run_number)
+        if completed_cells & set(cells):
+            logging.warning("Skipping %d cells that already completed in run %s", len(completed_cells & set(cells)), run_number)
+        cells = [cell for cell in cells if cell not in completed_cells]
+    retry_delay = cell_retry_delay
+    for attempt in range(1, max_cell_attempts + 1):
+        if topology_pipeline_enabled:
+            # the vision and the implementation stages overlap, a session starts once the topology of its cell is ready
+            await run_pipeline(cells, understand_cell, run_cell, vision_workers, max_concurrent_sessions, pipeline_queue_size)
+        else:
+            await run_sessions(cells, run_cell, max_concurrent_sessions)
+        failed_cells = results_store.failed_cells(model, run_number)
+        cells = [cell for cell in cells if cell in failed_cells]
+        if not cells or attempt == max_cell_attempts:
+            break
+        logging.warning("%d cells failed in attempt %d, running them again in %s seconds", len(cells), attempt, retry_delay)
+        await asyncio.sleep(retry_delay)
+        retry_delay *= 2
+    if cluster is not None:
+        await cluster.stop()
+    elif distributed_sessions is not None:
+        await distributed_sessions.stop()
+    results_store.export_csv(implementation_time_calc_file_address, model, run_number)
+    results_store.close()
+    if vision_store is not None:
+        # a file per run, Phase1_time.csv holds the rows of the earlier runs (and of run_matrix) that are not in the store
+        vision_store.export_csv(f"{vision_output_dir}/Phase1_time_Run{run_number}.csv", vision_model, run_number)
+        vision_store.close()
+        if vision_clients["image_cache"] is not None:
+            logging.info(vision_clients["image_cache"].stats.report())
+        if "dispatcher" in vision_clients:
+            logging.info(vision_clients["dispatcher"].stats.report())
+            await vision_clients["dispatcher"].http_client.aclose()
+    stream_sink.close()
+    await file_cache.flush()
+    logging.info(file_cache.stats.report())
+    if run_cache is not None:
+        logging.info(run_cache.stats.report())
+    tracing.get_tracer().close()
+
+
+async def create_assistant_thread(assistant_id: str) -> tuple[Assistant, Thread]:
+    oai_assistant = await client.beta.assistants.retrieve(assistant_id)
     # Create a vector store to be used for file search.
-    implementation_assistant_vector_store = client.vector_stores.create()
+    assistant_vector_store = await client.vector_stores.create()
     # Create a thread which is used as the memory for the assistant.
-    implementation_thread = client.beta.threads.create(
-        tool_resources={"file_search": {"vector_store_ids": [implementation_assistant_vector_store.id]}},)
-    global_var.set_implementation_thread_id(implementation_thread.id)
+    thread = await client.beta.threads.create(
+        tool_resources={"file_search": {"vector_store_ids": [assistant_vector_store.id]}},)
+    return oai_assistant, thread
+
+
+async def cancel_active_runs(thread_id: str) -> None:
+    # a run that was interrupted with the process may still be active, and a thread with an active run accepts no new messages
+    async for run in client.beta.threads.runs.list(thread_id):
+        if run.status in ("queued", "in_progress", "requires_action"):
+            await client.beta.threads.runs.cancel(run.id, thread_id=thread_id)
+
+
+def initial_task(scenario_name: str, platform: str, diagram_type: str, model: str, run: int, session: SessionContext, topology_file: str | None = None) -> ImplementationTask:
+    # the first message of a session, with the topology of the vision phase and the configurations of the scenario
+    content = f"""Hello network architecture expert, Here you were given two text files: a full configuration file named “Total_Configs.txt” and a textual representation of the topology named “Original_Topology.txt”. Please ensure that you read both of the provided files entirely and make the necessary modifications according to the user's intent, apply the modifications without waiting for confirmation for your actions."""
+    #@TODO: rerun gt topology ablation with correct topology ground truth files
+    # topology_file = f"scenarios_initial_files/{scenario_name}/Original_Topology.json"
+    if topology_file is None: # the topology of an earlier topology understanding run
+        topology_file = f"Vision_results/{model}/{platform}/{diagram_type}/{scenario_name}/Topology(Run{run}).json"
+    #@TODO: make sure this are the appropriate files (configs)
+    config_file = f"scenarios_initial_files/{scenario_name}/Total_Configs.txt"
+    file_attachments = [topology_file, config_file]
+    #@TODO: consider updating some of the intents or adress the differences (declerative vs percise descriptions) [Basic z-ne-based firewall,IP traffic export, transparent IOS, Role Based]
+    intent = open(f"scenarios_initial_files/{scenario_name}/intent.txt", mode='r', encoding="utf8").read()
+    return ImplementationTask(content=content, intent=intent, attachments = file_attachments, source="user", session_key=session.session_key())
+
+
+async def phase4_run(scenario_name: str, platform:str, diagram_type:str, model:str,run:int, verifier_assistant_id: str, implementation_assistant_id: str, session: SessionContext | None = None, file_cache: FileUploadCache | None = None, run_cache: LLMRunCache | None = None,
+                     stream_sink: StreamSink | None = None, distributed_sessions: "DistributedSessions | None" = None, candidates: int = 1,
+                     cancellation_token: CancellationToken | None = None, topology_file: str | None = None):
+    if session is None:
+        session = SessionContext(scenario=scenario_name, platform=platform, diagram_type=diagram_type, model=model, run_number=run)
+    if file_cache is None:
+        file_cache = FileUploadCache(client, cache_path=file_cache_path)
+    if stream_sink is None:
+        stream_sink = create_stream_sink(stream_output)
+    if candidates > 1 and distributed_sessions is None:
+        return await race_phase4_run(scenario_name, platform, diagram_type, model, run, verifier_assistant_id, implementation_assistant_id,
+                                     session, file_cache, run_cache, stream_sink, candidates, topology_file)
+    # the agents of the distributed runtime run on the workers, whose runtime can not save their state,
+    # and the candidates of a race are not resumed (the race starts again)
+    use_checkpoints = session_checkpoints_enabled and distributed_sessions is None and session.candidate is None
+    checkpoints = SessionCheckpoints(f"{session.current_run_dir_path()}/checkpoint.json") if use_checkpoints else None
+    checkpoint = checkpoints.load() if checkpoints is not None else None
+    # -------------------------------Verifier and Implementation assistants-------------------------------
+    if checkpoint is not None:
+        # an interrupted session continues on its threads, from the step after its last completed step
+        restore_session(session, checkpoint.session)
+        logging.warning("Resuming %s from its checkpoint after the %s step of iteration %d", session.session_key(), checkpoint.step, session.get_iteration())
+        with tracing.span("setup_threads", session, resumed=True):
+            oai_verifier_assistant, oai_implementation_assistant, *_ = await asyncio.gather(
+                client.beta.assistants.retrieve(verifier_assistant_id),
+                client.beta.assistants.retrieve(implementation_assistant_id),
+                cancel_active_runs(session.verifier_thread_id),
+                cancel_active_runs(session.implementation_thread_id),
+                *(cancel_active_runs(thread_id) for thread_id in session.verifier_group_threads.values()),
+            )
+    else:
+        # both assistants are independent of each other, so their setup requests are sent at the same time
+        with tracing.span("setup_threads", session):
+            (oai_verifier_assistant, verifier_thread), (oai_implementation_assistant, implementation_thread) = await asyncio.gather(
+                create_assistant_thread(verifier_assistant_id),
+                create_assistant_thread(implementation_assistant_id),
+            )
+        session.verifier_thread_id = verifier_thread.id
+        session.implementation_thread_id = implementation_thread.id
+    if distributed_sessions is not None:
+        # the implement/verify loop runs on one of the workers, on the threads that were created here
+        session_key = sessions.register(session)
+        try:
+            with tracing.span("session", session, scenario=scenario_name, platform=platform, diagram_type=diagram_type, distributed=True) as session_span:
+                await distributed_sessions.run_session(session, initial_task(scenario_name, platform, diagram_type, model, run, session, topology_file))
+                session_span["iterations"] = session.get_iteration()
+                session_span["outcome"] = session.outcome
+        except Exception as e:
+            raise Exception(f"An error occurred during the run for scenario {scenario_name} on platform {platform} with diagram type {diagram_type} with model {model}: {str(e)}")
+        finally:
+            sessions.unregister(session_key)
+        return f"Run completed for scenario {scenario_name} on platform {platform} with diagram type {diagram_type} with model:{model}."
     # -------------------------------Agent Runtime-------------------------------
     runtime = SingleThreadedAgentRuntime()
     # function_event_handler = FunctionEventHandler(client=client, thread_id=implementation_thread.id)
@@ -147,10 +327,18 @@ async def phase4_run(scenario_name: str, platform:str, diagram_type:str, model:s
         "implementation_assistant",
         lambda: ImplementationAgent(
             description="OpenAI Networking Intent Implementation Assistant Agent",
-            client=AsyncClient(api_key=api_key),
+            client=client,
             assistant_id=oai_implementation_assistant.id,
-            thread_id=implementation_thread.id,
-            assistant_event_handler_factory=lambda: EventHandler(),
+            thread_id=session.implementation_thread_id,
+            assistant_event_handler_factory=lambda: EventHandler(stream_sink),
+            file_cache=file_cache,
+            max_parallel_uploads=max_parallel_uploads,
+            run_cache=run_cache,
+            instructions_hash=instructions_hash(oai_implementation_assistant.instructions or ""),
+            stream_sink=stream_sink,
+            checkpoints=checkpoints,
+            budget=session_budget,
+            stop_on_convergence=stop_on_convergence,
         ),)
 
     await VerifierAgent.register(
@@ -158,10 +346,21 @@ async def phase4_run(scenario_name: str, platform:str, diagram_type:str, model:s
         "verifier_assistant",
         lambda: VerifierAgent(
             description="OpenAI Networking Intent Implementation Verifier Assistant Agent",
-            client=AsyncClient(api_key=api_key),
+            client=client,
             assistant_id=oai_verifier_assistant.id,
-            thread_id=verifier_thread.id,
-            assistant_event_handler_factory=lambda: EventHandler(),
+            thread_id=session.verifier_thread_id,
+            assistant_event_handler_factory=lambda: EventHandler(stream_sink),
+            file_cache=file_cache,
+            max_parallel_uploads=max_parallel_uploads,
+            pre_verification=pre_verification_enabled,
+            input_mode=verifier_input_mode,
+            fanout=verifier_fanout,
+            context_mode=verifier_context_mode,
+            compact_after=verifier_compact_after,
+            compact_summary_chars=verifier_compact_summary_chars,
+            run_cache=run_cache,
+            instructions_hash=instructions_hash(oai_verifier_assistant.instructions or ""),
+            checkpoints=checkpoints,
         ),
     )
 
@@ -169,27 +368,97 @@ async def phase4_run(scenario_name: str, platform:str, diagram_type:str, model:s
     verifier_agent = AgentId("verifier_assistant", "default")
     implementation_agent = AgentId("implementation_assistant", "default")
     
+    session_key = sessions.register(session) # the messages of the session carry its key, the agents look the session up by it
     try:
         runtime.start()
-        content = f"""Hello network architecture expert, Here you were given two text files: a full configuration file named “Total_Configs.txt” and a textual representation of the topology named “Original_Topology.txt”. Please ensure that you read both of the provided files entirely and make the necessary modifications according to the user's intent, apply the modifications without waiting for confirmation for your actions."""
-        #@TODO: rerun gt topology ablation with correct topology ground truth files
-        # topology_file = f"scenarios_initial_files/{scenario_name}/Original_Topology.json"
-        topology_file = f"Vision_results/{model}/{platform}/{diagram_type}/{scenario_name}/Topology(Run{run}).json"
-        #@TODO: make sure this are the appropriate files (configs)
-        config_file = f"scenarios_initial_files/{scenario_name}/Total_Configs.txt"
-        file_attachments = [topology_file, config_file]
-        #@TODO: consider updating some of the intents or adress the differences (declerative vs percise descriptions) [Basic z-ne-based firewall,IP traffic export, transparent IOS, Role Based]
-        intent = open(f"scenarios_initial_files/{scenario_name}/intent.txt", mode='r', encoding="utf8").read()
-        await runtime.publish_message(
-            message = ImplementationTask(content=content, intent=intent, attachments = file_attachments, source="user"),
-            topic_id=DefaultTopicId(),
-            )
-        await runtime.stop_when_idle()
+        if checkpoint is not None:
+            await runtime.load_state(checkpoint.agents)
+            first_message = decode_message(checkpoint.pending_message, session) # the message of the interrupted step
+        else:
+            first_message = initial_task(scenario_name, platform, diagram_type, model, run, session, topology_file)
+        # the session span covers the whole implement/verify loop, from the first task until the runtime is idle
+        with tracing.span("session", session, scenario=scenario_name, platform=platform, diagram_type=diagram_type, resumed=checkpoint is not None) as session_span:
+            await runtime.publish_message(
+                message = first_message,
+                topic_id=DefaultTopicId(),
+                cancellation_token=cancellation_token,
+                )
+            await runtime.stop_when_idle()
+            session_span["iterations"] = session.get_iteration()
+            session_span["outcome"] = session.outcome
         await runtime.close()
+        stream_sink.end_session(session)
         return f"Run completed for scenario {scenario_name} on platform {platform} with diagram type {diagram_type} with model:{model}."
     except Exception as e:
         await runtime.close()
+        stream_sink.end_session(session)
         raise Exception(f"An error occurred during the run for scenario {scenario_name} on platform {platform} with diagram type {diagram_type} with model {model}: {str(e)}")
+    finally:
+        sessions.unregister(session_key)
+
+
+async def race_phase4_run(scenario_name: str, platform:str, diagram_type:str, model:str, run:int, verifier_assistant_id: str, implementation_assistant_id: str,
+                          session: SessionContext, file_cache: FileUploadCache, run_cache: LLMRunCache | None, stream_sink: StreamSink, candidates: int,
+                          topology_file: str | None = None):
+    """
+    Run the session as K independent candidates at once, each with its own threads and directory (candidate_{k} in the scenario directory).
+    The first candidate that is approved wins, the others are cancelled through the cancellation token of their first message
+    and their active assistant runs are cancelled. The final results of the winner are copied to the final_results of the scenario,
+    and the session holds the state of the winner and the cost of the losers.
+    """
+    candidate_sessions = {k: SessionContext(scenario=scenario_name, platform=platform, diagram_type=diagram_type, model=model, run_number=run, candidate=k)
+                          for k in range(1, candidates + 1)}
+    cancellation_tokens = {k: CancellationToken() for k in candidate_sessions}
+    tasks = {asyncio.create_task(phase4_run(scenario_name, platform, diagram_type, model, run, verifier_assistant_id, implementation_assistant_id,
+                                            candidate_session, file_cache, run_cache, stream_sink, cancellation_token=cancellation_tokens[k],
+                                            topology_file=topology_file)): k
+             for k, candidate_session in candidate_sessions.items()}
+    winner = None
+    finished = [] # the candidates that ended without an error, in the order they ended
+    errors = []
+    pending = set(tasks)
+    with tracing.span("race", session, candidates=candidates) as race_span:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                k = tasks[task]
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                    continue
+                finished.append(k)
+                if winner is None and candidate_sessions[k].outcome == APPROVED:
+                    winner = k
+        losers = [tasks[task] for task in pending]
+        for k in losers:
+            cancellation_tokens[k].cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        # a cancelled handler leaves its assistant run active on the thread, it is cancelled so it stops using tokens
+        await asyncio.gather(*(cancel_active_runs(thread_id) for k in losers
+                               for thread_id in [candidate_sessions[k].implementation_thread_id, candidate_sessions[k].verifier_thread_id,
+                                                 *candidate_sessions[k].verifier_group_threads.values()]
+                               if thread_id is not None), return_exceptions=True)
+        for k in losers:
+            candidate_sessions[k].outcome = CANCELLED
+            candidate_sessions[k].end_timer()
+        if winner is None and finished:
+            winner = finished[0] # no candidate was approved, the first one that ended is kept
+        race_span["winner"] = winner
+        race_span["cancelled"] = len(losers)
+    if winner is None:
+        raise errors[0]
+    logging.warning("Candidate %d of %d won the race of %s", winner, candidates, session.session_key())
+
+    restore_session(session, session_to_dict(candidate_sessions[winner]))
+    session.candidates = candidates
+    losers_totals = [candidate_sessions[k].usage.totals() for k in candidate_sessions if k != winner]
+    # the cost of a loser is None when one of its models has no price, the cost of the losers is then unknown as well
+    losers_costs = [totals["cost"] for totals in losers_totals]
+    session.losers_cost = None if None in losers_costs else sum(losers_costs)
+    session.losers_tokens = sum(totals["prompt_tokens"] + totals["completion_tokens"] for totals in losers_totals)
+    winner_final_results = f"{session.current_run_dir_path()}/final_results"
+    if os.path.isdir(winner_final_results):
+        shutil.copytree(winner_final_results, f"{session.scenario_dir_path()}/final_results", dirs_exist_ok=True)
+    return f"Run completed for scenario {scenario_name} on platform {platform} with diagram type {diagram_type} with model:{model} (candidate {winner} of {candidates})."
 
 
 if __name__ == "__main__":
@@ -1,5 +1,10 @@
 from dataclasses import dataclass
 
+# The messages carry the key of their session (session_key), not the SessionContext itself: the agents look the session up
+# in the sessions registry of session_context.py, which holds the sessions that run in this process. So every message is
+# a flat dataclass the serializers of autogen_core support. The gRPC runtime of the distributed mode sends the state of
+# the session along with the message, with the SessionMessageSerializer of distributed_runtime.py.
+
 
 @dataclass
 class ImplementationTask:
@@ -7,12 +12,14 @@ class ImplementationTask:
     intent: str # the text from the intent file
     attachments: list[str] # list of file paths
     source:str # "verifier" or "user" -> the sender of the message
+    session_key: str # the key of the implementation session this task belongs to, in the sessions registry
 
 @dataclass
 class ImplementationResult:
     content: str # the content of the implementation assistant's response with the summary of its work across the session
     attachments: list[str] # list of only the final updated file paths
     review: str # the last review of the verifier assistant
+    session_key: str # same as in ImplementationTask
 
 
 @dataclass
@@ -22,6 +29,7 @@ class ImplementationReviewTask:
     implementation: str # the last message of the implementation assistant
     original_attachments: list[str] # the original attachments for the implementation task
     updated_attachments: list[str] # the updated attachments the implementation assistant has created
+    session_key: str # same as in ImplementationTask
 
 @dataclass
 class ImplementationReviewResult:
@@ -29,8 +37,15 @@ class ImplementationReviewResult:
     intent: str
     review: str # the review of the implementation assistant by the verifier assistant
     approved: bool # whether the implementation is approved or not
+    session_key: str # same as in ImplementationTask
     
 
+@dataclass
+class SessionError:
+    error: str # an error that ended the session on a worker of the distributed runtime
+    session_key: str # same as in ImplementationTask
+
+
 @dataclass
 class Reset:
     pass
\ No newline at end of file
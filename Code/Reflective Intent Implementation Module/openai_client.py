@@ -0,0 +1,29 @@
+import httpx
+from openai import AsyncClient, DefaultAsyncHttpxClient
+
+
+def create_async_client(
+    api_key: str | None,
+    base_url: str | None = None,
+    max_connections: int = 200,
+    max_keepalive_connections: int = 100,
+    keepalive_expiry: float = 120.0,
+    timeout: float = 600.0,
+    connect_timeout: float = 10.0,
+    max_retries: int = 4,
+) -> AsyncClient:
+    """
+    Create the single AsyncClient that is shared by the agents and the orchestration code of a run.
+    All of the sessions go through one HTTP connection pool, so concurrent sessions reuse open (TLS) connections
+    instead of opening new ones for every scenario, and no OpenAI call blocks the event loop.
+    The pool should be large enough for max_concurrent_sessions sessions, each with a run stream and a few uploads open at once.
+    """
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(timeout, connect=connect_timeout), # run streams may stay open for minutes
+    )
+    return AsyncClient(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=max_retries)
@@ -0,0 +1,141 @@
+import json
+import os
+import re
+
+import aiofiles
+
+# top level IOS commands, a text file with none of them is not treated as a configuration file
+IOS_COMMAND_PATTERN = re.compile(r"^(hostname|interface|router|ip route|ip access-list|access-list|line|version|vlan|zone|class-map|policy-map|end)\b", re.MULTILINE)
+HOSTNAME_PATTERN = re.compile(r"^hostname\s+(\S+)", re.MULTILINE)
+# the names of the configuration and topology files the implementation assistant's answer refers to
+FILE_NAME_PATTERN = re.compile(r"[\w.()-]+\.(?:txt|json|cfg|conf)\b")
+
+
+def normalize_label(label) -> str:
+    # the same normalization as the topology comparison of the evaluation (labels without spaces)
+    return str(label).replace(" ", "").lower()
+
+
+def parse_topology(content: str) -> tuple[dict | None, list[str]]:
+    """Parse a topology JSON ({"nodes": [{"label": ...}], "links": [[source, destination, ...]]}), returns it and its problems."""
+    try:
+        topology = json.loads(content)
+    except json.decoder.JSONDecodeError as e:
+        return None, [f"the file is not valid JSON ({e})"]
+    if not isinstance(topology, dict) or not isinstance(topology.get("nodes"), list) or not isinstance(topology.get("links"), list):
+        return None, ['the topology must be a JSON object with a "nodes" list and a "links" list']
+    problems = []
+    labels = []
+    for node in topology["nodes"]:
+        if not isinstance(node, dict) or not str(node.get("label", "")).strip():
+            problems.append(f"the node {node} has no label")
+        else:
+            labels.append(normalize_label(node["label"]))
+    duplicate_labels = sorted({label for label in labels if labels.count(label) > 1})
+    if duplicate_labels:
+        problems.append(f"the nodes {duplicate_labels} are declared more than once")
+    for link in topology["links"]:
+        if not isinstance(link, list) or len(link) not in (2, 4):
+            problems.append(f"the link {link} must be [source, destination, source_interface, destination_interface]")
+            continue
+        undeclared = [endpoint for endpoint in link[:2] if normalize_label(endpoint) not in labels]
+        if undeclared:
+            problems.append(f"the link {link} connects the undeclared node(s) {undeclared}")
+    return topology, problems
+
+
+def referenced_files(text: str) -> list[str]:
+    return list(dict.fromkeys(FILE_NAME_PATTERN.findall(text)))
+
+
+def is_configuration(content: str) -> bool:
+    return IOS_COMMAND_PATTERN.search(content) is not None
+
+
+def config_hostnames(content: str) -> list[str]:
+    return HOSTNAME_PATTERN.findall(content)
+
+
+async def read_text(path: str) -> str:
+    async with aiofiles.open(path, mode="r", encoding="utf-8", errors="replace") as f:
+        return await f.read()
+
+
+async def pre_verify(original_attachments: list[str], updated_attachments: list[str], implementation: str = "",
+                     created_files: list[str] | None = None) -> list[str]:
+    """
+    Check the updated files of an implementation iteration for obvious structural errors before the verifier assistant is called:
+    files the implementation assistant's answer refers to that it never created, empty files, malformed topology JSON,
+    links between undeclared nodes, configurations without a hostname,
+    and (when the original files agree with each other) configured devices that are not part of the topology.
+    created_files are the names of the files the implementation assistant created in all of the iterations so far,
+    None if only the updated files were created.
+    Only errors that are certain are reported, anything else is left to the verifier assistant.
+    Returns the problems found, an empty list if there are none.
+    """
+    problems = []
+    contents = {}
+    for path in updated_attachments:
+        if os.path.isfile(path):
+            contents[path] = await read_text(path)
+            if not contents[path].strip():
+                problems.append(f"{os.path.basename(path)}: the file is empty")
+    # a file the answer names, but that was neither created by the create_file tool nor given as an original file
+    existing_files = {os.path.basename(path) for path in original_attachments}
+    existing_files.update(os.path.basename(path) for path in contents)
+    existing_files.update(created_files or [])
+    for file_name in referenced_files(implementation):
+        if file_name not in existing_files:
+            problems.append(f"{file_name}: the file is referenced in the answer but it was never created")
+
+    # the original files show whether the configured hostnames are expected to match the topology labels
+    # problems that the original topology already has are not the implementation's fault, they are not reported again
+    original_labels, original_hostnames, original_problems = set(), set(), set()
+    for path in original_attachments:
+        if not os.path.isfile(path):
+            continue
+        content = await read_text(path)
+        if path.endswith(".json"):
+            topology, topology_problems = parse_topology(content)
+            original_problems.update(topology_problems)
+            if topology is not None:
+                original_labels.update(normalize_label(node["label"]) for node in topology["nodes"] if isinstance(node, dict) and "label" in node)
+        elif is_configuration(content):
+            original_hostnames.update(normalize_label(hostname) for hostname in config_hostnames(content))
+    hostnames_match_labels = bool(original_labels) and bool(original_hostnames) and original_hostnames <= original_labels
+
+    updated_labels = set()
+    updated_hostnames = {}
+    for path, content in contents.items():
+        file_name = os.path.basename(path)
+        if not content.strip():
+            continue
+        if file_name.endswith(".json"):
+            topology, topology_problems = parse_topology(content)
+            problems.extend(f"{file_name}: {problem}" for problem in topology_problems if problem not in original_problems)
+            if topology is not None:
+                updated_labels.update(normalize_label(node["label"]) for node in topology["nodes"] if isinstance(node, dict) and "label" in node)
+        elif is_configuration(content):
+            hostnames = config_hostnames(content)
+            if not hostnames:
+                problems.append(f"{file_name}: the configuration has no hostname command")
+            for hostname in hostnames:
+                updated_hostnames[normalize_label(hostname)] = (file_name, hostname)
+
+    # a device may have been added to a topology of a previous iteration, so this is checked only when the topology was updated as well
+    if hostnames_match_labels and updated_labels:
+        for normalized_hostname, (file_name, hostname) in updated_hostnames.items():
+            if normalized_hostname not in updated_labels:
+                problems.append(f"{file_name}: the device {hostname} is configured but it is not a node of the topology")
+    return problems
+
+
+def pre_verification_review(problems: list[str]) -> dict:
+    """A review in the format of the verifier assistant's JSON answer that rejects the implementation because of the problems."""
+    return {
+        "correctness": "The implementation was rejected by the local pre-verification, before a full review.",
+        "identified_issues": "\n".join(f"- {problem}" for problem in problems),
+        "recommendations": "Fix the issues above and create the corrected files again using the create_file tool.",
+        "verified_files": [],
+        "approval": False,
+    }
@@ -0,0 +1,135 @@
+import argparse
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from session_budget import APPROVED
+
+CELL_KEY = ["Model", "Platform", "Diagram_Type", "Scenario", "Run"]
+PHASE4_COLUMNS = ["Scenario", "Platform", "Diagram_Type", "Run", "Model", "Time", "Cost",
+                  "Reasoning_Text", "Prompt_tokens", "Completion_tokens", "Cached_prompt_tokens", "Error_message", "Outcome",
+                  "Candidates", "Winning_candidate", "Losers_cost", "Losers_tokens"]
+
+
+class ResultsStore:
+    """
+    A SQLite store of the phase 4 results, one row per cell of the experiment matrix keyed by (model, platform, diagram type, scenario, run).
+    Every result is committed on its own, so a crash loses at most the sessions that were running, and the completed cells
+    of an earlier (interrupted) run are known when the run is started again.
+    A cell is completed if its last attempt had no error and was approved, a session that was stopped (see session_budget.py)
+    is not, so it runs again when the run is resumed. The number of attempts of every cell is kept as well.
+    The CSV the evaluation notebooks read is exported from the store with export_csv.
+    """
+
+    def __init__(self, db_path: str, columns: list[str] = PHASE4_COLUMNS) -> None:
+        self.db_path = db_path
+        self.columns = columns
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # the sessions share the event loop, and a single row insert is much shorter than any API call, so the store is synchronous
+        self._connection = sqlite3.connect(db_path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._create_table()
+
+    def _create_table(self) -> None:
+        columns = ", ".join(f'"{column}"' for column in self.columns)
+        key = ", ".join(f'"{column}"' for column in CELL_KEY)
+        with self._connection:
+            self._connection.execute(f'CREATE TABLE IF NOT EXISTS results ({columns}, "Attempts" INTEGER NOT NULL DEFAULT 1, '
+                                     f'"Updated_at" REAL, PRIMARY KEY ({key}))')
+            # columns that were added after the store was created
+            existing_columns = {row[1] for row in self._connection.execute("PRAGMA table_info(results)")}
+            for column in self.columns:
+                if column not in existing_columns:
+                    self._connection.execute(f'ALTER TABLE results ADD COLUMN "{column}"')
+
+    def record(self, row: dict) -> None:
+        """Insert the result of a cell, or replace the result of its previous attempt."""
+        columns = [column for column in self.columns if column in row]
+        names = ", ".join(f'"{column}"' for column in columns)
+        placeholders = ", ".join("?" for _ in columns)
+        updates = ", ".join(f'"{column}" = excluded."{column}"' for column in columns if column not in CELL_KEY)
+        key = ", ".join(f'"{column}"' for column in CELL_KEY)
+        with self._connection:
+            self._connection.execute(
+                f'INSERT INTO results ({names}, "Updated_at") VALUES ({placeholders}, ?) '
+                f'ON CONFLICT ({key}) DO UPDATE SET {updates}, "Attempts" = "Attempts" + 1, "Updated_at" = excluded."Updated_at"',
+                [row[column] for column in columns] + [time.time()])
+
+    def _cells(self, model: str, run_number: int, condition: str, parameters: tuple = ()) -> set[tuple[str, str, str]]:
+        rows = self._connection.execute(f'SELECT "Platform", "Diagram_Type", "Scenario" FROM results WHERE "Model" = ? AND "Run" = ? AND {condition}',
+                                        (model, run_number, *parameters))
+        return {tuple(row) for row in rows}
+
+    def completed_cells(self, model: str, run_number: int) -> set[tuple[str, str, str]]:
+        """The (platform, diagram type, scenario) cells of the run whose last attempt was approved."""
+        return self._cells(model, run_number, '"Error_message" IS NULL AND "Outcome" = ?', (APPROVED,))
+
+    def failed_cells(self, model: str, run_number: int) -> set[tuple[str, str, str]]:
+        """The (platform, diagram type, scenario) cells of the run whose last attempt failed with an error (not the stopped sessions)."""
+        return self._cells(model, run_number, '"Error_message" IS NOT NULL')
+
+    def import_csv(self, csv_path: str) -> int:
+        """Import the rows of a results CSV written before the store existed, cells that are already in the store are kept. Returns the number of imported rows."""
+        df = pd.read_csv(csv_path).reindex(columns=self.columns)
+        df = df.astype(object)
+        # before the sessions could be stopped, a session without an error was approved
+        df.loc[df["Error_message"].isna() & df["Outcome"].isna(), "Outcome"] = APPROVED
+        df = df.where(df.notna(), None) # NaN is stored as NULL
+        imported = 0
+        names = ", ".join(f'"{column}"' for column in self.columns)
+        placeholders = ", ".join("?" for _ in self.columns)
+        with self._connection:
+            for row in df.itertuples(index=False):
+                cursor = self._connection.execute(f'INSERT OR IGNORE INTO results ({names}, "Updated_at") VALUES ({placeholders}, ?)',
+                                                  list(row) + [time.time()])
+                imported += cursor.rowcount
+        return imported
+
+    def to_dataframe(self, model: str | None = None, run_number: int | None = None) -> pd.DataFrame:
+        names = ", ".join(f'"{column}"' for column in self.columns)
+        query = f'SELECT {names}, "Attempts" FROM results'
+        conditions, parameters = [], []
+        if model is not None:
+            conditions.append('"Model" = ?')
+            parameters.append(model)
+        if run_number is not None:
+            conditions.append('"Run" = ?')
+            parameters.append(run_number)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += ' ORDER BY "Updated_at"'
+        return pd.read_sql_query(query, self._connection, params=parameters)
+
+    def export_csv(self, csv_path: str, model: str | None = None, run_number: int | None = None) -> None:
+        # the same columns as the CSV that was written before the store existed, the notebooks read it as is
+        self.to_dataframe(model, run_number)[self.columns].to_csv(csv_path, index=False)
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Show or export the phase 4 results store.")
+    parser.add_argument("db_path", help="e.g. Implementation_results/gpt-4.1-mini/results.sqlite")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--run", type=int, default=None)
+    parser.add_argument("--csv", help="export the results to this CSV file instead of printing them", default=None)
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db_path)
+    if args.csv:
+        store.export_csv(args.csv, args.model, args.run)
+        print(f"Wrote {args.csv}")
+    else:
+        df = store.to_dataframe(args.model, args.run)
+        print(df.to_string(index=False))
+        approved = df["Error_message"].isna() & (df["Outcome"] == APPROVED)
+        failed = df["Error_message"].notna()
+        print(f"{approved.sum()} completed, {(~approved & ~failed).sum()} stopped, {failed.sum()} failed")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
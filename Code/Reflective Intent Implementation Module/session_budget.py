@@ -0,0 +1,56 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+
+from session_context import SessionContext
+
+# the outcomes of a session, besides "approved" every outcome is a session that was stopped before the verifier approved it
+APPROVED = "approved"
+MAX_ITERATIONS = "max_iterations"
+MAX_TOKENS = "max_tokens"
+MAX_SECONDS = "max_seconds"
+REPEATED_REVIEW = "repeated_review" # the verifier found the same issues in the same files as in the previous iteration
+IDENTICAL_FILES = "identical_files" # the implementer created the same files as in the previous iteration
+CANCELLED = "cancelled" # a candidate of a raced session that was cancelled once another candidate was approved
+
+
+@dataclass
+class SessionBudget:
+    """The limits of a single session, None for no limit. The implementation agent checks them before every new iteration."""
+
+    max_iterations: int | None = 10
+    max_tokens: int | None = None # prompt and completion tokens of both agents
+    max_seconds: float | None = None # wall clock time since the session started
+
+    def exceeded(self, session: SessionContext) -> str | None:
+        """The outcome of the session if starting another iteration would exceed the budget, None if it is within the budget."""
+        if self.max_iterations is not None and session.get_iteration() >= self.max_iterations:
+            return MAX_ITERATIONS
+        if self.max_tokens is not None:
+            totals = session.usage.totals()
+            if totals["prompt_tokens"] + totals["completion_tokens"] >= self.max_tokens:
+                return MAX_TOKENS
+        if self.max_seconds is not None and session.start_time is not None and time.time() - session.start_time >= self.max_seconds:
+            return MAX_SECONDS
+        return None
+
+
+def review_fingerprint(review: dict) -> str:
+    # the wording of the correctness and the recommendations changes between reviews of the same issues, so only these are compared
+    key_material = json.dumps([str(review.get("identified_issues", "")).strip(), sorted(review.get("verified_files") or [])])
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+
+def files_fingerprint(paths: list[str]) -> str:
+    """The hash of the names and contents of the files, the same for the same files in any order."""
+    file_hashes = []
+    for path in paths:
+        with open(path, mode="rb") as f:
+            file_hashes.append((os.path.basename(path), hashlib.sha256(f.read()).hexdigest()))
+    return hashlib.sha256(json.dumps(sorted(file_hashes)).encode("utf-8")).hexdigest()
+
+
+def repeats_previous(fingerprints: list[str]) -> bool:
+    return len(fingerprints) >= 2 and fingerprints[-1] == fingerprints[-2]
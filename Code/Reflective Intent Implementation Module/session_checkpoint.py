@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field, asdict, fields
+
+import aiofiles
+from autogen_core import AgentRuntime
+
+from message_protocol import ImplementationTask, ImplementationReviewTask, ImplementationReviewResult
+from session_context import SessionContext
+from usage_tracker import RunUsage, UsageTracker
+
+# the messages of the implement/verify loop that are kept in a checkpoint (the pending message and the agents' session memory)
+CHECKPOINT_MESSAGE_TYPES = {message_type.__name__: message_type
+                            for message_type in (ImplementationTask, ImplementationReviewTask, ImplementationReviewResult)}
+
+
+def session_to_dict(session: SessionContext) -> dict:
+    return asdict(session)
+
+
+def session_from_dict(state: dict) -> SessionContext:
+    session = SessionContext(scenario=state["scenario"], platform=state["platform"], diagram_type=state["diagram_type"], model=state["model"])
+    restore_session(session, state)
+    return session
+
+
+def restore_session(session: SessionContext, state: dict) -> None:
+    """Restore the state of a session in place, so whoever holds the session object (i.e. main_run) sees the resumed state."""
+    for session_field in fields(SessionContext):
+        if session_field.name == "usage":
+            session.usage = UsageTracker(runs=[RunUsage(**run) for run in state["usage"]["runs"]])
+        elif session_field.name in state:
+            setattr(session, session_field.name, state[session_field.name])
+
+
+def encode_message(message) -> dict:
+    encoded_fields = {message_field.name: getattr(message, message_field.name) for message_field in fields(message) }
+    return {"type": type(message).__name__, "fields": encoded_fields}
+
+
+def decode_message(encoded_message: dict, session: SessionContext | None = None):
+    # the checkpoints written before the messages carried the session key have no session_key field, it is the key of the session
+    message_type = CHECKPOINT_MESSAGE_TYPES[encoded_message["type"]]
+    encoded_fields = dict(encoded_message["fields"])
+    if "session_key" not in encoded_fields and session is not None:
+        encoded_fields["session_key"] = session.session_key()
+    return message_type(**encoded_fields)
+
+
+@dataclass
+class SessionCheckpoint:
+    step: str # the last completed step: "implementation", "review" or "final_result"
+    status: str # "in_progress" or "completed"
+    session: dict # the state of the SessionContext
+    pending_message: dict | None # the message the last step published, its handling is the next step
+    agents: dict = field(default_factory=dict) # the state of the agents, by their agent id (runtime.save_state)
+    time: float = 0.0
+
+
+class SessionCheckpoints:
+    """
+    Keeps the state of a session after every step of the implement/verify loop in a single JSON file in the session directory:
+    the session (iteration, thread ids, attachments, usage), the state of the agents (their session memory, the last read
+    thread message and the run cache key) and the message that the step published.
+    If the process dies, phase4_run resumes the session on the same threads by loading the state of the agents and publishing
+    the pending message again, so only the step that was interrupted is repeated.
+    The uploaded files are not part of the checkpoint, the FileUploadCache already keeps their file ids across runs.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def load(self) -> SessionCheckpoint | None:
+        """The checkpoint of an interrupted session, None if there is no such session to resume."""
+        if not os.path.isfile(self.path):
+            return None
+        try:
+            with open(self.path, mode="r", encoding="utf-8") as f:
+                checkpoint = SessionCheckpoint(**json.load(f))
+        except (OSError, json.decoder.JSONDecodeError, TypeError) as e:
+            logging.warning("Could not read the checkpoint %s, starting the session from the beginning: %s", self.path, e)
+            return None
+        if checkpoint.status != "in_progress" or checkpoint.pending_message is None:
+            return None
+        return checkpoint
+
+    async def save(self, runtime: AgentRuntime, step: str, session: SessionContext, pending_message=None, status: str = "in_progress") -> None:
+        checkpoint = SessionCheckpoint(
+            step=step,
+            status=status,
+            session=session_to_dict(session),
+            pending_message=encode_message(pending_message) if pending_message is not None else None,
+            agents=dict(await runtime.save_state()),
+            time=time.time(),
+        )
+        temp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        async with aiofiles.open(temp_path, mode="w", encoding="utf-8") as f:
+            await f.write(json.dumps(asdict(checkpoint)))
+        os.replace(temp_path, self.path) # atomic, a crash while writing leaves the previous checkpoint
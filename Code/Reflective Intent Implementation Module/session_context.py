@@ -0,0 +1,115 @@
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from usage_tracker import UsageTracker
+
+
+@dataclass
+class SessionContext:
+    """
+    This class holds the state of a single implementation session (one scenario of one platform and diagram type).
+    It is not shared across the application - a new instance is created for every phase4_run and registered in the sessions
+    registry, the messages of the session carry its key, so several sessions can run at once.
+    """
+
+    scenario: str
+    platform: str
+    diagram_type: str
+    model: str
+    run_number: int = 1
+    iteration: int = 1 #agent's internal logic do not midify manualy
+    start_time: float | None = None
+    end_time: float | None = None
+    implementation_thread_id: str | None = None
+    verifier_thread_id: str | None = None
+    verifier_group_threads: dict[str, str] = field(default_factory=dict) # the verifier threads of the fan-out verification, by their group of files
+    attachments_for_verifier: list[str] = field(default_factory=list)
+    usage: UsageTracker = field(default_factory=UsageTracker) # the token usage of all of the runs of the session
+    outcome: str | None = None # how the session ended, see session_budget.py
+    review_fingerprints: list[str] = field(default_factory=list) # of the verifier reviews, one per verifier run (the pre-verification rejections are not included)
+    files_fingerprints: list[str] = field(default_factory=list) # of the files the implementer created, one per iteration
+    candidate: int | None = None # the number of the candidate of a raced session (see race_phase4_run in main.py), None if it is not raced
+    candidates: int = 1 # the number of candidates the session was raced with
+    losers_cost: float | None = 0.0 # the cost of the candidates that lost the race, None if one of their models has no price
+    losers_tokens: int = 0 # the prompt and completion tokens of the candidates that lost the race
+
+    def session_key(self):
+        # a unique and readable name of the session, used for logging
+        key = f"{self.model}/{self.platform}/{self.diagram_type}/(Run{self.run_number})/{self.scenario}"
+        return key if self.candidate is None else f"{key}/candidate_{self.candidate}"
+
+    def get_attachments_for_verifier(self):
+        return self.attachments_for_verifier
+
+    def add_attachment_for_verifier(self, attachment):
+        self.attachments_for_verifier.append(attachment)
+
+    def clear_attachments_for_verifier(self):
+        self.attachments_for_verifier = []
+
+    def set_iteration(self, iteration):
+        self.iteration = iteration
+
+    def get_iteration(self):
+        return self.iteration
+
+    def increment_iteration(self):
+        self.iteration += 1
+
+    def start_timer(self):
+        self.start_time = time.time()
+
+    def end_timer(self):
+        self.end_time = time.time()
+
+    def get_elapsed_time(self):
+        if self.start_time is None or self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    def scenario_dir_path(self):
+        return f"Implementation_results/{self.model}/{self.platform}/{self.diagram_type}/(Run{self.run_number})/{self.scenario}"
+
+    def current_run_dir_path(self):
+        # every candidate of a raced session has a directory of its own, inside the directory of the scenario
+        if self.candidate is None:
+            return self.scenario_dir_path()
+        return f"{self.scenario_dir_path()}/candidate_{self.candidate}"
+
+
+class SessionRegistry:
+    """The sessions that run in this process, by their session key (the messages of a session carry only its key)."""
+
+    def __init__(self) -> None:
+        self._sessions: dict[str, SessionContext] = {}
+
+    def register(self, session: SessionContext) -> str:
+        key = session.session_key()
+        self._sessions[key] = session
+        return key
+
+    def unregister(self, key: str) -> None:
+        self._sessions.pop(key, None)
+
+    def find(self, key: str) -> SessionContext | None:
+        return self._sessions.get(key)
+
+    def get(self, key: str) -> SessionContext:
+        session = self._sessions.get(key)
+        if session is None:
+            raise KeyError(f"The session {key} is not running in this process")
+        return session
+
+    @contextmanager
+    def registered(self, session: SessionContext) -> Iterator[str]:
+        """Register the session while the block runs, the block gets its key."""
+        key = self.register(session)
+        try:
+            yield key
+        finally:
+            self.unregister(key)
+
+
+sessions = SessionRegistry()
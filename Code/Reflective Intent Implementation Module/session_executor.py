@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Iterable, TypeVar
+
+CellT = TypeVar("CellT")
+ResultT = TypeVar("ResultT")
+StageT = TypeVar("StageT")
+
+
+async def run_sessions(
+    cells: Iterable[CellT],
+    run_cell: Callable[[CellT], Awaitable[ResultT]],
+    max_concurrent_sessions: int,
+) -> list[ResultT]:
+    """
+    Run one implementation session per cell of the experiment matrix, with at most max_concurrent_sessions at the same time.
+    The sessions are almost only waiting for the OpenAI API, so running them concurrently on a single event loop is enough.
+    run_cell is expected to handle its own errors (i.e. record them in the results), the results are returned in the cells order.
+    """
+    if max_concurrent_sessions < 1:
+        raise ValueError(f"max_concurrent_sessions must be at least 1, got {max_concurrent_sessions}")
+    semaphore = asyncio.Semaphore(max_concurrent_sessions)
+
+    async def run_cell_when_allowed(cell: CellT) -> ResultT:
+        async with semaphore:
+            logging.info("Starting session for cell: %s", cell)
+            return await run_cell(cell)
+
+    return await asyncio.gather(*(run_cell_when_allowed(cell) for cell in cells))
+
+
+async def run_pipeline(
+    cells: Iterable[CellT],
+    first_stage: Callable[[CellT], Awaitable[StageT]],
+    second_stage: Callable[[CellT, StageT], Awaitable[ResultT]],
+    first_stage_workers: int,
+    second_stage_workers: int,
+    queue_size: int,
+) -> list[ResultT]:
+    """
+    Run two stages on every cell of the matrix, the second stage of a cell starts as soon as its first stage is done
+    (i.e. the implementation session of a cell starts once the topology of its diagram was understood), instead of after
+    the first stage of all of the cells. The stages are connected by a bounded queue, so the first stage runs at most
+    queue_size cells ahead of the second one. Both stages are expected to handle their own errors, the results of the
+    second stage are returned in the cells order.
+    """
+    if first_stage_workers < 1 or second_stage_workers < 1 or queue_size < 1:
+        raise ValueError("the pipeline needs at least one worker per stage and a queue of at least one cell")
+    cells = list(cells)
+    cell_queue: asyncio.Queue = asyncio.Queue()
+    for index, cell in enumerate(cells):
+        cell_queue.put_nowait((index, cell))
+    stage_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    results: list = [None] * len(cells)
+
+    async def first_stage_worker() -> None:
+        while not cell_queue.empty():
+            index, cell = cell_queue.get_nowait()
+            logging.info("Starting the first stage for cell: %s", cell)
+            await stage_queue.put((index, cell, await first_stage(cell))) # waits while the second stage is queue_size cells behind
+
+    async def second_stage_worker() -> None:
+        while True:
+            item = await stage_queue.get()
+            if item is None: # every first stage worker is done
+                return
+            index, cell, first_stage_result = item
+            logging.info("Starting the second stage for cell: %s", cell)
+            results[index] = await second_stage(cell, first_stage_result)
+
+    second_stage_tasks = [asyncio.create_task(second_stage_worker()) for _ in range(second_stage_workers)]
+    try:
+        await asyncio.gather(*(first_stage_worker() for _ in range(first_stage_workers)))
+        for _ in second_stage_tasks:
+            await stage_queue.put(None)
+        await asyncio.gather(*second_stage_tasks)
+    finally:
+        for task in second_stage_tasks:
+            task.cancel()
+    return results
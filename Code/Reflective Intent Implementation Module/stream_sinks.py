@@ -0,0 +1,139 @@
+import os
+import sys
+import time
+
+from session_context import SessionContext
+
+
+class StreamSink:
+    """
+    Where the streamed answers of the assistants go. write receives every text delta, so the sinks buffer it instead of
+    writing each delta on its own, end_message marks the end of an assistant message and notice writes a whole line at once.
+    """
+
+    def write(self, session: SessionContext, agent: str, text: str) -> None:
+        pass
+
+    def end_message(self, session: SessionContext, agent: str) -> None:
+        pass
+
+    def notice(self, session: SessionContext, text: str) -> None:
+        pass
+
+    def end_session(self, session: SessionContext) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class NullSink(StreamSink):
+    """Drops all of the output, for batch runs where only the result files matter."""
+
+
+class ConsoleSink(StreamSink):
+    """
+    Prints the streamed answers to the screen at most once every render_interval seconds. Every session and agent has its own
+    buffer, and a header line is printed whenever the output switches to another session, so concurrent sessions are not mixed up.
+    """
+
+    def __init__(self, render_interval: float = 0.2, stream=None) -> None:
+        self._render_interval = render_interval
+        self._stream = stream if stream is not None else sys.stdout
+        self._buffers: dict[tuple[str, str], list[str]] = {}
+        self._last_render_time = 0.0
+        self._last_rendered_key: tuple[str, str] | None = None
+
+    def _render(self, keys: list[tuple[str, str]] | None = None) -> None:
+        output = []
+        for key in keys if keys is not None else list(self._buffers):
+            buffer = self._buffers.pop(key, None)
+            if not buffer:
+                continue
+            if key != self._last_rendered_key:
+                output.append(f"\n[{key[0]} | {key[1]}]\n")
+                self._last_rendered_key = key
+            output.append("".join(buffer))
+        if output:
+            self._stream.write("".join(output))
+            self._stream.flush()
+        self._last_render_time = time.monotonic()
+
+    def write(self, session: SessionContext, agent: str, text: str) -> None:
+        self._buffers.setdefault((session.session_key(), agent), []).append(text)
+        if time.monotonic() - self._last_render_time >= self._render_interval:
+            self._render()
+
+    def end_message(self, session: SessionContext, agent: str) -> None:
+        key = (session.session_key(), agent)
+        self._buffers.setdefault(key, []).append("\n")
+        self._render([key])
+
+    def notice(self, session: SessionContext, text: str) -> None:
+        self._render() # the buffered answers come before the notice
+        self._stream.write(f"[{session.session_key()}] {text}\n")
+        self._stream.flush()
+        self._last_rendered_key = None
+
+    def end_session(self, session: SessionContext) -> None:
+        self._render([key for key in self._buffers if key[0] == session.session_key()])
+
+    def close(self) -> None:
+        self._render()
+
+
+class BufferedFileSink(StreamSink):
+    """
+    Writes the streamed answers of every session to {session directory}/{file_name}, through a buffer of buffer_bytes,
+    so a whole answer usually costs a single write instead of one per delta.
+    """
+
+    def __init__(self, file_name: str = "assistant_stream.txt", buffer_bytes: int = 64 * 1024) -> None:
+        self._file_name = file_name
+        self._buffer_bytes = buffer_bytes
+        self._files = {}
+        self._last_agent: dict[str, str] = {}
+
+    def _file(self, session: SessionContext):
+        key = session.session_key()
+        if key not in self._files:
+            os.makedirs(session.current_run_dir_path(), exist_ok=True)
+            self._files[key] = open(f"{session.current_run_dir_path()}/{self._file_name}", mode="a", encoding="utf-8", buffering=self._buffer_bytes)
+        return self._files[key]
+
+    def write(self, session: SessionContext, agent: str, text: str) -> None:
+        f = self._file(session)
+        if self._last_agent.get(session.session_key()) != agent:
+            f.write(f"\n[{agent}, iteration {session.get_iteration()}]\n")
+            self._last_agent[session.session_key()] = agent
+        f.write(text)
+
+    def end_message(self, session: SessionContext, agent: str) -> None:
+        self._file(session).write("\n")
+        self._last_agent.pop(session.session_key(), None) # the next message starts with a header
+
+    def notice(self, session: SessionContext, text: str) -> None:
+        self._file(session).write(f"{text}\n")
+
+    def end_session(self, session: SessionContext) -> None:
+        f = self._files.pop(session.session_key(), None)
+        if f is not None:
+            f.close()
+        self._last_agent.pop(session.session_key(), None)
+
+    def close(self) -> None:
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        self._last_agent = {}
+
+
+def create_stream_sink(mode: str) -> StreamSink:
+    """"console" for interactive runs, "file" or "null" for batch runs of the matrix."""
+    if mode == "console":
+        return ConsoleSink()
+    if mode == "file":
+        return BufferedFileSink()
+    if mode == "null":
+        return NullSink()
+    raise ValueError(f"Unknown stream output mode: {mode}")
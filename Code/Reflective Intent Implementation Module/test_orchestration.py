@@ -0,0 +1,85 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENARIO_DIR = "Implementation_results/gpt-4.1-mini/GNS3/Normal/(Run1)/Benchmark_Scenario_0"
+
+
+def run_benchmark(workdir, *args: str) -> str:
+    # every run is a process of its own, main.py creates its client for the fake server when it is imported
+    result = subprocess.run([sys.executable, os.path.join(MODULE_DIR, "benchmark_orchestration.py"), "--workdir", str(workdir), *args],
+                            capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def test_approved_session(tmp_path):
+    output = run_benchmark(tmp_path, "--sessions", "1")
+    assert "Sessions: 1/1 completed" in output
+    assert "Error:" not in output
+    scenario_dir = tmp_path / SCENARIO_DIR
+    assert os.listdir(scenario_dir / "final_results")
+    with open(scenario_dir / "checkpoint.json", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    assert (checkpoint["status"], checkpoint["step"]) == ("completed", "final_result")
+    assert checkpoint["session"]["outcome"] == "approved"
+    with open(scenario_dir / "transcript.jsonl", encoding="utf-8") as f:
+        events = [record["event"] for record in map(json.loads, f) if record["kind"] == "event"]
+    assert events[-1] == "final_result"
+
+
+def test_distributed_session(tmp_path):
+    with socket.socket() as s: # a free port for the host of the local cluster
+        s.bind(("localhost", 0))
+        port = s.getsockname()[1]
+    output = run_benchmark(tmp_path, "--sessions", "2", "--distributed-workers", "1", "--distributed-host", f"localhost:{port}")
+    assert "Sessions: 2/2 completed" in output
+    assert "Error:" not in output
+    # the worker ran the sessions in the same working directory
+    assert os.listdir(tmp_path / SCENARIO_DIR / "final_results")
+
+
+def request_count(output: str, request: str) -> int:
+    counts = dict(line.strip().rsplit(": ", 1) for line in output.splitlines() if line.startswith("  "))
+    return int(counts.get(request, 0))
+
+
+def test_fanout_threads_have_a_vector_store(tmp_path):
+    output = run_benchmark(tmp_path, "--sessions", "1", "--verifier-fanout")
+    # the group threads of the fan-out are created besides the implementer and verifier threads, file search needs a vector store on each of them
+    assert request_count(output, "POST /threads") > 2
+    assert request_count(output, "POST /vector_stores") == request_count(output, "POST /threads")
+
+
+def test_diff_mode_attaches_the_full_updated_files(tmp_path):
+    output = run_benchmark(tmp_path, "--sessions", "1", "--verifier-input-mode", "diff")
+    assert "Sessions: 1/1 completed" in output
+    with open(tmp_path / "Implementation_results/gpt-4.1-mini/traces_run1.jsonl", encoding="utf-8") as f:
+        uploads = [span for span in map(json.loads, f) if span["name"] == "upload_file" and span["agent"] == "verifier"]
+    # the diffs are in the prompt, the verifier can still search the whole file of every iteration
+    for iteration, file_name in [(1, "R1_config.txt"), (2, "R1_config.txt"), (2, "R2_config.txt")]:
+        path = f"{SCENARIO_DIR}/iteration_{iteration}/assistant_files/{file_name}"
+        [upload] = [span for span in uploads if span["iteration"] == iteration and span["path"].endswith(path)]
+        assert upload["bytes"] == os.path.getsize(tmp_path / path)
+
+
+def test_race_with_an_unpriced_model(tmp_path):
+    script = tmp_path / "script.json"
+    script.write_text(json.dumps({"model": "unpriced-model"}), encoding="utf-8")
+    output = run_benchmark(tmp_path / "run", "--sessions", "1", "--race-candidates", "2", "--script", str(script))
+    # the winner is kept, and the cost of the loser is unknown
+    assert "Sessions: 1/1 completed" in output
+    assert "Losers cost: [None]" in output
+    assert os.listdir(tmp_path / "run" / SCENARIO_DIR.replace("gpt-4.1-mini", "unpriced-model") / "final_results")
+
+
+def test_main_imports_without_grpc(tmp_path):
+    # the distributed runtime is imported only when distributed_workers > 0
+    code = ("import sys; sys.modules['autogen_ext.runtimes.grpc'] = None; import main; "
+            "assert 'distributed_runtime' not in sys.modules")
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, capture_output=True, text=True, timeout=120,
+                            env={**os.environ, "OPENAI_API_KEY": "fake-key", "PYTHONPATH": MODULE_DIR})
+    assert result.returncode == 0, result.stderr
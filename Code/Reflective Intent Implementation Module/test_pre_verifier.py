@@ -0,0 +1,29 @@
+import asyncio
+
+from pre_verifier import pre_verify
+
+R1_CONFIG = "hostname R1\ninterface GigabitEthernet0/0\n ip address 10.0.0.1 255.255.255.0\nend\n"
+
+
+def write_files(directory, files: dict[str, str]) -> list[str]:
+    directory.mkdir(parents=True, exist_ok=True)
+    for file_name, content in files.items():
+        (directory / file_name).write_text(content, encoding="utf-8")
+    return [str(directory / file_name) for file_name in files]
+
+
+def test_referenced_file_was_never_written(tmp_path):
+    original_attachments = write_files(tmp_path / "original", {"Total_Configs.txt": R1_CONFIG})
+    updated_attachments = write_files(tmp_path / "iteration_1", {"R1_config.txt": R1_CONFIG})
+    implementation = "I created R1_config.txt and R2_config.txt with the new interfaces."
+    problems = asyncio.run(pre_verify(original_attachments, updated_attachments, implementation, ["R1_config.txt"]))
+    assert problems == ["R2_config.txt: the file is referenced in the answer but it was never created"]
+
+
+def test_referenced_files_were_created(tmp_path):
+    original_attachments = write_files(tmp_path / "original", {"Total_Configs.txt": R1_CONFIG})
+    updated_attachments = write_files(tmp_path / "iteration_2", {"R1_config.txt": R1_CONFIG})
+    # an original file, an updated file and a file that was created in an earlier iteration
+    implementation = "Based on Total_Configs.txt I updated R1_config.txt, R2_config.txt is unchanged."
+    problems = asyncio.run(pre_verify(original_attachments, updated_attachments, implementation, ["R1_config.txt", "R2_config.txt"]))
+    assert problems == []
@@ -0,0 +1,48 @@
+from openai import AsyncClient
+from openai.types.beta.threads import Message
+
+
+class ThreadMessageCursor:
+    """
+    An incremental reader of the messages of a single thread.
+    Every call to fetch_new downloads only the messages that were added after the last message seen so far
+    (paginating through all of them), and keeps all of the messages of the thread in ascending order in self.messages.
+    """
+
+    def __init__(self, client: AsyncClient, thread_id: str, page_size: int = 100) -> None:
+        self._client = client
+        self._thread_id = thread_id
+        self._page_size = page_size # the maximum allowed by the API is 100
+        self._last_message_id: str | None = None
+        self.messages: list[Message] = []
+
+    @property
+    def last_message_id(self) -> str | None:
+        return self._last_message_id
+
+    def resume_after(self, message_id: str | None) -> None:
+        # continue reading a thread whose earlier messages were read before (i.e. by a session that is resumed from a checkpoint)
+        self._last_message_id = message_id
+
+    async def fetch_new(self) -> list[Message]:
+        """Fetch the messages that were added to the thread since the last call, in ascending order."""
+        list_kwargs = {"order": "asc", "limit": self._page_size}
+        if self._last_message_id is not None:
+            list_kwargs["after"] = self._last_message_id
+        new_messages = []
+        # iterating the paginator fetches the following pages as well, so long threads are not cut at the first page
+        async for message in self._client.beta.threads.messages.list(self._thread_id, **list_kwargs):
+            new_messages.append(message)
+        if new_messages:
+            self._last_message_id = new_messages[-1].id
+            self.messages.extend(new_messages)
+        return new_messages
+
+
+def messages_after_last_user_message(messages: list[Message]) -> list[Message]:
+    """Return the messages that follow the last user message, i.e. the assistant's answer to it."""
+    last_user_message_index = -1
+    for index, message in enumerate(messages):
+        if message.role == "user":
+            last_user_message_index = index
+    return messages[last_user_message_index+1:]
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+import aiofiles
+from openai.types.beta.threads.required_action_function_tool_call import RequiredActionFunctionToolCall
+
+import tracing
+from session_context import SessionContext
+
+
+@dataclass
+class ToolContext:
+    """What the tools of a single run may use, the same context is given to all of the tool calls of the run."""
+    session: SessionContext
+    agent: str # "implementer" or "verifier", for the tracing spans
+    file_locks: dict[str, asyncio.Lock] = field(default_factory=dict) # calls that write the same file are applied in their order
+
+    def file_lock(self, path: str) -> asyncio.Lock:
+        return self.file_locks.setdefault(path, asyncio.Lock())
+
+
+# a tool gets the parsed arguments of its call and returns the output that is submitted for it
+Tool = Callable[[dict, ToolContext], Awaitable[str]]
+
+
+class ToolRegistry:
+    """The function tools of an assistant by their name, a new tool is added with register without changing the run stream handling."""
+
+    def __init__(self) -> None:
+        self._tools: dict[str, Tool] = {}
+
+    def register(self, name: str, tool: Tool) -> None:
+        self._tools[name] = tool
+
+    def get(self, name: str) -> Tool | None:
+        return self._tools.get(name)
+
+    def names(self) -> list[str]:
+        return list(self._tools)
+
+
+class ToolExecutor:
+    """
+    Runs all of the tool calls of a requires_action event at the same time and returns their outputs in the order of the calls.
+    A call of an unknown tool, or a call that fails, gets an error output instead of failing the run, so the assistant can correct it.
+    """
+
+    def __init__(self, registry: ToolRegistry) -> None:
+        self._registry = registry
+
+    async def execute(self, tool_calls: list[RequiredActionFunctionToolCall], context: ToolContext) -> list[dict]:
+        # the calls start in their order, so whatever a tool does before its first await (i.e. adding its file to the session) keeps that order
+        outputs = await asyncio.gather(*(self._execute_call(tool_call, context) for tool_call in tool_calls))
+        return [{"tool_call_id": tool_call.id, "output": output} for tool_call, output in zip(tool_calls, outputs)]
+
+    async def _execute_call(self, tool_call: RequiredActionFunctionToolCall, context: ToolContext) -> str:
+        tool = self._registry.get(tool_call.function.name)
+        if tool is None:
+            logging.warning("The %s called the unknown tool %s", context.agent, tool_call.function.name)
+            return f"Error: there is no tool named {tool_call.function.name}, the available tools are {self._registry.names()}"
+        try:
+            args = json.loads(tool_call.function.arguments)
+            return await tool(args, context)
+        except Exception as e:
+            logging.warning("The %s tool call %s of %s failed: %s", tool_call.function.name, tool_call.id, context.session.session_key(), e)
+            return f"Error: the {tool_call.function.name} call failed: {e}"
+
+
+async def create_file(args: dict, context: ToolContext) -> str:
+    """Write a file the assistant created into the current iteration directory and into the directory of the files of all iterations."""
+    session = context.session
+    file_name, content = args['file_name'], args['content']
+    output_dir_path = session.current_run_dir_path()
+    new_file_path = f"{output_dir_path}/iteration_{session.get_iteration()}/assistant_files/{file_name}"
+    all_files_dir_file_path = f"{output_dir_path}/All_assistant_files/{file_name}"
+    session.add_attachment_for_verifier(new_file_path)
+
+    async def write(path: str) -> None:
+        async with aiofiles.open(path, mode="w", encoding="utf-8") as f:
+            await f.write(content)
+
+    with tracing.span("create_file", session, agent=context.agent, file_name=file_name, bytes=len(content)):
+        async with context.file_lock(new_file_path):
+            # the copy in the all iterations directory is written from the same content at the same time, instead of copying the file afterwards
+            await asyncio.gather(write(new_file_path), write(all_files_dir_file_path))
+    return file_name
+
+
+def default_tool_registry() -> ToolRegistry:
+    """The function tools of the implementation assistant (see create_assistants.py)."""
+    registry = ToolRegistry()
+    registry.register("create_file", create_file)
+    return registry
@@ -0,0 +1,86 @@
+import argparse
+import json
+
+import pandas as pd
+
+# spans that do not overlap within an agent step, their sum is the time the step took
+# (tool_calls, create_file, submit_tool_outputs and time_to_first_token are nested inside the run span)
+STAGE_SPANS = ["setup_threads", "upload_attachments", "messages_create", "run", "messages_fetch", "file_copy", "transcript_write"]
+
+
+def load_spans(path: str) -> pd.DataFrame:
+    with open(path, mode="r", encoding="utf-8") as f:
+        spans = [json.loads(line) for line in f if line.strip()]
+    spans_df = pd.DataFrame(spans)
+    for column in ["session", "iteration", "agent"]:
+        if column not in spans_df.columns:
+            spans_df[column] = None
+    spans_df["end"] = spans_df["start"] + spans_df["duration"]
+    return spans_df
+
+
+def latency_breakdown(spans_df: pd.DataFrame) -> pd.DataFrame:
+    """The total seconds of every span name per session, iteration and agent."""
+    spans_df = spans_df[spans_df["name"] != "session"].fillna({"agent": "", "iteration": 0})
+    breakdown = spans_df.pivot_table(index=["session", "iteration", "agent"], columns="name", values="duration",
+                                     aggfunc="sum", fill_value=0.0)
+    stages = [stage for stage in STAGE_SPANS if stage in breakdown.columns]
+    breakdown["stages_total"] = breakdown[stages].sum(axis=1)
+    return breakdown
+
+
+def session_extents(spans_df: pd.DataFrame) -> pd.DataFrame:
+    """The first start and the last end of the spans of every session (the setup of the threads precedes the session span)."""
+    extents = spans_df.dropna(subset=["session"]).groupby("session").agg(start=("start", "min"), end=("end", "max"))
+    extents["duration"] = extents["end"] - extents["start"]
+    return extents
+
+
+def critical_path(spans_df: pd.DataFrame) -> tuple[str, pd.DataFrame] | None:
+    """
+    The session that finished last is the one that bounds the wall time of the whole run,
+    returns its key and the total seconds of every stage of it per iteration and agent.
+    """
+    extents = session_extents(spans_df)
+    if extents.empty:
+        return None
+    last_session = extents["end"].idxmax()
+    return last_session, latency_breakdown(spans_df[spans_df["session"] == last_session])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Summarize the tracing spans of an implementation run.")
+    parser.add_argument("trace_file", help="e.g. Implementation_results/gpt-4.1-mini/traces_run1.jsonl")
+    parser.add_argument("--csv", help="also write the latency breakdown to this CSV file", default=None)
+    args = parser.parse_args()
+
+    spans_df = load_spans(args.trace_file)
+    pd.set_option("display.width", 250)
+    pd.set_option("display.max_columns", 30)
+    pd.set_option("display.float_format", "{:.3f}".format)
+
+    breakdown = latency_breakdown(spans_df)
+    print("---- Latency breakdown (seconds) per session, iteration and agent ----")
+    print(breakdown)
+    print()
+    print("---- Total seconds per span name ----")
+    print(spans_df.groupby("name")["duration"].agg(["count", "sum", "mean", "max"]).sort_values("sum", ascending=False))
+    if args.csv is not None:
+        breakdown.to_csv(args.csv)
+
+    result = critical_path(spans_df)
+    if result is not None:
+        last_session, session_breakdown = result
+        extents = session_extents(spans_df)
+        wall_time = extents["end"].max() - extents["start"].min()
+        last_session_time = extents.loc[last_session, "duration"]
+        print()
+        print(f"---- Critical path: {last_session} ({last_session_time:.3f}s of {wall_time:.3f}s wall time) ----")
+        print(session_breakdown)
+        stage_totals = session_breakdown[[stage for stage in STAGE_SPANS if stage in session_breakdown.columns]].sum()
+        print()
+        print((stage_totals / last_session_time * 100).sort_values(ascending=False).rename("% of session"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, TextIO
+
+from session_context import SessionContext
+
+
+class Tracer:
+    """
+    Writes timing spans of the implement/verify loop as JSON lines to a local file.
+    Each span record holds its name, the session and iteration it belongs to, its start time (epoch seconds),
+    its duration and any extra attributes. The records are summarized by trace_summary.py.
+    A tracer without a path is disabled and records nothing.
+    """
+
+    def __init__(self, path: str | None = None) -> None:
+        self.path = path
+        self._file: TextIO | None = None
+        if path is not None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(path, mode="a", encoding="utf-8")
+
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None
+
+    def record(self, name: str, start: float, duration: float, session: SessionContext | None = None, **attributes: Any) -> None:
+        """Record a span that was measured by the caller, start is in epoch seconds."""
+        if self._file is None:
+            return
+        span_record = {"name": name, "start": start, "duration": duration}
+        if session is not None:
+            span_record["session"] = session.session_key()
+            span_record["iteration"] = session.get_iteration()
+        span_record.update(attributes)
+        self._file.write(json.dumps(span_record, default=str) + "\n")
+
+    @contextmanager
+    def span(self, name: str, session: SessionContext | None = None, **attributes: Any) -> Iterator[dict]:
+        """
+        Time the enclosed block (it may contain awaits). The yielded dict can be used to add attributes to the span,
+        a block that raises is recorded with its error.
+        """
+        start = time.time()
+        start_counter = time.perf_counter()
+        try:
+            yield attributes
+        except BaseException as e:
+            attributes["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.record(name, start, time.perf_counter() - start_counter, session, **attributes)
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+_tracer = Tracer() # disabled until configure_tracing is called
+
+
+def configure_tracing(path: str | None) -> Tracer:
+    """Start writing the spans of the whole process to path (None disables the tracing)."""
+    global _tracer
+    _tracer.close()
+    _tracer = Tracer(path)
+    if path is not None:
+        logging.info("Writing tracing spans to %s", path)
+    return _tracer
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def span(name: str, session: SessionContext | None = None, **attributes: Any):
+    return _tracer.span(name, session, **attributes)
+
+
+def record_span(name: str, start: float, duration: float, session: SessionContext | None = None, **attributes: Any) -> None:
+    _tracer.record(name, start, duration, session, **attributes)
@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import time
+
+import aiofiles
+from openai.types.beta.threads import Message
+
+
+class TranscriptJournal:
+    """
+    An append-only JSON lines journal of a single session, every thread message and event is written to it exactly once.
+    The byte offset of the first record of every iteration is kept in an index file next to the journal, so the records
+    of a single iteration are read without reading the whole journal.
+    The human readable transcripts (Full_Conversation.txt) are views of the journal, rendered on demand with render_conversation.
+    """
+
+    def __init__(self, path: str, restart: bool = False) -> None:
+        self.path = path
+        self.index_path = f"{os.path.splitext(path)[0]}_index.json"
+        if restart: # a session that starts from the beginning again does not continue the journal of the previous attempt
+            for journal_file in (path, self.index_path):
+                if os.path.isfile(journal_file):
+                    os.remove(journal_file)
+        # an existing journal (i.e. of a resumed session) is continued
+        self._size = os.path.getsize(path) if os.path.isfile(path) else 0
+        self.iteration_offsets: dict[int, int] = load_index(self.index_path)
+        self._journaled_message_ids: set[str] = {record["id"] for record in read_records(path) if record["kind"] == "message"}
+
+    async def _append(self, records: list[dict]) -> None:
+        lines = ""
+        for record in records:
+            iteration = record["iteration"]
+            if iteration not in self.iteration_offsets:
+                self.iteration_offsets[iteration] = self._size + len(lines.encode("utf-8"))
+                await self._write_index()
+            lines += json.dumps(record) + "\n"
+        async with aiofiles.open(self.path, mode="a", encoding="utf-8") as f:
+            await f.write(lines)
+        self._size += len(lines.encode("utf-8"))
+
+    async def _write_index(self) -> None:
+        async with aiofiles.open(self.index_path, mode="w", encoding="utf-8") as f:
+            await f.write(json.dumps(self.iteration_offsets))
+
+    async def append_messages(self, messages: list[Message], iteration: int) -> None:
+        """Journal the thread messages that were not journaled yet."""
+        records = []
+        for message in messages:
+            if message.id in self._journaled_message_ids:
+                continue
+            self._journaled_message_ids.add(message.id)
+            records.append({"kind": "message", "iteration": iteration, "time": message.created_at, "id": message.id,
+                            "role": message.role, "sender": (message.metadata or {}).get("sender"),
+                            "text": message.content[0].text.value})
+        if records:
+            await self._append(records)
+
+    async def append_event(self, event: str, iteration: int, **data) -> None:
+        await self._append([{"kind": "event", "iteration": iteration, "time": time.time(), "event": event, **data}])
+
+
+def load_index(index_path: str) -> dict[int, int]:
+    if not os.path.isfile(index_path):
+        return {}
+    with open(index_path, mode="r", encoding="utf-8") as f:
+        return {int(iteration): offset for iteration, offset in json.load(f).items()}
+
+
+def read_records(journal_path: str, iteration: int | None = None, up_to_iteration: int | None = None) -> list[dict]:
+    """Read the records of a single iteration, of all of the iterations up to up_to_iteration, or of the whole journal."""
+    if not os.path.isfile(journal_path):
+        return []
+    offsets = load_index(f"{os.path.splitext(journal_path)[0]}_index.json")
+    start, end = 0, None
+    if iteration is not None:
+        if iteration not in offsets:
+            return []
+        start = offsets[iteration]
+        later_offsets = [offset for offset in offsets.values() if offset > start]
+        end = min(later_offsets) if later_offsets else None
+    elif up_to_iteration is not None:
+        later_offsets = [offset for later_iteration, offset in offsets.items() if later_iteration > up_to_iteration]
+        end = min(later_offsets) if later_offsets else None
+    with open(journal_path, mode="rb") as f:
+        f.seek(start)
+        data = f.read() if end is None else f.read(end - start)
+    return [json.loads(line) for line in data.decode("utf-8").splitlines() if line.strip()]
+
+
+def render_conversation(records: list[dict]) -> str:
+    """Render the records in the format of Full_Conversation.txt."""
+    lines = []
+    final_result = next((record for record in reversed(records) if record["kind"] == "event" and record["event"] == "final_result"), None)
+    messages = [record for record in records if record["kind"] == "message"]
+    if final_result is not None and messages and messages[-1]["role"] == "assistant":
+        messages = messages[:-1] # the final JSON answer is rendered from the final result below
+    for message in messages:
+        lines.append(f"{message['role']}:\n {message['text']}\n")
+        lines.append("-" * 80)
+        lines.append("\n")
+    if final_result is not None:
+        lines.append(f"assistant:\n {final_result['implementation_explanation']}\n")
+        lines.append(f"Updated files:\n {final_result['updated_attachments']}\n")
+    return "".join(lines)
+
+
+def write_conversation_views(session_dir: str) -> list[str]:
+    """
+    Write Full_Conversation.txt of the session (the whole conversation) and of every iteration directory
+    (the conversation up to the end of that iteration) from the journal, returns the written paths.
+    """
+    journal_path = f"{session_dir}/transcript.jsonl"
+    written_paths = []
+    for iteration in sorted(load_index(f"{session_dir}/transcript_index.json")):
+        if os.path.isdir(f"{session_dir}/iteration_{iteration}"):
+            path = f"{session_dir}/iteration_{iteration}/Full_Conversation.txt"
+            with open(path, mode="w", encoding="utf-8") as f:
+                f.write(render_conversation(read_records(journal_path, up_to_iteration=iteration)))
+            written_paths.append(path)
+    path = f"{session_dir}/Full_Conversation.txt"
+    with open(path, mode="w", encoding="utf-8") as f:
+        f.write(render_conversation(read_records(journal_path)))
+    written_paths.append(path)
+    return written_paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Render the conversation of a session from its transcript journal.")
+    parser.add_argument("session_dir", help="e.g. Implementation_results/gpt-4.1-mini/GNS3/Normal/(Run1)/IP_Traffic_Export")
+    parser.add_argument("--iteration", type=int, default=None, help="print only the records of this iteration")
+    parser.add_argument("--write", action="store_true", help="write the Full_Conversation.txt files instead of printing")
+    args = parser.parse_args()
+
+    if args.write:
+        for path in write_conversation_views(args.session_dir):
+            print(f"Wrote {path}")
+    else:
+        print(render_conversation(read_records(f"{args.session_dir}/transcript.jsonl", iteration=args.iteration)))
+
+
+if __name__ == "__main__":
+    main()
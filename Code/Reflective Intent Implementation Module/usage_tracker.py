@@ -0,0 +1,129 @@
+import json
+import logging
+from dataclasses import dataclass, asdict, field
+
+from openai.types.beta.threads import Run
+
+
+@dataclass
+class ModelPrice:
+    # USD per 1M tokens
+    input: float
+    cached_input: float
+    output: float
+
+
+# modify as needed when the prices change or when a new model is used
+MODEL_PRICES = {
+    "gpt-4.1": ModelPrice(input=2.0, cached_input=0.5, output=8.0),
+    "gpt-4.1-mini": ModelPrice(input=0.4, cached_input=0.1, output=1.6),
+    "gpt-4.1-nano": ModelPrice(input=0.1, cached_input=0.025, output=0.4),
+    "gpt-4o": ModelPrice(input=2.5, cached_input=1.25, output=10.0),
+    "gpt-4o-mini": ModelPrice(input=0.15, cached_input=0.075, output=0.6),
+    "o1": ModelPrice(input=15.0, cached_input=7.5, output=60.0),
+    "o3": ModelPrice(input=2.0, cached_input=0.5, output=8.0),
+    "o3-mini": ModelPrice(input=1.1, cached_input=0.55, output=4.4),
+    "o4-mini": ModelPrice(input=1.1, cached_input=0.275, output=4.4),
+}
+
+
+def get_model_price(model: str) -> ModelPrice | None:
+    """Find the price of a model, dated snapshots (i.e. "gpt-4.1-mini-2025-04-14") use the price of their base model."""
+    if model in MODEL_PRICES:
+        return MODEL_PRICES[model]
+    base_models = [base_model for base_model in MODEL_PRICES if model.startswith(f"{base_model}-")]
+    if not base_models:
+        return None
+    return MODEL_PRICES[max(base_models, key=len)]
+
+
+@dataclass
+class RunUsage:
+    agent: str # "implementer" or "verifier"
+    iteration: int
+    run_id: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    cached_prompt_tokens: int
+    latency: float | None # seconds from the run creation to its completion
+    cost: float | None # None if the model has no price in MODEL_PRICES
+
+    @staticmethod
+    def price(model: str, prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int) -> float | None:
+        model_price = get_model_price(model)
+        if model_price is None:
+            logging.warning("No price for model %s, add it to MODEL_PRICES", model)
+            return None
+        return ((prompt_tokens - cached_prompt_tokens) * model_price.input
+                + cached_prompt_tokens * model_price.cached_input
+                + completion_tokens * model_price.output) / 1000000
+
+
+@dataclass
+class UsageTracker:
+    """
+    Collects the token usage of every run of a session from the completed run that the run streams already receive,
+    so the usage and cost are attributed per agent and per iteration without any extra API calls.
+    """
+
+    runs: list[RunUsage] = field(default_factory=list)
+
+    def record_run(self, agent: str, iteration: int, run: Run) -> RunUsage | None:
+        if run.usage is None:
+            logging.warning("Run %s of the %s has no usage information", run.id, agent)
+            return None
+        # older versions of the openai package do not model the prompt token details, and keep them as a plain dict
+        prompt_token_details = getattr(run.usage, "prompt_token_details", None)
+        if isinstance(prompt_token_details, dict):
+            cached_prompt_tokens = prompt_token_details.get("cached_tokens") or 0
+        else:
+            cached_prompt_tokens = getattr(prompt_token_details, "cached_tokens", 0) or 0
+        latency = None
+        if run.completed_at is not None and run.created_at is not None:
+            latency = run.completed_at - run.created_at
+        run_usage = RunUsage(
+            agent=agent,
+            iteration=iteration,
+            run_id=run.id,
+            model=run.model,
+            prompt_tokens=run.usage.prompt_tokens,
+            completion_tokens=run.usage.completion_tokens,
+            cached_prompt_tokens=cached_prompt_tokens,
+            latency=latency,
+            cost=RunUsage.price(run.model, run.usage.prompt_tokens, run.usage.completion_tokens, cached_prompt_tokens),
+        )
+        self.runs.append(run_usage)
+        return run_usage
+
+    def totals(self, agent: str | None = None, iteration: int | None = None) -> dict:
+        """Sum the usage of the runs, optionally only of a single agent and/or iteration."""
+        runs = [run for run in self.runs
+                if (agent is None or run.agent == agent) and (iteration is None or run.iteration == iteration)]
+        costs = [run.cost for run in runs]
+        return {
+            "runs": len(runs),
+            "prompt_tokens": sum(run.prompt_tokens for run in runs),
+            "completion_tokens": sum(run.completion_tokens for run in runs),
+            "cached_prompt_tokens": sum(run.cached_prompt_tokens for run in runs),
+            "latency": sum(run.latency or 0 for run in runs),
+            "cost": None if None in costs else sum(costs),
+        }
+
+    def report(self) -> dict:
+        agents = sorted({run.agent for run in self.runs})
+        iterations = sorted({run.iteration for run in self.runs})
+        return {
+            "total": self.totals(),
+            "per_agent": {agent: self.totals(agent=agent) for agent in agents},
+            "per_iteration": {iteration: {agent: self.totals(agent=agent, iteration=iteration) for agent in agents}
+                              for iteration in iterations},
+            # the context every agent read per iteration, flat when the context is bounded and growing when the whole thread is read
+            "prompt_tokens_per_iteration": {agent: [self.totals(agent=agent, iteration=iteration)["prompt_tokens"] for iteration in iterations]
+                                            for agent in agents},
+            "runs": [asdict(run) for run in self.runs],
+        }
+
+    def write_report(self, path: str) -> None:
+        with open(path, mode="w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=4)
@@ -0,0 +1,35 @@
+import os
+
+# the group of the updated topology files, they are verified together so their consistency with each other is checked in one run
+TOPOLOGY_GROUP = "topology"
+REVIEW_TEXT_FIELDS = ("correctness", "identified_issues", "recommendations")
+
+
+def verification_groups(updated_attachments: list[str]) -> dict[str, list[str]]:
+    """
+    Split the updated files of an iteration into the groups the fan-out verifier checks in parallel runs, by the group name:
+    the topology files (JSON, as in pre_verifier.py) form a single group, every other file is a group of its own.
+    """
+    groups: dict[str, list[str]] = {}
+    for path in updated_attachments:
+        group = TOPOLOGY_GROUP if path.endswith(".json") else os.path.basename(path)
+        groups.setdefault(group, []).append(path)
+    return groups
+
+
+def merge_reviews(reviews: dict[str, dict]) -> dict:
+    """
+    Merge the reviews of the groups into a single review with the same JSON fields as the review of a single verifier run.
+    The text of every group is prefixed with its name, the implementation is approved only if every group was approved.
+    """
+    merged = {}
+    for text_field in REVIEW_TEXT_FIELDS:
+        merged[text_field] = "\n".join(f"[{group}] {review.get(text_field, '')}" for group, review in reviews.items())
+    verified_files = []
+    for review in reviews.values():
+        for file_name in review.get("verified_files") or []:
+            if file_name not in verified_files:
+                verified_files.append(file_name)
+    merged["verified_files"] = verified_files
+    merged["approval"] = all(bool(review.get("approval")) for review in reviews.values())
+    return merged
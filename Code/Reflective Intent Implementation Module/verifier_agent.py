@@ -1,5 +1,5 @@
 import asyncio
-from typing import Any, Callable, List
+from typing import Any, Callable, List, Mapping
 from message_protocol import(
     ImplementationTask,
     ImplementationResult,
@@ -9,11 +9,24 @@ from message_protocol import(
 import os
 import aiofiles
 from openai import AsyncAssistantEventHandler, AsyncClient
+from openai.types.beta import Thread
 import json
 import shutil
+import time
 
 from typing import Dict, List
-from global_variables import GlobalVariables
+from file_upload_cache import FileUploadCache
+from attachment_uploader import upload_attachments
+from pre_verifier import pre_verify, pre_verification_review
+from verifier_inputs import build_diff_inputs
+from llm_cache import LLMRunCache, RecordedRun, hash_files, run_cache_key
+from session_budget import review_fingerprint
+from session_checkpoint import SessionCheckpoints, encode_message, decode_message
+from session_context import SessionContext, sessions
+from verification_fanout import verification_groups, merge_reviews
+from verifier_context import CONTEXT_MODES, review_summary
+import tracing
+import logging
 
 from autogen_core import AgentId, MessageContext, RoutedAgent, TopicId, default_subscription, message_handler
 
@@ -29,15 +42,48 @@ class VerifierAgent(RoutedAgent):
         description: str,
         client: AsyncClient,
         assistant_id: str,
-        thread_id: str,
+        thread_id: str | None, # None to use the verifier thread of the session of the first message (an agent per session)
         assistant_event_handler_factory: Callable[[], AsyncAssistantEventHandler],
+        file_cache: FileUploadCache,
+        max_parallel_uploads: int = 8,
+        pre_verification: bool = True, # check the updated files locally for obvious errors before calling the verifier assistant
+        input_mode: str = "full", # "full" attaches all of the files every iteration, "diff" sends the changes of the updated files in the prompt
+                                  # and attaches only the updated files, for the verifier to search when a diff is not enough
+        run_cache: LLMRunCache | None = None, # replays recorded runs instead of running the assistant, None to always run it
+        instructions_hash: str = "", # the hash of the assistant's instructions, part of the run cache keys
+        checkpoints: SessionCheckpoints | None = None, # saves the state of the session after every step, None to not checkpoint
+        topic_type: str = "default", # the topic type the agent publishes the messages of the loop to
+        fanout: bool = False, # verify every group of updated files (see verification_fanout.py) in a parallel run and merge the reviews
+        context_mode: str = "session", # "session", "fresh" or "compact", see verifier_context.py
+        compact_after: int = 3, # the iterations on a thread before the "compact" mode starts a new one
+        compact_summary_chars: int = 2000, # the size of the summary of the earlier reviews in the "compact" mode
     ) -> None:
         super().__init__(description)
+        if input_mode not in ("full", "diff"):
+            raise ValueError(f"Unknown verifier input mode: {input_mode}")
+        if context_mode not in CONTEXT_MODES:
+            raise ValueError(f"Unknown verifier context mode: {context_mode}")
         self._client = client
         self._assistant_id = assistant_id
         self._thread_id = thread_id
         self._assistant_event_handler_factory = assistant_event_handler_factory
         self._session_memory: Dict[str, List[ImplementationReviewTask | ImplementationReviewResult]] = {}
+        self._file_cache = file_cache
+        self._max_parallel_uploads = max_parallel_uploads
+        self._pre_verification = pre_verification
+        self._input_mode = input_mode
+        self._sessions_with_originals: set[str] = set() # sessions whose original files were already attached to the verifier thread
+        self._run_cache = run_cache
+        self._instructions_hash = instructions_hash
+        self._run_cache_key = "" # the key of the last run on the thread, the key of every run chains the key before it
+        self._checkpoints = checkpoints
+        self._topic_type = topic_type
+        self._fanout = fanout
+        self._group_run_cache_keys: Dict[str, str] = {} # the run cache key of the last run on every group thread of the fan-out
+        self._context_mode = context_mode
+        self._compact_after = compact_after
+        self._compact_summary_chars = compact_summary_chars
+        self._thread_iterations = 0 # the iterations that were verified on the current verifier thread
 
 
     @message_handler
@@ -60,7 +106,57 @@ class VerifierAgent(RoutedAgent):
         updated_attachments_basenames = [os.path.basename(attachment) for attachment in message.updated_attachments]
         
         self._session_memory.setdefault(message.session_id, []).append(message)
+
+        session = sessions.get(message.session_key) # get the state of this implementation session
+        if self._thread_id is None:
+            self._thread_id = session.verifier_thread_id
+        if self._pre_verification:
+            with tracing.span("pre_verify", session, agent="verifier") as pre_verify_span:
+                created_files_dir = f"{session.current_run_dir_path()}/All_assistant_files" # every file created by the create_file tool
+                created_files = os.listdir(created_files_dir) if os.path.isdir(created_files_dir) else []
+                problems = await pre_verify(message.original_attachments, message.updated_attachments, message.implementation, created_files)
+                pre_verify_span["problems"] = len(problems)
+            if problems:
+                # obvious errors go straight back to the implementation assistant, the verifier assistant is not called
+                logging.info("Pre-verification of %s (iteration %d) found %d problem(s), skipping the verifier run",
+                             session.session_key(), session.get_iteration(), len(problems))
+                review = pre_verification_review(problems) # not fingerprinted, only the reviews of the verifier count towards convergence
+                review_text = "\n".join([f"{k}:{v}" for k,v in review.items()])
+                implementation_review_result = ImplementationReviewResult(session_id=message.session_id, intent=message.intent, review=review_text, approved=False, session_key=session.session_key())
+                self._session_memory.setdefault(message.session_id, []).append(implementation_review_result)
+                if self._checkpoints is not None:
+                    await self._checkpoints.save(self.runtime, "review", session, implementation_review_result)
+                await self.publish_message(implementation_review_result, topic_id=TopicId(self._topic_type, self.id.key), cancellation_token=ctx.cancellation_token)
+                return
+        if self._thread_iterations > 0 and (self._context_mode == "fresh" or
+                                            (self._context_mode == "compact" and self._thread_iterations >= self._compact_after)):
+            # the new thread starts without the earlier turns, so the prompt of this run does not grow with the iterations
+            await self._start_new_thread(message, session)
+            if self._context_mode == "compact":
+                earlier_reviews = [m.review for m in self._session_memory[message.session_id] if isinstance(m, ImplementationReviewResult)]
+                previous_feedback = review_summary(earlier_reviews[:-1], max_chars=self._compact_summary_chars) + previous_feedback
         
+        groups = verification_groups(message.updated_attachments) if self._fanout else {}
+        fanout = len(groups) > 1 # a single group is verified on the verifier thread, the same as without the fan-out
+        updated_files_changes = ""
+        if self._input_mode == "diff" and not fanout:
+            # the updated files are described by their diffs, which are much shorter than the full configuration files.
+            # the full updated files are attached, not inlined, so the verifier can still search them when a diff is not enough.
+            # the original files are attached only to the first message, they stay searchable in the verifier thread.
+            with tracing.span("build_diff_inputs", session, agent="verifier"):
+                diff_inputs = await build_diff_inputs(message.original_attachments, message.updated_attachments,
+                                                      session.current_run_dir_path(), session.get_iteration())
+            updated_files_changes = f"""The changes in the updated files (unified diffs against the original files and against their previous versions, new files are given in full),
+        the full updated files are attached for file search:\n
+        {diff_inputs}\n"""
+            if message.session_id in self._sessions_with_originals:
+                all_attachments = list(message.updated_attachments)
+            else:
+                all_attachments = message.original_attachments + message.updated_attachments
+                self._sessions_with_originals.add(message.session_id)
+        else:
+            all_attachments = message.original_attachments + message.updated_attachments
+
         prompt = f"""The problem statement is:\n{message.intent}.\n
         The answer of the Implementation Assistant is:\n
         '{message.implementation}'\n
@@ -68,45 +164,100 @@ class VerifierAgent(RoutedAgent):
         {original_attachments_basenames}
         The updated files are:\n
         {updated_attachments_basenames}\n
+        {updated_files_changes}
         {previous_feedback}\n
         Please verify the correctness of the implementation and that the intent was fully implemented. If previous feedback was provided, see if it was addressed.
         """
 
-        assistant_attachments = []
-        all_attachments = message.original_attachments + message.updated_attachments
-        for attachment in all_attachments:
-            async with aiofiles.open(attachment, mode="rb") as file:
-                file_content = await ctx.cancellation_token.link_future(asyncio.ensure_future(file.read()))
-            file_name = os.path.basename(attachment)
-            # Upload the file.
-            oai_file = await ctx.cancellation_token.link_future(
-                asyncio.ensure_future(self._client.files.create(file=(file_name, file_content), purpose="assistants"))
+        if fanout:
+            # every group of updated files is verified in its own run at the same time, and their reviews are merged
+            review = await self._fanout_review(message, groups, previous_feedback, session, ctx)
+        else:
+            # the thread of the verifier holds all of the reviews of the session, the key of every run chains the key before it
+            review, self._run_cache_key = await self._verifier_run(self._thread_id, prompt, all_attachments, self._run_cache_key, session, ctx)
+        self._thread_iterations += 1
+        output_dir_path = session.current_run_dir_path()
+        # if the approved file is from one of the previous iterations - add it to the current iteration directory
+        if "verified_files" not in review:
+            review["verified_files"] = []
+        with tracing.span("file_copy", session, agent="verifier", files=len(review["verified_files"])):
+            for approved_file in review["verified_files"]:
+                if not os.path.exists(f"{output_dir_path}/iteration_{session.get_iteration()}/assistant_files/{approved_file}"):
+                    src = f"{output_dir_path}/All_assistant_files/{approved_file}"
+                    dst = f"{output_dir_path}/iteration_{session.get_iteration()}/assistant_files/{approved_file}"
+                    shutil.copyfile(src, dst)
+        session.review_fingerprints.append(review_fingerprint(review)) # the implementation agent stops the session when the reviews repeat
+        review_text = "\n".join([f"{k}:{v}" for k,v in review.items()])
+        approved = review["approval"]
+        implementation_review_result = ImplementationReviewResult(session_id=message.session_id, intent=message.intent, review=review_text, approved=approved, session_key=session.session_key())
+        self._session_memory.setdefault(message.session_id, []).append(implementation_review_result)
+
+        if self._checkpoints is not None:
+            await self._checkpoints.save(self.runtime, "review", session, implementation_review_result)
+        await self.publish_message(implementation_review_result, topic_id=TopicId(self._topic_type, self.id.key), cancellation_token=ctx.cancellation_token)
+
+
+    async def _verifier_run(self, thread_id: str, prompt: str, attachments: list[str], previous_run_cache_key: str, session: SessionContext,
+                            ctx: MessageContext, group: str | None = None) -> tuple[dict, str]:
+        """Send the prompt with its attachments to a verifier thread and run the assistant on it, returns its review and the run cache key of the run."""
+        span_attributes = {"agent": "verifier"} if group is None else {"agent": "verifier", "group": group}
+        # Upload all of the files at once (the original files are uploaded only once for all of the iterations).
+        with tracing.span("upload_attachments", session, files=len(attachments), **span_attributes):
+            assistant_attachments, upload_timings = await ctx.cancellation_token.link_future(
+                asyncio.ensure_future(upload_attachments(attachments, self._file_cache, self._max_parallel_uploads, session=session, agent="verifier"))
             )
-            assistant_attachments.append({"file_id": oai_file.id, "tools": [{"type": "file_search"}]})
-
-        await ctx.cancellation_token.link_future(
-            asyncio.ensure_future(
-                self._client.beta.threads.messages.create(
-                    thread_id=self._thread_id,
-                    content=prompt,
-                    role="user",
-                    attachments = assistant_attachments,
-                    metadata={"sender": "Intent Implementation Assistant"},
+
+        with tracing.span("messages_create", session, **span_attributes):
+            await ctx.cancellation_token.link_future(
+                asyncio.ensure_future(
+                    self._client.beta.threads.messages.create(
+                        thread_id=thread_id,
+                        content=prompt,
+                        role="user",
+                        attachments = assistant_attachments,
+                        metadata={"sender": "Intent Implementation Assistant"},
+                    )
                 )
             )
-        )
+        recorded_run = None
+        run_cache_key_of_run = previous_run_cache_key
+        if self._run_cache is not None:
+            run_cache_key_of_run = run_cache_key(previous_run_cache_key, "verifier", self._instructions_hash, session.model, prompt, hash_files(attachments))
+            recorded_run = await self._run_cache.get(run_cache_key_of_run)
         # Generate a response.
-        async with self._client.beta.threads.runs.stream(
-            thread_id=self._thread_id,
-            assistant_id=self._assistant_id,
-            event_handler=self._assistant_event_handler_factory(),
-        ) as stream:
-            await ctx.cancellation_token.link_future(asyncio.ensure_future(stream.until_done()))
+        with tracing.span("run", session, replayed=recorded_run is not None, **span_attributes) as run_span:
+            if recorded_run is not None:
+                # the recorded review is added to the thread, the same as the answer of a live run
+                for assistant_message in recorded_run.assistant_messages():
+                    await self._client.beta.threads.messages.create(thread_id=thread_id, content=assistant_message,
+                                                                    role="assistant", metadata={"sender": "LLM run cache"})
+            else:
+                run_start_time = time.time()
+                event_handler = self._assistant_event_handler_factory()
+                event_handler.stream_to(session, "verifier" if group is None else f"verifier {group}")
+                async with self._client.beta.threads.runs.stream(
+                    thread_id=thread_id,
+                    assistant_id=self._assistant_id,
+                    event_handler=event_handler,
+                ) as stream:
+                    await ctx.cancellation_token.link_future(asyncio.ensure_future(stream.until_done()))
+                    # the last run snapshot of the stream is the completed run, which holds the token usage of the run
+                    completed_run = stream.current_run
+                first_token_time = getattr(stream, "first_token_time", None)
+                if first_token_time is not None:
+                    tracing.record_span("time_to_first_token", run_start_time, first_token_time - run_start_time, session, **span_attributes)
+                if completed_run is not None:
+                    run_usage = session.usage.record_run("verifier", session.get_iteration(), completed_run)
+                    if run_usage is not None:
+                        run_span["prompt_tokens"] = run_usage.prompt_tokens # the context the run read, it grows with the thread
+                    if self._run_cache is not None and completed_run.status == "completed" and getattr(stream, "events", None):
+                        await self._run_cache.put(RecordedRun(key=run_cache_key_of_run, agent="verifier", events=stream.events))
 
         # Get the last message.
-        messages = await ctx.cancellation_token.link_future(
-            asyncio.ensure_future(self._client.beta.threads.messages.list(self._thread_id, order="desc", limit=1))
-        )
+        with tracing.span("messages_fetch", session, **span_attributes):
+            messages = await ctx.cancellation_token.link_future(
+                asyncio.ensure_future(self._client.beta.threads.messages.list(thread_id, order="desc", limit=1))
+            )
         last_message = messages.data[0].content[0].text.value
         # Parse the response JSON.
         # review_json:"correctness": {"type": "string"},
@@ -116,20 +267,82 @@ class VerifierAgent(RoutedAgent):
         #             "approval":{"type":"boolean"}
 
         #         },
-        review = json.loads(last_message)
-        global_var = GlobalVariables() # get the global variables instance
-        output_dir_path = global_var.current_run_dir_path()
-        # if the approved file is from one of the previous iterations - add it to the current iteration directory
-        if "verified_files" not in review:
-            review["verified_files"] = []
-        for approved_file in review["verified_files"]:
-            if not os.path.exists(f"{output_dir_path}/iteration_{global_var.get_iteration()}/assistant_files/{approved_file}"):
-                src = f"{output_dir_path}/All_assistant_files/{approved_file}"
-                dst = f"{output_dir_path}/iteration_{global_var.get_iteration()}/assistant_files/{approved_file}"
-                shutil.copyfile(src, dst)
-        review_text = "\n".join([f"{k}:{v}" for k,v in review.items()])
-        approved = review["approval"]
-        implementation_review_result = ImplementationReviewResult(session_id=message.session_id, intent=message.intent, review=review_text, approved=approved)
-        self._session_memory.setdefault(message.session_id, []).append(implementation_review_result)
+        return json.loads(last_message), run_cache_key_of_run
+
+    async def _create_thread(self, metadata: dict | None = None) -> Thread:
+        # file search needs a vector store on the thread, as on the thread the session started with (create_assistant_thread in main.py)
+        vector_store = await self._client.vector_stores.create()
+        return await self._client.beta.threads.create(tool_resources={"file_search": {"vector_store_ids": [vector_store.id]}},
+                                                      metadata=metadata or {})
+
+    async def _start_new_thread(self, message: ImplementationReviewTask, session: SessionContext) -> None:
+        with tracing.span("create_thread", session, agent="verifier", context_mode=self._context_mode):
+            thread = await self._create_thread()
+        self._thread_id = session.verifier_thread_id = thread.id
+        self._thread_iterations = 0
+        self._run_cache_key = "" # the conversation of the new thread starts here
+        self._sessions_with_originals.discard(message.session_id) # the original files are attached to the new thread again
+        session.verifier_group_threads = {} # the threads of the fan-out groups are replaced as well
+
+    async def _fanout_review(self, message: ImplementationReviewTask, groups: dict[str, list[str]], previous_feedback: str, session: SessionContext,
+                             ctx: MessageContext) -> dict:
+        """
+        Verify every group of updated files in a parallel run on a thread of its own, and merge their reviews into a single review.
+        The thread of a group is kept for the whole session, so its run sees its previous reviews and the original files are attached to it only once.
+        """
+        original_attachments_basenames = [os.path.basename(attachment) for attachment in message.original_attachments]
+        updated_attachments_basenames = [os.path.basename(attachment) for attachment in message.updated_attachments]
+
+        async def review_group(group: str, group_attachments: list[str]) -> dict:
+            attachments = list(group_attachments) # attached in the "diff" mode as well, for file search
+            thread_id = session.verifier_group_threads.get(group)
+            if thread_id is None:
+                with tracing.span("create_thread", session, agent="verifier", group=group):
+                    thread = await self._create_thread(metadata={"group": group})
+                thread_id = session.verifier_group_threads[group] = thread.id
+                attachments = list(message.original_attachments) + attachments
+            updated_files_changes = ""
+            if self._input_mode == "diff":
+                with tracing.span("build_diff_inputs", session, agent="verifier", group=group):
+                    diff_inputs = await build_diff_inputs(message.original_attachments, group_attachments,
+                                                          session.current_run_dir_path(), session.get_iteration())
+                updated_files_changes = f"""The changes in the files to verify (unified diffs against the original files and against their previous versions, new files are given in full),
+        the full files to verify are attached for file search:\n
+        {diff_inputs}\n"""
+            prompt = f"""The problem statement is:\n{message.intent}.\n
+        The answer of the Implementation Assistant is:\n
+        '{message.implementation}'\n
+        The original files before implementations are:\n
+        {original_attachments_basenames}
+        All of the updated files are:\n
+        {updated_attachments_basenames}\n
+        Verify only these updated files, the other updated files are verified separately:\n
+        {[os.path.basename(attachment) for attachment in group_attachments]}\n
+        {updated_files_changes}
+        {previous_feedback}\n
+        Please verify the correctness of these files and that their part of the intent was fully implemented. If previous feedback was provided, see if it was addressed.
+        """
+            review, self._group_run_cache_keys[thread_id] = await self._verifier_run(
+                thread_id, prompt, attachments, self._group_run_cache_keys.get(thread_id, ""), session, ctx, group=group)
+            return review
+
+        with tracing.span("fanout_review", session, agent="verifier", groups=len(groups)):
+            reviews = await asyncio.gather(*(review_group(group, group_attachments) for group, group_attachments in groups.items()))
+        return merge_reviews(dict(zip(groups, reviews)))
+
+    async def save_state(self) -> Mapping[str, Any]:
+        # the state a resumed session needs to continue on the same thread (see session_checkpoint.py)
+        return {
+            "session_memory": {session_id: [encode_message(m) for m in messages] for session_id, messages in self._session_memory.items()},
+            "sessions_with_originals": sorted(self._sessions_with_originals),
+            "run_cache_key": self._run_cache_key,
+            "group_run_cache_keys": self._group_run_cache_keys,
+            "thread_iterations": self._thread_iterations,
+        }
 
-        await self.publish_message(implementation_review_result, topic_id=TopicId("default", self.id.key))
\ No newline at end of file
+    async def load_state(self, state: Mapping[str, Any]) -> None:
+        self._session_memory = {session_id: [decode_message(m) for m in messages] for session_id, messages in state["session_memory"].items()}
+        self._sessions_with_originals = set(state["sessions_with_originals"])
+        self._run_cache_key = state["run_cache_key"]
+        self._group_run_cache_keys = dict(state.get("group_run_cache_keys", {}))
+        self._thread_iterations = state.get("thread_iterations", 0)
@@ -0,0 +1,39 @@
+import re
+
+# how the verifier's context grows over the iterations of a session:
+# "session" keeps a single thread for the whole session (every run reads all of the earlier prompts, reviews and files),
+# "fresh" starts a new thread every iteration, with the previous review in the prompt and only the current files,
+# "compact" starts a new thread once a thread has compact_after iterations, with a summary of the earlier reviews in the prompt
+CONTEXT_MODES = ("session", "fresh", "compact")
+REVIEW_FIELD_PATTERN = re.compile(r"^(correctness|identified_issues|recommendations|verified_files|approval):", re.MULTILINE)
+
+
+def parse_review_text(review_text: str) -> dict[str, str]:
+    """The fields of a review in its "key:value" text form (the form the reviews are sent to the implementer in)."""
+    parts = REVIEW_FIELD_PATTERN.split(review_text)
+    # parts[0] is whatever came before the first field, then the fields alternate with their values
+    return {key: value.strip() for key, value in zip(parts[1::2], parts[2::2])}
+
+
+def review_summary(review_texts: list[str], max_issue_chars: int = 500, max_chars: int = 2000) -> str:
+    """
+    A short summary of the earlier reviews of a session: the approval and the identified issues of every round.
+    The summary is at most about max_chars long, the latest rounds are kept and the older ones are only counted.
+    """
+    if not review_texts:
+        return ""
+    header = "Summary of the earlier verification rounds of this implementation (their full reviews are not repeated):"
+    round_lines = []
+    length = len(header)
+    for round_number in range(len(review_texts), 0, -1):
+        review = parse_review_text(review_texts[round_number - 1])
+        issues = review.get("identified_issues", "")
+        if len(issues) > max_issue_chars:
+            issues = f"{issues[:max_issue_chars]}..."
+        line = f"- round {round_number} (approval: {review.get('approval', 'unknown')}): {issues}"
+        if round_lines and length + len(line) + 1 > max_chars: # the latest round is always kept
+            round_lines.append(f"- rounds 1 to {round_number}: omitted")
+            break
+        round_lines.append(line)
+        length += len(line) + 1
+    return "\n".join([header, *reversed(round_lines)]) + "\n"
@@ -0,0 +1,115 @@
+import difflib
+import json
+import os
+import re
+
+from pre_verifier import HOSTNAME_PATTERN, read_text
+
+END_LINE_PATTERN = re.compile(r"^end\s*$")
+
+
+def split_device_sections(config: str) -> dict[str, str]:
+    """
+    Split a configuration file of several devices (i.e. Total_Configs.txt) into the configuration of each device by its hostname.
+    A device configuration ends with an "end" line, or at the start of the next device if there are no "end" lines.
+    """
+    blocks = []
+    block = []
+    for line in config.splitlines(keepends=True):
+        block.append(line)
+        if END_LINE_PATTERN.match(line):
+            blocks.append("".join(block))
+            block = []
+    if block:
+        blocks.append("".join(block))
+    if len(blocks) <= 1:
+        # no "end" lines, every hostname line starts a new device
+        starts = [match.start() for match in re.finditer(r"^hostname\s", config, re.MULTILINE)]
+        if starts:
+            starts[0] = 0 # lines before the first hostname belong to the first device
+            blocks = [config[start:end] for start, end in zip(starts, starts[1:] + [len(config)])]
+    sections = {}
+    for block in blocks:
+        hostnames = HOSTNAME_PATTERN.findall(block)
+        if hostnames:
+            sections[hostnames[0]] = block
+    return sections
+
+
+def normalize_for_diff(file_name: str, content: str) -> str:
+    # JSON files are pretty printed, so files that were written on a single line are compared line by line as well
+    if file_name.endswith(".json"):
+        try:
+            return json.dumps(json.loads(content), indent=2) + "\n"
+        except json.decoder.JSONDecodeError:
+            pass
+    return content
+
+
+def unified_diff(before: str, after: str, before_name: str, after_name: str) -> str:
+    return "".join(difflib.unified_diff(before.splitlines(keepends=True), after.splitlines(keepends=True),
+                                        fromfile=before_name, tofile=after_name, n=3))
+
+
+def previous_iteration_file(output_dir_path: str, iteration: int, file_name: str) -> str | None:
+    """The path of the last version of a file from the iterations before the given one, None if there is no such version."""
+    for previous_iteration in range(iteration - 1, 0, -1):
+        path = f"{output_dir_path}/iteration_{previous_iteration}/assistant_files/{file_name}"
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+async def build_diff_inputs(original_attachments: list[str], updated_attachments: list[str], output_dir_path: str, iteration: int) -> str:
+    """
+    Describe the updated files of an iteration as unified diffs against their original counterpart
+    (the original topology, or the configurations of the same devices in the original configuration files)
+    and against their version from the previous iterations. A file with no counterpart, or whose diff is longer than
+    the file itself, is given in full.
+    """
+    original_topologies = []
+    original_devices = {}
+    for path in original_attachments:
+        if not os.path.isfile(path):
+            continue
+        content = await read_text(path)
+        if path.endswith(".json"):
+            original_topologies.append((os.path.basename(path), normalize_for_diff(path, content)))
+        else:
+            original_devices.update({hostname: (os.path.basename(path), section)
+                                     for hostname, section in split_device_sections(content).items()})
+
+    inputs = []
+    for path in updated_attachments:
+        file_name = os.path.basename(path)
+        if not os.path.isfile(path):
+            inputs.append(f"=== {file_name} (the file does not exist) ===\n")
+            continue
+        content = normalize_for_diff(file_name, await read_text(path))
+        diffs = []
+        # against the original files
+        if file_name.endswith(".json") and original_topologies:
+            original_name, original_content = original_topologies[0]
+            diffs.append(unified_diff(original_content, content, f"original/{original_name}", f"updated/{file_name}") or "(identical to the original)\n")
+        else:
+            hostnames = HOSTNAME_PATTERN.findall(content)
+            if hostnames and any(hostname in original_devices for hostname in hostnames):
+                # new devices have no original configuration, their whole configuration shows as added
+                original_content = "".join(original_devices[hostname][1] for hostname in hostnames if hostname in original_devices)
+                original_names = sorted({original_devices[hostname][0] for hostname in hostnames if hostname in original_devices})
+                diffs.append(unified_diff(original_content, content, f"original/{','.join(original_names)} ({', '.join(hostnames)})", f"updated/{file_name}")
+                             or "(identical to the original)\n")
+        # against the previous iteration
+        previous_path = previous_iteration_file(output_dir_path, iteration, file_name)
+        if previous_path is not None:
+            previous_content = normalize_for_diff(file_name, await read_text(previous_path))
+            if previous_content == content:
+                diffs.append("(unchanged since the previous iteration)\n")
+            else:
+                diffs.append(unified_diff(previous_content, content, f"previous_iteration/{file_name}", f"updated/{file_name}"))
+
+        if not diffs or sum(len(diff) for diff in diffs) >= len(content):
+            inputs.append(f"=== {file_name} (full file) ===\n{content}")
+        else:
+            inputs.append(f"=== {file_name} (diff) ===\n" + "\n".join(diffs))
+    return "\n".join(inputs)
@@ -0,0 +1,142 @@
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import uuid
+from dataclasses import dataclass
+
+from PIL import Image
+
+
+@dataclass(frozen=True)
+class ImageProfile:
+    # the largest image the model reads at "detail": "high", a bigger diagram is downscaled by the provider anyway
+    max_side: int # the longest side, in pixels
+    max_short_side: int | None = None # the shortest side, in pixels (OpenAI scales the shortest side to 768 after fitting in 2048x2048)
+    quality: int = 90 # the JPEG quality of the downscaled variant
+
+    def key(self) -> str:
+        return f"{self.max_side}_{self.max_short_side or 0}_q{self.quality}"
+
+
+DEFAULT_PROFILE = ImageProfile(max_side=2048)
+OPENAI_PROFILE = ImageProfile(max_side=2048, max_short_side=768)
+# the preprocessing of every vision model of topology_understanding.MODELS, the other models use DEFAULT_PROFILE
+IMAGE_PROFILES = {
+    "gpt-4.1-mini": OPENAI_PROFILE,
+    "o4-mini": OPENAI_PROFILE,
+    "gpt-4o-mini": OPENAI_PROFILE,
+    "Llama_3.2_11B_Vision_Instruct": ImageProfile(max_side=1120), # a 2x2 grid of 560 pixel tiles
+    "llama-3.2-90b-vision-instruct": ImageProfile(max_side=1120),
+    "gemini-2.5-flash": ImageProfile(max_side=3072),
+    "gemini_2.0_Flash": ImageProfile(max_side=3072),
+}
+
+
+@dataclass
+class ImageCacheStats:
+    hits: int = 0
+    misses: int = 0
+    downscaled: int = 0
+    original_bytes: int = 0 # the sizes of the images and of the variants that were sent instead, on misses
+    sent_bytes: int = 0
+
+    def report(self) -> str:
+        return (f"Image cache: {self.hits} hits, {self.misses} misses, {self.downscaled} downscaled, "
+                f"{self.original_bytes / 1e6:.1f} MB of images sent as {self.sent_bytes / 1e6:.1f} MB")
+
+
+def scaled_size(width: int, height: int, profile: ImageProfile) -> tuple[int, int]:
+    scale = min(1.0, profile.max_side / max(width, height))
+    if profile.max_short_side is not None:
+        scale = min(scale, profile.max_short_side / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def preprocess_image(image_bytes: bytes, profile: ImageProfile) -> tuple[bytes, bool]:
+    """The JPEG the model is sent for the image, and whether it was downscaled (an image that fits the profile is sent as is)."""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        size = scaled_size(image.width, image.height, profile)
+        if size == (image.width, image.height) and image.format == "JPEG":
+            return image_bytes, False
+        output = io.BytesIO()
+        image.convert("RGB").resize(size, Image.LANCZOS).save(output, format="JPEG", quality=profile.quality, optimize=True)
+        return output.getvalue(), size != (image.width, image.height)
+
+
+class ImageCache:
+    """
+    A cache of the preprocessed diagrams, keyed by the hash of the image content and the profile of the model.
+    The variants are kept as JPEG files in cache_dir (so later runs and the other models with the same profile reuse them),
+    and their base64 payloads are kept in memory for the requests of this run.
+    A diagram is read and hashed once per run, as long as its file is not modified.
+    """
+
+    def __init__(self, cache_dir: str = "Vision_results/image_cache", profiles: dict[str, ImageProfile] = IMAGE_PROFILES) -> None:
+        self.cache_dir = cache_dir
+        self.profiles = profiles
+        self.stats = ImageCacheStats()
+        self._hashes: dict[tuple[str, float, int], str] = {} # (path, mtime, size) -> the hash of the image content
+        self._payloads: dict[str, str] = {} # variant key -> its base64 payload
+        self._pending: dict[str, asyncio.Future] = {} # the variants that are being prepared, so concurrent requests prepare them once
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def profile(self, model: str) -> ImageProfile:
+        return self.profiles.get(model, DEFAULT_PROFILE)
+
+    def _image_hash(self, image_path: str) -> tuple[str, bytes | None]:
+        stat = os.stat(image_path)
+        file_key = (image_path, stat.st_mtime, stat.st_size)
+        if file_key in self._hashes:
+            return self._hashes[file_key], None
+        with open(image_path, "rb") as f:
+            image_bytes = f.read()
+        self._hashes[file_key] = hashlib.sha256(image_bytes).hexdigest()
+        return self._hashes[file_key], image_bytes
+
+    def _prepare(self, image_path: str, profile: ImageProfile) -> tuple[str, str]:
+        # runs in a worker thread: returns the variant key and its payload, reading the variant from the disk or preprocessing the image
+        image_hash, image_bytes = self._image_hash(image_path)
+        key = f"{image_hash}_{profile.key()}"
+        if key in self._payloads:
+            self.stats.hits += 1
+            return key, self._payloads[key]
+        variant_path = f"{self.cache_dir}/{key}.jpg"
+        if os.path.isfile(variant_path):
+            self.stats.hits += 1
+            with open(variant_path, "rb") as f:
+                return key, base64.b64encode(f.read()).decode("utf-8")
+        self.stats.misses += 1
+        if image_bytes is None:
+            with open(image_path, "rb") as f:
+                image_bytes = f.read()
+        variant_bytes, downscaled = preprocess_image(image_bytes, profile)
+        self.stats.downscaled += downscaled
+        self.stats.original_bytes += len(image_bytes)
+        self.stats.sent_bytes += len(variant_bytes)
+        temp_path = f"{variant_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(variant_bytes)
+        os.replace(temp_path, variant_path) # atomic, another run may read the variant at the same time
+        return key, base64.b64encode(variant_bytes).decode("utf-8")
+
+    async def payload(self, image_path: str, model: str) -> str:
+        """The base64 JPEG payload of the diagram, preprocessed for the model."""
+        profile = self.profile(model)
+        pending_key = f"{image_path}_{profile.key()}"
+        if pending_key in self._pending:
+            return await asyncio.shield(self._pending[pending_key])
+        future = asyncio.get_running_loop().create_future()
+        self._pending[pending_key] = future
+        try:
+            key, payload = await asyncio.to_thread(self._prepare, image_path, profile)
+            self._payloads[key] = payload
+            future.set_result(payload)
+            return payload
+        except Exception as e:
+            future.set_exception(e)
+            future.exception() # marks the error as retrieved, it is raised here and to the waiting requests (if any)
+            raise
+        finally:
+            del self._pending[pending_key]
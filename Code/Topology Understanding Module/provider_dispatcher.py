@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import random
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator
+
+import httpx
+
+# the statuses of the requests that are sent again after a backoff (rate limits, timeouts and provider outages)
+RETRY_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504, 520, 524, 529}
+
+
+@dataclass
+class ProviderLimits:
+    max_concurrent: int = 4 # requests to the provider at the same time
+    max_attempts: int = 5
+    base_delay: float = 2.0 # seconds, doubled on every attempt (with jitter), unless the provider sent Retry-After
+    max_delay: float = 60.0
+
+
+# the limits of the providers of topology_understanding.MODELS, the other providers use ProviderLimits()
+PROVIDER_LIMITS = {
+    "openai": ProviderLimits(max_concurrent=8),
+    "google-vertex": ProviderLimits(max_concurrent=8),
+    "google-ai-studio": ProviderLimits(max_concurrent=4),
+    "deepinfra/base": ProviderLimits(max_concurrent=4),
+    "deepinfra/bf16": ProviderLimits(max_concurrent=4),
+    "together/fp8": ProviderLimits(max_concurrent=4),
+    "lambda/fp8": ProviderLimits(max_concurrent=2),
+}
+
+
+@dataclass
+class ProviderStats:
+    requests: int = 0
+    retries: int = 0
+    failures: int = 0
+    backoff_seconds: float = 0.0
+
+
+@dataclass
+class DispatcherStats:
+    providers: dict[str, ProviderStats] = field(default_factory=dict)
+
+    def report(self) -> str:
+        lines = ["Provider dispatcher:"]
+        for provider_name, stats in sorted(self.providers.items()):
+            lines.append(f"- {provider_name}: {stats.requests} requests, {stats.retries} retries, {stats.failures} failures, "
+                         f"{stats.backoff_seconds:.0f}s of backoff")
+        return "\n".join(lines)
+
+
+def retry_after_seconds(response: httpx.Response) -> float | None:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+class ProviderDispatcher:
+    """
+    Sends the chat completion requests of the vision models to OpenRouter concurrently, with a concurrency limit per provider,
+    so the requests of all of the models of MODELS run at once without any provider getting more requests than it accepts.
+    A request holds one of the provider's slots only while it is sent, not during its backoff, so a request that waits to be
+    retried does not keep the other requests to the provider waiting. Failed requests (connection errors and the RETRY_STATUSES)
+    are sent again with an exponential backoff, and a rate limit pauses the new requests to the same provider until its backoff is over.
+    """
+
+    def __init__(self, http_client: httpx.AsyncClient, api_key: str, base_url: str = "https://openrouter.ai/api/v1",
+                 limits: dict[str, ProviderLimits] = PROVIDER_LIMITS) -> None:
+        self.http_client = http_client
+        self.api_key = api_key
+        self.base_url = base_url
+        self.limits = limits
+        self.stats = DispatcherStats()
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._paused_until: dict[str, float] = {} # provider -> the loop time its rate limit backoff ends
+
+    def provider_limits(self, provider_name: str) -> ProviderLimits:
+        return self.limits.get(provider_name, ProviderLimits())
+
+    def _provider_stats(self, provider_name: str) -> ProviderStats:
+        return self.stats.providers.setdefault(provider_name, ProviderStats())
+
+    @asynccontextmanager
+    async def _slot(self, provider_name: str) -> AsyncIterator[None]:
+        # one of the provider's concurrent request slots, held for a single HTTP request
+        if provider_name not in self._semaphores:
+            self._semaphores[provider_name] = asyncio.Semaphore(self.provider_limits(provider_name).max_concurrent)
+        async with self._semaphores[provider_name]:
+            yield
+
+    async def _wait_for_provider(self, provider_name: str) -> None:
+        delay = self._paused_until.get(provider_name, 0.0) - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def chat_completion(self, model_path: str, provider_name: str, conversation_history: list[dict],
+                              temperature: float = 1.0) -> tuple[dict | None, str]:
+        """
+        The same request and result as topology_understanding.api_call_to_prompt_model: the response JSON (None if there was
+        no successful response) and the error message ("" if there was no error).
+        """
+        limits = self.provider_limits(provider_name)
+        stats = self._provider_stats(provider_name)
+        error_message = ""
+        for attempt in range(limits.max_attempts):
+            await self._wait_for_provider(provider_name)
+            retry_after = None
+            rate_limited = False
+            try:
+                async with self._slot(provider_name):
+                    await self._wait_for_provider(provider_name) # a rate limit may have paused the provider while this request waited for its slot
+                    stats.requests += 1
+                    response = await self.http_client.post(
+                        f"{self.base_url}/chat/completions",
+                        headers={"Authorization": f"Bearer {self.api_key}"},
+                        json={
+                            "model": model_path,
+                            "messages": conversation_history,
+                            "provider": {"only": [provider_name]},
+                            "temperature": temperature,
+                            "response_format": {"type": "json_object"},
+                        },
+                    )
+            except httpx.HTTPError as e:
+                error_message = str(e) or type(e).__name__
+            else:
+                if response.status_code == 200:
+                    return response.json(), ""
+                try:
+                    error_message = response.json().get("error", {}).get("message", "No specific error message provided.")
+                except ValueError:
+                    error_message = f"status {response.status_code}"
+                if response.status_code not in RETRY_STATUSES:
+                    break
+                retry_after = retry_after_seconds(response)
+                rate_limited = response.status_code == 429
+            if attempt == limits.max_attempts - 1:
+                break
+            delay = retry_after if retry_after is not None else \
+                min(limits.max_delay, limits.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+            if rate_limited:
+                # a rate limit applies to all of the requests to the provider, the new ones wait as well
+                self._paused_until[provider_name] = max(self._paused_until.get(provider_name, 0.0), asyncio.get_running_loop().time() + delay)
+            logging.warning("Request to %s (%s) failed on attempt %d: %s, retrying in %.1f seconds", model_path, provider_name, attempt + 1, error_message, delay)
+            stats.retries += 1
+            stats.backoff_seconds += delay
+            await asyncio.sleep(delay)
+        stats.failures += 1
+        logging.warning("Request to %s (%s) failed: %s", model_path, provider_name, error_message)
+        return None, error_message
@@ -0,0 +1,51 @@
+import math
+
+import pytest
+
+from topology_diff import CanonicalTopology, batch_structural_scores, structural_score
+
+TOPOLOGY = {"nodes": [{"label": "R 1", "icon": "router"}, {"label": "PC1", "icon": "pc"}, {"label": "SW1", "icon": "ethernet_switch"}],
+            "links": [["R 1", "SW1", "Gi0/0", "e0"], ["SW1", "PC1", "e1", "e0"]]}
+EMPTY = {"nodes": [], "links": []}
+
+
+def canonical(topology: dict) -> CanonicalTopology:
+    return CanonicalTopology.from_topology(topology)
+
+
+def test_identical_topologies():
+    # the same topology with its links reversed and its labels in another case is identical once canonical
+    prediction = {"nodes": [{"label": "r1", "icon": "Router"}, {"label": "pc1", "icon": "pc"}, {"label": "sw1", "icon": "ethernet_switch"}],
+                  "links": [["sw1", "r1", "e0", "Gi0/0"], ["pc1", "sw1", "e0", "e1"]]}
+    scores = batch_structural_scores([(canonical(TOPOLOGY), canonical(TOPOLOGY)), (canonical(TOPOLOGY), canonical(prediction))])
+    assert scores["Edit_distance"].tolist() == [0, 0]
+    assert scores["Structural_Score"].tolist() == [1, 1]
+    assert scores["Invalid_icons"].tolist() == [0, 0]
+
+
+def test_empty_topologies():
+    scores = batch_structural_scores([(canonical(EMPTY), canonical(EMPTY)), (canonical(TOPOLOGY), canonical(EMPTY))])
+    # two empty topologies are the same, every node and link of the other topology is a missing item
+    assert scores.iloc[0].to_dict() == {"Node_edits": 0, "Link_edits": 0, "Edit_distance": 0, "Structural_Score": 1, "Invalid_icons": 0}
+    assert scores.iloc[1].to_dict() == {"Node_edits": 3, "Link_edits": 2, "Edit_distance": 5, "Structural_Score": 0, "Invalid_icons": 0}
+
+
+def test_none_pairs_are_not_scored():
+    pairs = [(None, canonical(TOPOLOGY)), (canonical(TOPOLOGY), canonical(TOPOLOGY)), (canonical(TOPOLOGY), None), (None, None)]
+    scores = batch_structural_scores(pairs)
+    assert len(scores) == len(pairs)
+    for index in (0, 2, 3):
+        assert all(math.isnan(value) for value in scores.iloc[index])
+    assert scores.iloc[1]["Structural_Score"] == 1
+
+
+def test_no_pairs():
+    assert batch_structural_scores([]).empty
+
+
+def test_partial_matches():
+    # a wrong icon and wrong interfaces cost half an edit, a hallucinated icon is counted as invalid
+    prediction = {"nodes": [{"label": "R1", "icon": "cloud"}, {"label": "PC1", "icon": "pc"}, {"label": "SW1", "icon": "firewall"}],
+                  "links": [["R1", "SW1", "Gi0/1", "e0"], ["SW1", "PC1", "e1", "e0"]]}
+    assert structural_score(TOPOLOGY, prediction) == pytest.approx(
+        {"Node_edits": 1.0, "Link_edits": 0.5, "Edit_distance": 1.5, "Structural_Score": 1 - 1.5 / 5, "Invalid_icons": 1})
@@ -0,0 +1,72 @@
+import pytest
+
+from topology_metrics import METRIC_KEYS, batch_comparison_metrics, get_comparison_metrics
+from topology_metrics_benchmark import reference_comparison_metrics, synthetic_pairs
+
+
+def topology(nodes: list[tuple[str, str]], links: list[list[str]]) -> dict:
+    return {"nodes": [{"label": label, "icon": icon} for label, icon in nodes], "links": links}
+
+
+# the notebook's results, worked out by hand from its get_comparison_metrics
+DUPLICATE_LABELS = (
+    topology([("R1", "router"), ("R1", "router"), ("PC1", "pc")], [["R1", "PC1", "e0", "e1"]]),
+    topology([("R1", "router"), ("PC1", "pc")], [["PC1", "R1", "e1", "e0"]]),
+    # both R1 of the ground truth pair with the R1 of the prediction, and each of their pairs is linked to the PC1 pair
+    {"N1": 3, "N2": 2, "E1": 1, "E2": 1, "NPL": 1.0, "NPI": 1.0, "sim_E": 2, "sim_EPlabel": 4, "Metric_score": 1.35},
+)
+SELF_LINK = (
+    topology([("R1", "router"), ("R2", "router")], [["R1", "R1", "e0", "e1"], ["R1", "R2", "e2", "e3"]]),
+    topology([("R1", "router"), ("R2", "router")], [["R1", "R1", "e0", "e1"], ["R1", "R2", "e2", "e3"]]),
+    # a self link of a node with a single pair is not a pair of pairs, only the R1 - R2 link counts
+    {"N1": 2, "N2": 2, "E1": 2, "E2": 2, "NPL": 1.0, "NPI": 1.0, "sim_E": 1, "sim_EPlabel": 2, "Metric_score": 0.775},
+)
+DUPLICATE_LABELS_SELF_LINK = (
+    topology([("R1", "router"), ("R1", "router")], [["R1", "R1", "e0", "e1"]]),
+    topology([("R1", "router"), ("R1", "router")], [["R1", "R1", "e0", "e1"]]),
+    # the 4 pairs of R1 nodes are all linked to each other through the self links, 6 pairs of pairs
+    {"N1": 2, "N2": 2, "E1": 1, "E2": 1, "NPL": 2.0, "NPI": 2.0, "sim_E": 6, "sim_EPlabel": 12, "Metric_score": 3.5},
+)
+CASE_VARIANT_LABELS = (
+    topology([("Router 1", "router"), ("PC1", "pc")], [["Router 1", "PC1", "Gi0/0", "e0"]]),
+    topology([("router1", "Router"), ("pc1", "PC")], [["pc1", "router1", "E0", "gi0/0"]]),
+    # the labels and icons match in any case, the interfaces are sorted case sensitively before they are compared
+    # ("Gi0/0" < "e0" but "E0" < "gi0/0"), so none of them match
+    {"N1": 2, "N2": 2, "E1": 1, "E2": 1, "NPL": 1.0, "NPI": 1.0, "sim_E": 1, "sim_EPlabel": 0, "Metric_score": 0.9},
+)
+CASE_VARIANT_LINK_LABELS = (
+    topology([("R1", "router"), ("PC1", "pc")], [["R1", "PC1", "e0", "e1"]]),
+    topology([("r1", "router"), ("pc1", "pc")], [["R1", "PC1", "e0", "e1"]]),
+    # the links are matched to the labels of the nodes case sensitively, so the predicted link connects no predicted nodes
+    {"N1": 2, "N2": 2, "E1": 1, "E2": 1, "NPL": 1.0, "NPI": 1.0, "sim_E": 0, "sim_EPlabel": 0, "Metric_score": 0.55},
+)
+CASES = {"duplicate_labels": DUPLICATE_LABELS, "self_link": SELF_LINK, "duplicate_labels_self_link": DUPLICATE_LABELS_SELF_LINK,
+         "case_variant_labels": CASE_VARIANT_LABELS, "case_variant_link_labels": CASE_VARIANT_LINK_LABELS}
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_notebook_results(name):
+    topology1, topology2, expected = CASES[name]
+    assert reference_comparison_metrics(topology1, topology2) == pytest.approx(expected)
+    assert get_comparison_metrics(topology1, topology2) == pytest.approx(expected)
+
+
+def test_labels_are_not_modified():
+    topology1, topology2, _ = CASE_VARIANT_LABELS
+    get_comparison_metrics(topology1, topology2)
+    assert topology1["nodes"][0]["label"] == "Router 1"
+    assert topology1["links"][0][0] == "Router 1"
+
+
+@pytest.mark.parametrize("topology2", [topology([], [["R1", "R2", "e0", "e1"]]), topology([("R1", "router")], [])])
+def test_empty_topologies_are_rejected(topology2):
+    topology1 = topology([("R1", "router"), ("R2", "router")], [["R1", "R2", "e0", "e1"]])
+    with pytest.raises(Exception):
+        get_comparison_metrics(topology1, topology2)
+    assert batch_comparison_metrics([(topology1, topology2)]) == [dict.fromkeys(METRIC_KEYS)]
+
+
+@pytest.mark.parametrize("nodes", [3, 10, 25])
+def test_synthetic_pairs_match_the_notebook(nodes):
+    for topology1, topology2 in synthetic_pairs(nodes, 5, seed=nodes, duplicate_labels=0.3):
+        assert get_comparison_metrics(topology1, topology2) == pytest.approx(reference_comparison_metrics(topology1, topology2))
@@ -0,0 +1,187 @@
+import argparse
+import json
+import logging
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# the icons of the phase 1 prompt, "" if the diagram has no icons (anything else is a hallucinated icon)
+VALID_ICONS = {"pc", "cloud", "router", "ethernet_switch", "ids", ""}
+PARTIAL_MATCH_COST = 0.5 # a node with the right label and a wrong icon, or a link between the right nodes with wrong interfaces
+DIFF_COLUMNS = ["Scenario", "Platform", "Diagram_Type", "Run", "Node_edits", "Link_edits", "Edit_distance", "Structural_Score", "Invalid_icons"]
+
+
+def normalize_bidirectional_link(link: list) -> tuple[str, ...]:
+    """
+    The canonical form of a link (as in the notebook): ["PC1", "Switch2", "e0", "e1"] and ["Switch2", "PC1", "e1", "e0"]
+    are both ("pc1", "e0", "switch2", "e1"). A malformed link (not 4 elements) is only lowercased.
+    """
+    if len(link) != 4:
+        return tuple(str(e).lower() for e in link)
+    node1, node2, intf1, intf2 = [str(e).lower() for e in link]
+    (node1, intf1), (node2, intf2) = sorted([(node1, intf1), (node2, intf2)], key=lambda endpoint: endpoint[0])
+    return node1, intf1, node2, intf2
+
+
+@dataclass
+class CanonicalTopology:
+    # the canonical nodes and links of sort_json_for_eval, as multisets (a list may repeat an item, the order does not matter)
+    nodes: list[tuple[str, str]] # (label, icon)
+    links: list[tuple[str, ...]]
+
+    @classmethod
+    def from_topology(cls, topology: dict, strip_spaces: bool = True) -> "CanonicalTopology":
+        """
+        The lowercase labels and icons, and the bidirectional links in a canonical order. The labels are stripped of spaces
+        by default, as the notebook's evaluation compared the topologies after get_comparison_metrics had stripped them.
+        """
+        def label(value) -> str:
+            value = str(value)
+            return value.replace(" ", "") if strip_spaces else value
+
+        nodes = [(label(node.get("label", "")).lower(), str(node.get("icon", "")).lower()) for node in topology["nodes"]]
+        links = [normalize_bidirectional_link([label(link[0]), label(link[1]), *link[2:]] if len(link) == 4 else link)
+                 for link in topology["links"]]
+        return cls(nodes=nodes, links=links)
+
+    def invalid_icons(self) -> int:
+        return sum(icon not in VALID_ICONS for _, icon in self.nodes)
+
+
+def node_match_key(node: tuple[str, str]) -> str:
+    return node[0]
+
+
+def link_match_key(link: tuple[str, ...]) -> tuple[str, ...]:
+    # the nodes of the link, without the interfaces
+    return (link[0], link[2]) if len(link) == 4 else link
+
+
+def load_canonical_topology(path: str, strip_spaces: bool = True) -> CanonicalTopology | None:
+    # None for a topology that can not be scored (missing file, a parsing error saved as text, or a topology without nodes or links)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return CanonicalTopology.from_topology(json.load(f), strip_spaces)
+    except (OSError, ValueError, TypeError, KeyError, IndexError, AttributeError) as e:
+        logging.warning("Can't score the topology %s: %s", path, e)
+        return None
+
+
+def _intersection_sizes(items_a: list[list], items_b: list[list], key=None) -> np.ndarray:
+    """
+    The size of the multiset intersection of items_a[i] and items_b[i] for every pair i (by the key of the items, if given),
+    computed for all of the pairs at once: the items are interned to integer codes, and the counts of every (pair, code)
+    on both sides are matched with np.unique and np.intersect1d.
+    """
+    codes: dict = {}
+    side_codes = [np.fromiter((codes.setdefault(key(item) if key is not None else item, len(codes)) for items in items_list for item in items),
+                              dtype=np.int64) for items_list in (items_a, items_b)]
+    code_count = max(len(codes), 1)
+    counted = []
+    for items_list, item_codes in zip((items_a, items_b), side_codes):
+        pair_ids = np.repeat(np.arange(len(items_list), dtype=np.int64), [len(items) for items in items_list])
+        counted.append(np.unique(pair_ids * code_count + item_codes, return_counts=True))
+    (values_a, counts_a), (values_b, counts_b) = counted
+    common, index_a, index_b = np.intersect1d(values_a, values_b, assume_unique=True, return_indices=True)
+    return np.bincount(common // code_count, weights=np.minimum(counts_a[index_a], counts_b[index_b]), minlength=len(items_a))
+
+
+def edit_distances(sizes_a: np.ndarray, sizes_b: np.ndarray, exact: np.ndarray, keyed: np.ndarray) -> np.ndarray:
+    """
+    The least edits that turn one multiset into the other: the exact matches cost nothing, the other pairs with the same key
+    (keyed - exact) are partial substitutions, every other item is substituted, inserted or deleted at a cost of 1.
+    """
+    return np.maximum(sizes_a, sizes_b) - exact - (1 - PARTIAL_MATCH_COST) * (keyed - exact)
+
+
+def batch_structural_scores(topology_pairs: list[tuple[CanonicalTopology | None, CanonicalTopology | None]]) -> pd.DataFrame:
+    """
+    The structural edit distance of every (ground truth, prediction) pair, all of the pairs at once.
+    The score is 1 - Edit_distance / (max(N1, N2) + max(E1, E2)), in [0, 1] like the notebook's DL_Score, and NaN for
+    a pair that can not be scored. It is linear in the number of nodes and links, instead of quadratic in the JSON length.
+    """
+    valid = [index for index, (topology1, topology2) in enumerate(topology_pairs) if topology1 is not None and topology2 is not None]
+    pairs = [topology_pairs[index] for index in valid]
+    nodes1, nodes2 = [pair[0].nodes for pair in pairs], [pair[1].nodes for pair in pairs]
+    links1, links2 = [pair[0].links for pair in pairs], [pair[1].links for pair in pairs]
+    n1, n2 = np.array([len(nodes) for nodes in nodes1]), np.array([len(nodes) for nodes in nodes2])
+    e1, e2 = np.array([len(links) for links in links1]), np.array([len(links) for links in links2])
+    node_edits = edit_distances(n1, n2, _intersection_sizes(nodes1, nodes2), _intersection_sizes(nodes1, nodes2, node_match_key))
+    link_edits = edit_distances(e1, e2, _intersection_sizes(links1, links2), _intersection_sizes(links1, links2, link_match_key))
+    distance = node_edits + link_edits
+    size = np.maximum(n1, n2) + np.maximum(e1, e2)
+    scores = np.where(size > 0, 1 - distance / np.maximum(size, 1), 1.0) # two empty topologies are the same
+
+    results = pd.DataFrame(np.nan, index=range(len(topology_pairs)), columns=["Node_edits", "Link_edits", "Edit_distance", "Structural_Score", "Invalid_icons"])
+    results.loc[valid, "Node_edits"] = node_edits
+    results.loc[valid, "Link_edits"] = link_edits
+    results.loc[valid, "Edit_distance"] = distance
+    results.loc[valid, "Structural_Score"] = scores
+    results.loc[valid, "Invalid_icons"] = [pair[1].invalid_icons() for pair in pairs]
+    return results
+
+
+def structural_score(topology1: dict, topology2: dict, strip_spaces: bool = True) -> dict:
+    """The structural edit distance and score of a single (ground truth, prediction) pair of topologies."""
+    pair = (CanonicalTopology.from_topology(topology1, strip_spaces), CanonicalTopology.from_topology(topology2, strip_spaces))
+    return batch_structural_scores([pair]).iloc[0].to_dict()
+
+
+def score_directory(results_dir: str, ground_truth_path, platforms: list[str], diagram_types: list[str], scenarios: list[str], run: int,
+                    strip_spaces: bool = True) -> pd.DataFrame:
+    """
+    Score the topologies of a vision results directory ({results_dir}/{platform}/{diagram_type}/{scenario}/Topology(Run{run}).json)
+    in one batch. ground_truth_path(platform, diagram_type, scenario) is the path of the ground truth of the cell.
+    """
+    cells, pairs = [], []
+    ground_truths: dict[str, CanonicalTopology | None] = {} # the ground truths are shared by several cells
+    for platform in platforms:
+        for diagram_type in diagram_types:
+            for scenario in scenarios:
+                gt_path = ground_truth_path(platform, diagram_type, scenario)
+                if gt_path not in ground_truths:
+                    ground_truths[gt_path] = load_canonical_topology(gt_path, strip_spaces)
+                prediction = load_canonical_topology(f"{results_dir}/{platform}/{diagram_type}/{scenario}/Topology(Run{run}).json", strip_spaces)
+                cells.append({"Scenario": scenario, "Platform": platform, "Diagram_Type": diagram_type, "Run": run})
+                pairs.append((ground_truths[gt_path], prediction))
+    return pd.concat([pd.DataFrame(cells), batch_structural_scores(pairs)], axis=1)[DIFF_COLUMNS]
+
+
+def notebook_ground_truth_path(ground_truth_dirs: dict[str, str]):
+    """
+    The ground truth layout of the notebook's evaluation: only four ground truths cover the 9 platform x diagram type combinations,
+    by whether the platform is PowerPoint and whether the diagram type is No_Labels_On_Edges.
+    """
+    def ground_truth_path(platform: str, diagram_type: str, scenario: str) -> str:
+        powerpoint = "powerpoint" if platform == "PowerPoint" else "default"
+        no_labels = "_no_labels" if diagram_type == "No_Labels_On_Edges" else ""
+        return f"{ground_truth_dirs[powerpoint + no_labels]}/{scenario}.json"
+    return ground_truth_path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Score the topologies of a vision results directory against the ground truth with the structural edit distance.")
+    parser.add_argument("results_dir", help="e.g. Vision_results/gpt-4.1-mini")
+    parser.add_argument("--gt-dir", required=True, help="the ground truth of GNS3 and Paper_Sketches (Normal and Messy_Layout)")
+    parser.add_argument("--gt-no-labels-dir", required=True, help="the ground truth of GNS3 and Paper_Sketches with No_Labels_On_Edges")
+    parser.add_argument("--gt-powerpoint-dir", required=True)
+    parser.add_argument("--gt-powerpoint-no-labels-dir", required=True)
+    parser.add_argument("--platforms", nargs="+", default=["GNS3", "Paper_Sketches", "PowerPoint"])
+    parser.add_argument("--diagram-types", nargs="+", default=["Messy_Layout", "No_Labels_On_Edges", "Normal"])
+    parser.add_argument("--scenarios", nargs="+", default=["Adding_Communication_Servers", "Adding_DMZ", "Adding_DRA", "Adding_Local_PCs", "Internet_Connectivity",
+                                                           "Role_Based_CLI_Access", "Time_Based_Access_List", "Transparent_IOS_Firewall", "Basic_Zone_Based_Firewall", "IP_Traffic_Export"])
+    parser.add_argument("--run", type=int, default=1)
+    args = parser.parse_args()
+    ground_truth_path = notebook_ground_truth_path({"default": args.gt_dir, "default_no_labels": args.gt_no_labels_dir,
+                                                    "powerpoint": args.gt_powerpoint_dir, "powerpoint_no_labels": args.gt_powerpoint_no_labels_dir})
+    results = score_directory(args.results_dir, ground_truth_path, args.platforms, args.diagram_types, args.scenarios, args.run)
+    csv_path = os.path.join(args.results_dir, f"phase1_Run{args.run}_structural_scores.csv")
+    results.to_csv(csv_path, index=False)
+    print(results.describe().to_string())
+    print(f"{results['Structural_Score'].isna().sum()} topologies could not be scored, the scores were written to {csv_path}")
+
+
+if __name__ == "__main__":
+    main()
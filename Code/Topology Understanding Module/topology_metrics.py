@@ -0,0 +1,152 @@
+import logging
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+# the weights of the topology similarity score (get_comparison_metrics in Topology_Understanding_Module_ReGeNet.ipynb)
+N_COE = 0.3
+NPL_COE = 0.2
+NPI_COE = 0.05
+E_COE = 0.35
+EPLABEL_COE = 0.1
+METRIC_KEYS = ["N1", "N2", "E1", "E2", "NPL", "NPI", "sim_E", "sim_EPlabel", "Metric_score"]
+
+
+def strip_label(label: str) -> str:
+    return label.replace(" ", "")
+
+
+def link_key(label1: str, label2: str) -> tuple[str, str]:
+    # a link is undirected, so its key is the same for both directions (and a self link is (label, label))
+    return (label1, label2) if label1 <= label2 else (label2, label1)
+
+
+@dataclass
+class TopologyIndex:
+    """
+    The indexes of a topology the metrics are computed from, built once in O(N + E) instead of scanning the nodes and
+    the links for every pair of nodes: the nodes by their case-insensitive label, and the first link of every node pair.
+    The labels are stripped of spaces, as the notebook does (the topology itself is not modified).
+    """
+    nodes_count: int
+    links_count: int
+    nodes_by_label: dict[str, list[tuple[str, dict]]] = field(default_factory=dict) # lowercase label -> (label, node), in the nodes order
+    links: dict[tuple[str, str], list] = field(default_factory=dict) # link_key -> the first link between the two nodes
+
+    @classmethod
+    def build(cls, topology: dict) -> "TopologyIndex":
+        index = cls(nodes_count=len(topology["nodes"]), links_count=len(topology["links"]))
+        nodes_by_label = defaultdict(list)
+        for node in topology["nodes"]:
+            label = strip_label(node["label"])
+            nodes_by_label[label.lower()].append((label, node))
+        index.nodes_by_label = dict(nodes_by_label)
+        for link in topology["links"]:
+            index.links.setdefault(link_key(strip_label(link[0]), strip_label(link[1])), link)
+        return index
+
+
+def matched_labels(index1: TopologyIndex, index2: TopologyIndex) -> dict[str, list[str]]:
+    """
+    The label pairs of sim_NPL (every pair of nodes with the same case-insensitive label), grouped by the label in the first
+    topology: label1 -> the labels of the second topology it is paired with (once per pair, so duplicate labels pair many times).
+    """
+    matches = defaultdict(list)
+    for lower_label, nodes1 in index1.nodes_by_label.items():
+        nodes2 = index2.nodes_by_label.get(lower_label)
+        if nodes2 is None:
+            continue
+        labels2 = [label2 for label2, _ in nodes2]
+        for label1, _ in nodes1:
+            matches[label1].extend(labels2)
+    return matches
+
+
+def node_similarity(index1: TopologyIndex, index2: TopologyIndex) -> tuple[int, int]:
+    """The number of node pairs with the same label (len(sim_NPL)), and of those with the same icon as well (len(sim_NPI))."""
+    sim_npl = 0
+    sim_npi = 0
+    for lower_label, nodes1 in index1.nodes_by_label.items():
+        nodes2 = index2.nodes_by_label.get(lower_label)
+        if nodes2 is None:
+            continue
+        sim_npl += len(nodes1) * len(nodes2)
+        icons2 = Counter(node["icon"].lower() for _, node in nodes2)
+        sim_npi += sum(icons2[node["icon"].lower()] for _, node in nodes1)
+    return sim_npl, sim_npi
+
+
+def interfaces_similarity(link1: list, link2: list) -> int:
+    interfaces1 = sorted([str(link1[2]), str(link1[3])])
+    interfaces2 = sorted([str(link2[2]), str(link2[3])])
+    return (interfaces1[0].lower() == interfaces2[0].lower()) + (interfaces1[1].lower() == interfaces2[1].lower())
+
+
+def edge_similarity(index1: TopologyIndex, index2: TopologyIndex, matches: dict[str, list[str]]) -> tuple[int, int]:
+    """
+    sim_E and sim_EPlabel: the pairs of sim_NPL pairs whose nodes are linked in both topologies, and the number of equal
+    interfaces of their links. Instead of checking every pair of sim_NPL pairs (O(P^2 * E)), the links of the first topology
+    are walked and only the sim_NPL pairs on both of their ends are paired, with the links of the second topology looked up
+    by their key, which is O(E + P) for topologies with unique labels.
+    """
+    sim_e = 0
+    sim_eplabel = 0
+    for (label1, other_label1), link1 in index1.links.items():
+        ends2 = matches.get(label1)
+        other_ends2 = matches.get(other_label1)
+        if not ends2 or not other_ends2:
+            continue
+        if label1 == other_label1:
+            # a self link pairs the sim_NPL pairs of the node with each other
+            end_pairs = ((ends2[i], ends2[j]) for i in range(len(ends2)) for j in range(i + 1, len(ends2)))
+        else:
+            end_pairs = ((end2, other_end2) for end2 in ends2 for other_end2 in other_ends2)
+        for end2, other_end2 in end_pairs:
+            link2 = index2.links.get(link_key(end2, other_end2))
+            if link2 is not None:
+                sim_e += 1
+                sim_eplabel += interfaces_similarity(link1, link2)
+    return sim_e, sim_eplabel
+
+
+def get_comparison_metrics(topology1: dict, topology2: dict) -> dict:
+    """
+    The similarity metrics of two topologies (the ground truth and the prediction), with the same values as the notebook's
+    get_comparison_metrics, and the same exceptions for the topologies it can not compare.
+    """
+    index1 = TopologyIndex.build(topology1)
+    index2 = TopologyIndex.build(topology2)
+    n1, n2 = index1.nodes_count, index2.nodes_count
+    if n1 == 0 or n2 == 0:
+        raise Exception("N1 or N2 is 0, Cannot divide by 0")
+    e1, e2 = index1.links_count, index2.links_count
+    if e1 == 0 or e2 == 0:
+        raise Exception("E1 or E2 is 0, Cannot divide by 0")
+
+    sim_npl, sim_npi = node_similarity(index1, index2)
+    sim_e, sim_eplabel = edge_similarity(index1, index2, matched_labels(index1, index2))
+    npl = sim_npl / max(n1, n2)
+    npi = sim_npi / max(n1, n2)
+    metric_score = N_COE * min(n1, n2) / max(n1, n2) + NPL_COE * npl + NPI_COE * npi + E_COE * sim_e / max(e1, e2) + EPLABEL_COE * sim_eplabel / (2 * max(e1, e2))
+    return {"N1": n1, "N2": n2, "E1": e1, "E2": e2, "NPL": npl, "NPI": npi, "sim_E": sim_e, "sim_EPlabel": sim_eplabel, "Metric_score": metric_score}
+
+
+def safe_comparison_metrics(topologies: tuple[dict, dict]) -> dict:
+    # a topology that can not be compared (i.e. a parsing error or a missing field) gets None metrics, as in the notebook
+    try:
+        return get_comparison_metrics(*topologies)
+    except Exception as e:
+        logging.warning("Can't compare the topologies: %s", e)
+        return dict.fromkeys(METRIC_KEYS)
+
+
+def batch_comparison_metrics(topology_pairs: list[tuple[dict, dict]], max_workers: int | None = None) -> list[dict]:
+    """
+    The metrics of many (ground truth, prediction) pairs, in the pairs order. With max_workers > 1 the pairs are scored
+    in worker processes, which pays off only with several cores and large topologies (sending a pair to a worker costs
+    about as much as scoring it, so the pairs of the experiment matrix are faster in this process).
+    """
+    if max_workers is None or max_workers <= 1:
+        return [safe_comparison_metrics(topologies) for topologies in topology_pairs]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(safe_comparison_metrics, topology_pairs, chunksize=max(1, len(topology_pairs) // (4 * max_workers))))
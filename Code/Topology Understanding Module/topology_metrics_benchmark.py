@@ -0,0 +1,152 @@
+import argparse
+import copy
+import random
+import time
+from itertools import combinations
+
+from topology_metrics import get_comparison_metrics, batch_comparison_metrics
+
+ICONS = ["pc", "cloud", "router", "ethernet_switch", "ids"]
+
+
+# ---- the notebook's metrics (Topology_Understanding_Module_ReGeNet.ipynb), the reference the indexed metrics are checked against ----
+def reference_comparison_metrics(topology1: dict, topology2: dict) -> dict:
+    topology1, topology2 = copy.deepcopy(topology1), copy.deepcopy(topology2) # the notebook strips the labels in place
+    for topology in (topology1, topology2):
+        for node in topology["nodes"]:
+            node["label"] = node["label"].replace(" ", "")
+        for link in topology["links"]:
+            link[0] = link[0].replace(" ", "")
+            link[1] = link[1].replace(" ", "")
+
+    def are_connected(node1, node2, links):
+        return {node1["label"], node2["label"]} in [{link[0], link[1]} for link in links]
+
+    def get_edge(node1, node2, links):
+        return [link for link in links if {node1["label"], node2["label"]} == {link[0], link[1]}][0]
+
+    N1, N2 = len(topology1["nodes"]), len(topology2["nodes"])
+    if N1 == 0 or N2 == 0:
+        raise Exception("N1 or N2 is 0, Cannot divide by 0")
+    E1, E2 = len(topology1["links"]), len(topology2["links"])
+    if E1 == 0 or E2 == 0:
+        raise Exception("E1 or E2 is 0, Cannot divide by 0")
+    sim_NPL = [(node1, node2) for node1 in topology1["nodes"] for node2 in topology2["nodes"] if node1["label"].lower() == node2["label"].lower()]
+    sim_NPI = [pair for pair in sim_NPL if pair[0]["icon"].lower() == pair[1]["icon"].lower()]
+    sim_E = 0
+    sim_EPlabel = 0
+    for pair1, pair2 in combinations(sim_NPL, 2):
+        if are_connected(pair1[0], pair2[0], topology1["links"]) and are_connected(pair1[1], pair2[1], topology2["links"]):
+            sim_E += 1
+            edge1 = sorted(str(interface) for interface in get_edge(pair1[0], pair2[0], topology1["links"])[2:4])
+            edge2 = sorted(str(interface) for interface in get_edge(pair1[1], pair2[1], topology2["links"])[2:4])
+            sim_EPlabel += (edge1[0].lower() == edge2[0].lower()) + (edge1[1].lower() == edge2[1].lower())
+    NPL, NPI = len(sim_NPL) / max(N1, N2), len(sim_NPI) / max(N1, N2)
+    Metric_score = 0.3 * min(N1, N2) / max(N1, N2) + 0.2 * NPL + 0.05 * NPI + 0.35 * sim_E / max(E1, E2) + 0.1 * sim_EPlabel / (2 * max(E1, E2))
+    return {"N1": N1, "N2": N2, "E1": E1, "E2": E2, "NPL": NPL, "NPI": NPI, "sim_E": sim_E, "sim_EPlabel": sim_EPlabel, "Metric_score": Metric_score}
+
+
+# ---- synthetic topologies ----
+def synthetic_topology(nodes: int, rng: random.Random, duplicate_labels: float = 0.0) -> dict:
+    """A connected topology with about 1.5 links per node, some labels repeated (as a vision model may repeat them)."""
+    labels = [f"R {i}" if rng.random() >= duplicate_labels or i == 0 else f"R {rng.randrange(i)}" for i in range(nodes)]
+    topology = {"nodes": [{"label": label, "icon": rng.choice(ICONS)} for label in labels], "links": []}
+    for i in range(1, nodes):
+        topology["links"].append([labels[i], labels[rng.randrange(i)], f"Gi0/{rng.randrange(4)}", f"Gi0/{rng.randrange(4)}"])
+    for _ in range(nodes // 2):
+        topology["links"].append([labels[rng.randrange(nodes)], labels[rng.randrange(nodes)], f"Fa0/{rng.randrange(4)}", ""])
+    return topology
+
+
+def predicted_topology(topology: dict, rng: random.Random, error_rate: float = 0.1) -> dict:
+    """A prediction of the topology with errors: missing nodes and links, other label cases, icons and interfaces, and extra links."""
+    prediction = {"nodes": [], "links": []}
+    for node in topology["nodes"]:
+        if rng.random() < error_rate:
+            continue
+        label = node["label"].lower() if rng.random() < error_rate else node["label"]
+        icon = rng.choice(ICONS) if rng.random() < error_rate else node["icon"]
+        prediction["nodes"].append({"label": label, "icon": icon})
+    labels = [node["label"] for node in prediction["nodes"]] or ["R 0"]
+    for link in topology["links"]:
+        if rng.random() < error_rate:
+            continue
+        source, destination, source_interface, destination_interface = link
+        if rng.random() < 0.5:
+            source, destination, source_interface, destination_interface = destination, source, destination_interface, source_interface
+        if rng.random() < error_rate:
+            source_interface = f"Gi0/{rng.randrange(4)}"
+        prediction["links"].append([source, destination, source_interface, destination_interface])
+    for _ in range(int(len(topology["links"]) * error_rate)):
+        prediction["links"].append([rng.choice(labels), rng.choice(labels), "", ""])
+    return prediction
+
+
+def synthetic_pairs(nodes: int, count: int, seed: int, duplicate_labels: float = 0.0) -> list[tuple[dict, dict]]:
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(count):
+        ground_truth = synthetic_topology(nodes, rng, duplicate_labels)
+        pairs.append((ground_truth, predicted_topology(ground_truth, rng)))
+    return pairs
+
+
+def check_against_reference(seed: int) -> int:
+    """Compare the indexed metrics with the notebook's on small topologies, including repeated labels and self links."""
+    checked = 0
+    for nodes in (1, 2, 3, 5, 10, 20, 40):
+        for duplicate_labels in (0.0, 0.3):
+            for ground_truth, prediction in synthetic_pairs(nodes, 10, seed + nodes, duplicate_labels):
+                try:
+                    expected = reference_comparison_metrics(ground_truth, prediction)
+                except Exception: # an empty topology, the indexed metrics must reject it as well
+                    try:
+                        get_comparison_metrics(ground_truth, prediction)
+                    except Exception:
+                        checked += 1
+                        continue
+                    raise AssertionError(f"an empty topology was compared for {nodes} nodes")
+                actual = get_comparison_metrics(ground_truth, prediction)
+                for key, value in expected.items():
+                    assert abs(actual[key] - value) < 1e-9, f"{key}: {actual[key]} != {value} for {nodes} nodes"
+                checked += 1
+    return checked
+
+
+def timed(function, *args) -> float:
+    start_time = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start_time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the indexed topology metrics against the notebook's on synthetic topologies.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100, 200, 500, 1000, 2000, 5000])
+    parser.add_argument("--pairs", type=int, default=5, help="pairs of every size")
+    parser.add_argument("--reference-max-nodes", type=int, default=200, help="the largest size the notebook's metrics are timed on")
+    parser.add_argument("--batch-pairs", type=int, default=900, help="pairs of 20 nodes scored in a batch (the size of a 9 model x 90 diagram matrix)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"checked {check_against_reference(args.seed)} pairs against the notebook's metrics")
+    print(f"{'nodes':>6} {'indexed (ms)':>13} {'notebook (ms)':>14} {'speedup':>8}")
+    for size in args.sizes:
+        pairs = synthetic_pairs(size, args.pairs, args.seed + size)
+        indexed = sum(timed(get_comparison_metrics, *pair) for pair in pairs) / len(pairs)
+        if size <= args.reference_max_nodes:
+            reference = sum(timed(reference_comparison_metrics, *pair) for pair in pairs) / len(pairs)
+            print(f"{size:>6} {indexed * 1000:>13.2f} {reference * 1000:>14.2f} {reference / indexed:>7.0f}x")
+        else:
+            print(f"{size:>6} {indexed * 1000:>13.2f} {'-':>14} {'-':>8}")
+
+    pairs = synthetic_pairs(20, args.batch_pairs, args.seed)
+    print(f"batch of {len(pairs)} pairs: {timed(batch_comparison_metrics, pairs):.3f}s in this process, "
+          f"{timed(batch_comparison_metrics, pairs, args.workers):.3f}s with {args.workers} workers")
+    large_pairs = synthetic_pairs(max(args.sizes), 4 * args.workers, args.seed)
+    print(f"batch of {len(large_pairs)} pairs of {max(args.sizes)} nodes: {timed(batch_comparison_metrics, large_pairs):.3f}s in this process, "
+          f"{timed(batch_comparison_metrics, large_pairs, args.workers):.3f}s with {args.workers} workers")
+
+
+if __name__ == "__main__":
+    main()
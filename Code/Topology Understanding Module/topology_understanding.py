@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import os
+import time
+
+import httpx
+import pandas as pd
+from dotenv import load_dotenv
+from openai import AsyncClient
+
+from image_cache import ImageCache
+from provider_dispatcher import ProviderDispatcher
+
+# the topology understanding (vision) stage of Topology_Understanding_Module_ReGeNet.ipynb as an importable module:
+# a diagram image of a cell of the matrix is turned into a topology JSON, which the implementation module reads
+OPEN_ROUTER_URL = "https://openrouter.ai/api/v1"
+PHASE1_COLUMNS = ["Scenario", "Platform", "Diagram_Type", "Phase1_Temp", "Run", "Model", "Time", "Cost",
+                  "Reasoning_Text", "Prompt_tokens", "Completion_tokens", "Error_message"]
+
+PHASE1_PROMPT = ''' As a network topology analyst, you are given an image of a network topology diagram.
+  Analyze it carefully and return **only** a single JSON object in the exact format below, without extra text.
+
+  {
+    "nodes": [
+      {
+        "label": "<NODE_NAME>", //  Avoid adding component type to the name of the component i.e. router R1 should be called "R1" rather than "Router R1"
+        "icon": "<one of: pc | cloud | router | ethernet_switch | ids>",
+        // If icons are not illustrated in the diagram, use an empty string ("") for the icon field.
+        // If the icon’s name differs, map it to the closest option above e.g. "Desktop computer symbol" → "pc".
+      }
+      // …repeat for every device in the topology (routers, firewalls, switches, PCs, etc.)
+    ],
+
+    "links": [
+      ["<source_node_label>", "<destination_node_label>", "<source_interface>", "<destination_interface>"]
+      // If interfaces are not illustrated in the diagram, use an empty string ("") for both interface fields.
+      // …repeat for every edge/connection in the topology
+    ]
+  }
+  '''
+
+# the OpenRouter path and provider of every vision model
+MODELS = {
+    "llama_4_maverick": {"path": "meta-llama/llama-4-maverick", "provider_name": "deepinfra/base"},
+    "llama-4-scout": {"path": "meta-llama/llama-4-scout", "provider_name": "lambda/fp8"},
+    "Llama_3.2_11B_Vision_Instruct": {"path": "meta-llama/llama-3.2-11b-vision-instruct", "provider_name": "deepinfra/bf16"},
+    "llama-3.2-90b-vision-instruct": {"path": "meta-llama/llama-3.2-90b-vision-instruct", "provider_name": "together/fp8"},
+    "gemini-2.5-flash": {"path": "google/gemini-2.5-flash", "provider_name": "google-vertex"},
+    "gemini_2.0_Flash": {"path": "google/gemini-2.0-flash-001", "provider_name": "google-ai-studio"},
+    "gpt-4.1-mini": {"path": "openai/gpt-4.1-mini", "provider_name": "openai"},
+    "o4-mini": {"path": "openai/o4-mini", "provider_name": "openai"},
+    "gpt-4o-mini": {"path": "openai/gpt-4o-mini", "provider_name": "openai"},
+}
+
+
+def encode_image(image_path: str) -> str:
+    with open(image_path, "rb") as image_file:
+        return base64.b64encode(image_file.read()).decode("utf-8")
+
+
+async def create_image_content(image_path: str, image_cache: ImageCache | None = None, model: str | None = None) -> dict:
+    # the diagrams are large, they are read and encoded in a worker thread to keep the event loop free,
+    # with an image cache they are preprocessed for the model once (see image_cache.py)
+    if image_cache is not None:
+        payload = await image_cache.payload(image_path, model)
+    else:
+        payload = await asyncio.to_thread(encode_image, image_path)
+    return {
+        "type": "image_url",
+        "image_url": {
+            "url": f"data:image/jpeg;base64,{payload}",
+            "detail": "high",
+        },
+    }
+
+
+def diagram_image_path(vision_dir: str, platform: str, diagram_type: str, scenario: str) -> str:
+    return f"{vision_dir}/{platform}/{diagram_type}/{scenario}/{scenario}_{platform}_{diagram_type}.jpg"
+
+
+def topology_file_path(output_dir: str, platform: str, diagram_type: str, scenario: str, run: int) -> str:
+    # the path phase4_run reads the topology of the cell from (Vision_results/{model}/...)
+    return f"{output_dir}/{platform}/{diagram_type}/{scenario}/Topology(Run{run}).json"
+
+
+async def api_call_to_prompt_model(http_client: httpx.AsyncClient, api_key: str, model_path: str, provider_name: str, conversation_history: list[dict],
+                                   temperature: float = 1.0, max_attempts: int = 3) -> tuple[dict | None, str]:
+    """
+    Send the conversation to the model through OpenRouter, only to the given provider, with up to max_attempts attempts.
+    Returns the response JSON (None if there was no successful response) and the error message ("" if there was no error).
+    """
+    error_message = ""
+    response = None
+    for attempt in range(max_attempts):
+        try:
+            response = await http_client.post(
+                f"{OPEN_ROUTER_URL}/chat/completions",
+                headers={"Authorization": f"Bearer {api_key}"},
+                json={
+                    "model": model_path,
+                    "messages": conversation_history,
+                    "provider": {"only": [provider_name]},
+                    "temperature": temperature,
+                    "response_format": {"type": "json_object"},
+                },
+            )
+            break
+        except httpx.HTTPError as e:
+            error_message = str(e)
+            await asyncio.sleep(2) # sleep a bit before retrying
+    if response is None:
+        return None, error_message
+    if response.status_code == 200:
+        return response.json(), ""
+    error_message = response.json().get("error", {}).get("message", "No specific error message provided.")
+    logging.warning("OpenRouter returned error status %s for %s: %s", response.status_code, model_path, error_message)
+    return None, error_message
+
+
+async def generation_cost(http_client: httpx.AsyncClient, api_key: str, generation_id: str, max_attempts: int = 3) -> float:
+    """The cost of a request, from the generation stats of OpenRouter (0 if they are not available yet after max_attempts)."""
+    for attempt in range(max_attempts):
+        await asyncio.sleep(1) # give the stats time to update
+        generation_response = await http_client.get(f"{OPEN_ROUTER_URL}/generation", params={"id": generation_id},
+                                                    headers={"Authorization": f"Bearer {api_key}"})
+        if generation_response.status_code == 200:
+            return generation_response.json()["data"]["total_cost"]
+    return 0
+
+
+async def prompt_model(http_client: httpx.AsyncClient, api_key: str, model_path: str, provider_name: str,
+                       conversation_history: list[dict], temperature: float = 1.0,
+                       dispatcher: ProviderDispatcher | None = None) -> tuple[str, str, dict, str, float]:
+    """Returns the response text, the reasoning text, the token usage, the error text ("" if there was no error) and the cost of the request."""
+    if dispatcher is not None:
+        http_client, api_key = dispatcher.http_client, dispatcher.api_key
+        response, request_error_message = await dispatcher.chat_completion(model_path, provider_name, conversation_history, temperature)
+    else:
+        response, request_error_message = await api_call_to_prompt_model(http_client, api_key, model_path, provider_name, conversation_history, temperature)
+    if response is not None and response.get("choices"):
+        message = response["choices"][0]["message"]
+        token_usage_counts = response.get("usage")
+        if token_usage_counts is None:
+            logging.warning("The response of %s has no token usage information", model_path)
+            token_usage_counts = {"completion_tokens": 0, "prompt_tokens": 0, "total_tokens": 0}
+        cost = await generation_cost(http_client, api_key, response["id"])
+        return message["content"], message.get("reasoning") or "", token_usage_counts, "", cost
+    # the request failed, no cost is assumed
+    try:
+        error_text = response["error"]["message"]
+    except (TypeError, KeyError):
+        error_text = request_error_message or "Error happened and failed to get official error message"
+    return "", "", {}, error_text, 0
+
+
+async def phase_1_result(topology_image_path: str, temp: float, selected_model: str, open_router: bool = True, or_model_dict: dict = MODELS, *,
+                         http_client: httpx.AsyncClient | None = None, open_router_api_key: str | None = None,
+                         openai_client: AsyncClient | None = None, dispatcher: ProviderDispatcher | None = None,
+                         image_cache: ImageCache | None = None) -> tuple:
+    """
+    Convert a topology diagram to a topology JSON with the vision model, through OpenRouter (with the dispatcher, if given)
+    or directly through OpenAI.
+    Returns the topology (the parsed JSON, or the raw text if it could not be parsed), the reasoning text, the token usage,
+    the error text, the cost and the parsing error (None if the JSON was parsed).
+    """
+    img_content = await create_image_content(topology_image_path, image_cache, selected_model)
+    conversation_history = [{"role": "user", "content": [{"type": "text", "text": PHASE1_PROMPT}, img_content]}]
+    if not open_router:
+        response = await openai_client.chat.completions.create(
+            model=selected_model,
+            messages=conversation_history,
+            temperature=temp,
+            response_format={"type": "json_object"},
+        )
+        topology = response.choices[0].message.content
+        reasoning_text, error_text, cost = "", "", None # the cost of the OpenAI requests is not tracked here
+        token_usage_counts = {"prompt_tokens": response.usage.prompt_tokens, "completion_tokens": response.usage.completion_tokens,
+                              "total_tokens": response.usage.total_tokens}
+    else:
+        model_path = or_model_dict[selected_model]["path"]
+        provider_name = or_model_dict[selected_model]["provider_name"]
+        topology, reasoning_text, token_usage_counts, error_text, cost = await prompt_model(
+            http_client, open_router_api_key, model_path, provider_name, conversation_history, temp, dispatcher)
+    e = None
+    try:
+        topology = json.loads(topology)
+    except Exception as ex:
+        e = ex
+        logging.warning("Can't parse the topology JSON of %s properly because of %s", topology_image_path, e)
+    return topology, reasoning_text, token_usage_counts, error_text, cost, e
+
+
+def write_parsing_error(output_dir: str, platform: str, diagram_type: str, scenario: str, e: Exception) -> None:
+    with open(f"{output_dir}/parsing_error_log.txt", "a", encoding="utf-8") as log_file:
+        log_file.write(f"Parsing Error occured in Scenario: {scenario}, Platform: {platform}, Diagram Type: {diagram_type}:\n")
+        log_file.write(f"{e}\n")
+        log_file.write("\n" + "=" * 60 + "\n")
+
+
+def write_topology(ans_file_path: str, answer: dict) -> None:
+    temp_path = f"{ans_file_path}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump(answer, file)
+    os.replace(temp_path, ans_file_path) # a half written topology would be taken as done by the next run
+
+
+async def understand_topology(platform: str, diagram_type: str, scenario: str, run: int, model: str, vision_dir: str, output_dir: str,
+                              temp: float = 1.0, open_router: bool = True, **clients) -> tuple[str | None, dict | None]:
+    """
+    Run the vision stage of a single cell: write the topology JSON of its diagram, unless it already exists.
+    Returns the path of the topology JSON and the result row of the cell (PHASE1_COLUMNS), None if the topology already existed.
+    The clients are the keyword arguments of phase_1_result (http_client and open_router_api_key or a dispatcher, or openai_client,
+    and an image_cache). With a dispatcher, the time of the cell includes the waits for the provider's request slots and backoffs.
+    A failed request or an answer that is not a topology JSON is not written and its path is None, so the cell runs again in the next run.
+    """
+    ans_file_path = topology_file_path(output_dir, platform, diagram_type, scenario, run)
+    if os.path.isfile(ans_file_path):
+        return ans_file_path, None
+    os.makedirs(os.path.dirname(ans_file_path), exist_ok=True)
+    start_time = time.time()
+    answer, reasoning_text, token_usage_counts, error_text, cost, e = await phase_1_result(
+        diagram_image_path(vision_dir, platform, diagram_type, scenario), temp, model, open_router, **clients)
+    time_taken = time.time() - start_time
+    if e:
+        await asyncio.to_thread(write_parsing_error, output_dir, platform, diagram_type, scenario, e)
+    error_message = error_text or (f"Can't parse the topology JSON: {e}" if e else None)
+    if error_message is None:
+        await asyncio.to_thread(write_topology, ans_file_path, answer)
+    row = {"Scenario": scenario, "Platform": platform, "Diagram_Type": diagram_type, "Phase1_Temp": temp, "Run": run, "Model": model,
+           "Time": time_taken, "Cost": cost, "Reasoning_Text": reasoning_text, "Prompt_tokens": token_usage_counts.get("prompt_tokens"),
+           "Completion_tokens": token_usage_counts.get("completion_tokens"),
+           "Error_message": error_message}
+    return (ans_file_path if error_message is None else None), row
+
+
+async def run_matrix(models: list[str], platforms: list[str], diagram_types: list[str], scenarios: list[str], run: int, vision_dir: str,
+                     output_root: str = "Vision_results", temp: float = 1.0, *, dispatcher: ProviderDispatcher, image_cache: ImageCache | None = None) -> None:
+    """
+    Understand the topology of every diagram of the matrix with every model at once (the notebook's loop, for all of the models),
+    the dispatcher bounds the requests to every provider. The rows of every model are added to its Phase1_time.csv.
+    """
+    cells = list(itertools.product(models, platforms, diagram_types, scenarios))
+
+    async def understand_cell(cell) -> dict | None:
+        model, platform, diagram_type, scenario = cell
+        try:
+            _, row = await understand_topology(platform, diagram_type, scenario, run, model, vision_dir, f"{output_root}/{model}", temp,
+                                               dispatcher=dispatcher, image_cache=image_cache)
+        except Exception as e:
+            logging.error("The topology understanding of %s failed: %s", cell, e)
+            row = {"Scenario": scenario, "Platform": platform, "Diagram_Type": diagram_type, "Phase1_Temp": temp, "Run": run, "Model": model,
+                   "Time": None, "Cost": None, "Reasoning_Text": None, "Prompt_tokens": None, "Completion_tokens": None, "Error_message": str(e)}
+        return row
+
+    rows = await asyncio.gather(*(understand_cell(cell) for cell in cells))
+    for model in models:
+        model_rows = [row for row in rows if row is not None and row["Model"] == model]
+        if not model_rows:
+            continue
+        csv_path = f"{output_root}/{model}/Phase1_time.csv"
+        phase1_df = pd.read_csv(csv_path) if os.path.isfile(csv_path) else pd.DataFrame(columns=PHASE1_COLUMNS)
+        pd.concat([phase1_df, pd.DataFrame(model_rows, columns=PHASE1_COLUMNS)], ignore_index=True).to_csv(csv_path, index=False)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Understand the topology diagrams of the experiment matrix with several vision models at once.")
+    parser.add_argument("vision_dir", help="the diagrams directory: {platform}/{diagram_type}/{scenario}/{scenario}_{platform}_{diagram_type}.jpg")
+    parser.add_argument("--models", nargs="+", default=list(MODELS), choices=list(MODELS))
+    parser.add_argument("--platforms", nargs="+", default=["Paper_Sketches", "PowerPoint", "GNS3"])
+    parser.add_argument("--diagram-types", nargs="+", default=["Normal", "Messy_Layout", "No_Labels_On_Edges"])
+    parser.add_argument("--scenarios", nargs="+", default=["Adding_Communication_Servers", "Adding_DMZ", "Adding_DRA", "Adding_Local_PCs", "Internet_Connectivity",
+                                                           "Role_Based_CLI_Access", "Time_Based_Access_List", "Transparent_IOS_Firewall", "Basic_Zone_Based_Firewall", "IP_Traffic_Export"])
+    parser.add_argument("--run", type=int, default=1)
+    parser.add_argument("--temp", type=float, default=1.0)
+    parser.add_argument("--output-root", default="Vision_results")
+    parser.add_argument("--no-image-cache", action="store_true", help="send the original diagrams, as the notebook does")
+    args = parser.parse_args()
+    load_dotenv()
+
+    async def run() -> None:
+        async with httpx.AsyncClient(timeout=httpx.Timeout(300, connect=30)) as http_client:
+            dispatcher = ProviderDispatcher(http_client, os.getenv("OPEN_ROUTER_API_KEY"), OPEN_ROUTER_URL)
+            image_cache = None if args.no_image_cache else ImageCache(f"{args.output_root}/image_cache")
+            await run_matrix(args.models, args.platforms, args.diagram_types, args.scenarios, args.run, args.vision_dir, args.output_root, args.temp,
+                             dispatcher=dispatcher, image_cache=image_cache)
+            print(dispatcher.stats.report())
+            if image_cache is not None:
+                print(image_cache.stats.report())
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()